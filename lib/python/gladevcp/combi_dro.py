@@ -24,6 +24,7 @@ import sys
 import pango
 import math
 import linuxcnc
+from hal_glib import GStat
 
 # constants
 _INCH = 0
@@ -96,7 +97,8 @@ class Combi_DRO(gtk.VBox):
         # get the necesarry connextions to linuxcnc
         self.joint_number = joint_number
         self.linuxcnc = linuxcnc
-        self.status = linuxcnc.stat()
+        self.gstat = GStat()
+        self.status = self.gstat.stat
 
         # set some default values'
         self._ORDER = ["Rel", "Abs", "DTG"]
@@ -162,8 +164,8 @@ class Combi_DRO(gtk.VBox):
 
         self.show_all()
 
-        # add the timer at a period of 100 ms
-        gobject.timeout_add(100, self._periodic)
+        # update on every poll of the shared status
+        self.gstat.connect('periodic', self._periodic)
 
         # This try is only needed because while working with glade
         # linuxcnc may not be working
@@ -320,10 +322,9 @@ class Combi_DRO(gtk.VBox):
         b = temp[8:]
         return (int(r, 16), int(g, 16), int(b, 16))
 
-    # periodic call to update the positions, every 100 ms
-    def _periodic(self):
+    # periodic call to update the positions, after every status poll
+    def _periodic(self, widget = None):
         try:
-            self.status.poll()
             main, left, right = self._position()
             if self.system != self._get_current_system():
                 self._set_labels()
@@ -19,7 +19,7 @@ import cairo
 import math
 import gtk.glade
 import time
-from collections import deque
+import numpy
 
 from hal_widgets import _HalWidgetBase, hal
 
@@ -40,6 +40,91 @@ def mround(v, m):
     if v < 0: return v - vm + m
     return 0
 
+class SampleBuffer(object):
+    """Ring buffer of timestamped samples for one or more channels.
+
+    Timestamps and values are kept in preallocated numpy arrays which are
+    overwritten in place. The capacity doubles when samples which are still
+    needed would otherwise be overwritten."""
+
+    def __init__(self, capacity=1024, channels=1):
+        self.t = numpy.zeros(capacity)
+        self.v = numpy.zeros((channels, capacity))
+        self.start = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def grow(self):
+        t, v = self.ordered()
+        capacity = 2 * len(self.t)
+        self.t = numpy.zeros(capacity)
+        self.v = numpy.zeros((len(self.v), capacity))
+        self.t[:self.count] = t
+        self.v[:, :self.count] = v
+        self.start = 0
+
+    def append(self, t, values):
+        if self.count == len(self.t):
+            self.grow()
+        i = (self.start + self.count) % len(self.t)
+        self.t[i] = t
+        self.v[:, i] = values
+        self.count += 1
+
+    def extend(self, t, values):
+        """Append len(t) samples, values has one row per channel"""
+        while self.count + len(t) > len(self.t):
+            self.grow()
+        i = numpy.arange(self.start + self.count,
+                         self.start + self.count + len(t)) % len(self.t)
+        self.t[i] = t
+        self.v[:, i] = values
+        self.count += len(t)
+
+    def drop_before(self, tmin):
+        capacity = len(self.t)
+        end = self.start + self.count
+        first = self.t[self.start:min(end, capacity)]
+        k = first.searchsorted(tmin)
+        if k == len(first) and end > capacity:
+            k += self.t[:end - capacity].searchsorted(tmin)
+        self.start = (self.start + k) % capacity
+        self.count -= k
+
+    def ordered(self):
+        """Return timestamps and values in time order"""
+        capacity = len(self.t)
+        end = self.start + self.count
+        if end <= capacity:
+            return self.t[self.start:end], self.v[:, self.start:end]
+        return (numpy.concatenate((self.t[self.start:], self.t[:end - capacity])),
+                numpy.concatenate((self.v[:, self.start:], self.v[:, :end - capacity]), axis=1))
+
+def decimate(t, v, t0, t1, width):
+    """Reduce samples in the time range t0..t1 to one (min, max) pair per
+    pixel column. NaN samples (no value) are left out, columns holding
+    only NaN samples get no pair. Returns the column numbers, minima,
+    maxima and whether the trace is interrupted by NaN samples before
+    each column."""
+    cols = numpy.floor((t - t0) * (width / (t1 - t0))).astype(int)
+    inside = (cols >= 0) & (cols < width)
+    cols = cols[inside]
+    v = v[inside]
+    missing = numpy.isnan(v)
+    # NaN samples seen up to each sample, a gap precedes a sample when
+    # the count grew since the previous valid one
+    nans = numpy.cumsum(missing)[~missing]
+    cols = cols[~missing]
+    v = v[~missing]
+    if not len(cols):
+        return cols, v, v, numpy.zeros(0, bool)
+    gap = numpy.concatenate(([False], numpy.diff(nans) > 0))
+    starts = numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(cols)) + 1))
+    return (cols[starts], numpy.minimum.reduceat(v, starts),
+            numpy.maximum.reduceat(v, starts), gap[starts])
+
 class HAL_Graph(gtk.DrawingArea, _HalWidgetBase):
     __gtype_name__ = 'HAL_Graph'
     __gproperties__ = {
@@ -78,8 +163,10 @@ class HAL_Graph(gtk.DrawingArea, _HalWidgetBase):
                 "", gobject.PARAM_READWRITE|gobject.PARAM_CONSTRUCT),
         'sublabel' : ( gobject.TYPE_STRING, 'Graph sub label', 'Sub text to display',
                 "", gobject.PARAM_READWRITE|gobject.PARAM_CONSTRUCT),
+        'ring' : ( gobject.TYPE_STRING, 'HAL ring',
+                'Sample from this HAL record ring instead of the pin. Each record holds one double per trace',
+                "", gobject.PARAM_READWRITE|gobject.PARAM_CONSTRUCT),
     }
-    __gproperties = __gproperties__
 
     def __init__(self):
         super(HAL_Graph, self).__init__()
@@ -88,8 +175,8 @@ class HAL_Graph(gtk.DrawingArea, _HalWidgetBase):
         self.fg_color = gtk.gdk.Color('red')
 
         self.force_radius = None
-        self.ticks = deque()
-        self.ticks_saved = []
+        self.ticks = SampleBuffer()
+        self.ticks_saved = None
         self.time_strings = {}
         self.tick_period = 0.1
 
@@ -100,6 +187,8 @@ class HAL_Graph(gtk.DrawingArea, _HalWidgetBase):
         self.tick = 500
         self.tick_idx = 0
         self.hal_pin = 0
+        self.hal_ring = None
+        self.ring_time = None
 
         gobject.timeout_add(self.tick, self.tick_poll, self.tick_idx)
 
@@ -110,23 +199,49 @@ class HAL_Graph(gtk.DrawingArea, _HalWidgetBase):
     def tick_poll(self, idx):
         if self.tick_idx != idx:
             return False
-        v = self.hal_pin and self.hal_pin.get()
         now = time.time()
-        for (t,_) in list(self.ticks):
-            if t >= now - self.period:
-                break
-            self.ticks.popleft()
-        self.ticks.append((now, v))
+        self.ticks.drop_before(now - self.period)
+        if self.ring:
+            self.ring_poll(now)
+        else:
+            self.ticks.append(now, self.sample())
         self.queue_draw()
         return True
 
+    def sample(self):
+        return self.hal_pin and self.hal_pin.get()
+
+    def ring_poll(self, now):
+        # records carry no timestamps, spread them evenly over the time
+        # since the last poll
+        if self.hal_ring is None:
+            try:
+                from machinekit import hal as mkhal
+                self.hal_ring = mkhal.Ring(self.ring)
+            except Exception, e:
+                print "HAL_Graph: cannot attach ring %s: %s" % (self.ring, e)
+                self.ring = ""
+                return
+            self.ring_time = now
+        data, offsets = self.hal_ring.drain()
+        n = len(offsets) - 1
+        channels = len(self.ticks.v)
+        if not n or len(data) != n * channels * 8:
+            self.ring_time = now
+            return
+        values = numpy.frombuffer(data, dtype=numpy.float64).reshape(n, channels).T
+        t = self.ring_time + (now - self.ring_time) * numpy.arange(1, n + 1) / n
+        self.ticks.extend(t, values)
+        self.ring_time = now
+
     def snapshot(self, widget, event):
         if event.button != 1:
             return
-        if self.ticks_saved:
-            self.ticks_saved = []
+        if self.ticks_saved is not None:
+            self.ticks_saved = None
         else:
-            self.ticks_saved = list(self.ticks)
+            t, v = self.ticks.ordered()
+            self.ticks_saved = (t.copy(), v.copy())
 
     def expose(self, widget, event):
         w = self.allocation.width
@@ -167,8 +282,10 @@ class HAL_Graph(gtk.DrawingArea, _HalWidgetBase):
 
         #tw = self.tick_period * w / self.period
         tnow = now = time.time()
-        if self.ticks_saved:
-            now = max(map(lambda x: x[0], self.ticks_saved))
+        samples = self.ticks.ordered()
+        saved = self.ticks_saved
+        if saved is not None and len(saved[0]):
+            now = saved[0][-1]
 
         cr.set_source_rgb(0, 0, 0)
 
@@ -185,9 +302,12 @@ class HAL_Graph(gtk.DrawingArea, _HalWidgetBase):
         ymin, ymax = self.min, self.max
         yticks = self.yticks
         if self.autoscale:
-            tv = map(lambda x: x[1], self.ticks_saved + list(self.ticks))
-            if tv:
-                ymin, ymax = min(tv), max(tv)
+            tv = samples[1]
+            if saved is not None:
+                tv = numpy.concatenate((tv, saved[1]), axis=1)
+            tv = tv[~numpy.isnan(tv)]
+            if len(tv):
+                ymin, ymax = tv.min(), tv.max()
                 ymin -= abs(ymin) * 0.1
                 ymax += abs(ymax) * 0.1
             else:
@@ -211,13 +331,12 @@ class HAL_Graph(gtk.DrawingArea, _HalWidgetBase):
         cr.set_font_size(font_small)
         self.text_at(cr, self.sublabel, w/2, 2.5 * font_large, yalign='top')
 
-        cr.set_source_color(self.fg_color)
-
-        if self.ticks_saved:
-            self.draw_graph(cr, w, h, ymin, ymax, self.ticks_saved, t2x)
-            cr.set_source_rgba(*(gdk_color_tuple(self.fg_color) + (0.3,)))
-
-        self.draw_graph(cr, w, h, ymin, ymax, self.ticks, lambda t: t2x(t, tnow))
+        for i, color in enumerate(self.trace_colors()):
+            cr.set_source_color(color)
+            if saved is not None:
+                self.draw_graph(cr, w, h, ymin, ymax, saved[0], saved[1][i], now)
+                cr.set_source_rgba(*(gdk_color_tuple(color) + (0.3,)))
+            self.draw_graph(cr, w, h, ymin, ymax, samples[0], samples[1][i], tnow)
 
         if not (self.flags() & gtk.PARENT_SENSITIVE):
             cr.set_source_rgba(0, 0, 0, 0.3)
@@ -242,22 +361,28 @@ class HAL_Graph(gtk.DrawingArea, _HalWidgetBase):
         cr.move_to(x, y)
         cr.show_text(text)
 
-    def draw_graph(self, cr, w, h, ymin, ymax, ticks, t2x):
-        move = True
-        for (t, v) in ticks:
-            if v is None:
-                move = True
-                continue
-            v = min(max(v, ymin), ymax)
-            x = t2x(t)
-            if x is None:
-                move = True
-                continue
-            y = h * (1 - (v - ymin)/(ymax - ymin))
-            if move:
-                cr.move_to(x, y)
-                move = False
-            cr.line_to(x, y)
+    def trace_colors(self):
+        return [self.fg_color]
+
+    def draw_graph(self, cr, w, h, ymin, ymax, t, v, now):
+        # at most one vertical min/max stroke per pixel column, so the
+        # cost does not depend on the number of samples
+        width = max(int(w), 1)
+        cols, vmin, vmax, gaps = decimate(t, v, now - self.period, now, width)
+        if not len(cols):
+            return
+        xs = (cols + 0.5) * (w / float(width))
+        ytop = h * (1 - (numpy.clip(vmax, ymin, ymax) - ymin) / (ymax - ymin))
+        ybottom = h * (1 - (numpy.clip(vmin, ymin, ymax) - ymin) / (ymax - ymin))
+        cr.move_to(xs[0], ytop[0])
+        for x, y0, y1, gap in zip(xs.tolist(), ytop.tolist(), ybottom.tolist(),
+                                  gaps.tolist()):
+            # no line across samples without a value
+            if gap:
+                cr.move_to(x, y0)
+            cr.line_to(x, y0)
+            if y1 != y0:
+                cr.line_to(x, y1)
         cr.stroke()
 
     def draw_xticks(self, cr, w, h, xticks, now, t2x):
@@ -312,7 +437,7 @@ class HAL_Graph(gtk.DrawingArea, _HalWidgetBase):
 
     def do_get_property(self, property):
         name = property.name.replace('-', '_')
-        if name in self.__gproperties.keys():
+        if name in self.__gproperties__:
             return getattr(self, name)
         else:
             raise AttributeError('unknown property %s' % property.name)
@@ -323,11 +448,13 @@ class HAL_Graph(gtk.DrawingArea, _HalWidgetBase):
         if name == 'tick':
             self.tick_idx += 1
             gobject.timeout_add(value, self.tick_poll, self.tick_idx)
+        if name == 'ring':
+            self.hal_ring = None
         if name in ['bg_color', 'fg_color']:
             if not value:
                 return False
 
-        if name in self.__gproperties.keys():
+        if name in self.__gproperties__:
             setattr(self, name, value)
             self.queue_draw()
         else:
@@ -340,3 +467,49 @@ class HAL_Graph(gtk.DrawingArea, _HalWidgetBase):
         self.queue_draw()
         return True
 
+class HAL_MultiGraph(HAL_Graph):
+    """Graph of several float pins sharing one time base and timer.
+
+    The pins are named <name>.0 .. <name>.<traces-1>, all traces are
+    sampled at the same time and drawn in one expose pass."""
+    __gtype_name__ = 'HAL_MultiGraph'
+    __gproperties__ = dict(HAL_Graph.__gproperties__)
+    __gproperties__.update({
+        'traces' : ( gobject.TYPE_INT, 'Traces', 'Number of traces (pins)',
+                    1, 16, 2, gobject.PARAM_READWRITE | gobject.PARAM_CONSTRUCT),
+        'colors' : ( gobject.TYPE_STRING, 'Trace colors', 'Comma separated trace colors',
+                "red,blue,green,magenta,cyan,orange,brown,black",
+                gobject.PARAM_READWRITE|gobject.PARAM_CONSTRUCT),
+    })
+
+    def __init__(self):
+        super(HAL_MultiGraph, self).__init__()
+        self.hal_pins = []
+        self.ticks = SampleBuffer(channels=self.traces)
+
+    def _hal_init(self):
+        _HalWidgetBase._hal_init(self)
+        self.hal_pins = [self.hal.newpin("%s.%d" % (self.hal_name, i), hal.HAL_FLOAT, hal.HAL_IN)
+                         for i in range(self.traces)]
+
+    def sample(self):
+        if not getattr(self, 'hal_pins', None):
+            return 0
+        return [p.get() for p in self.hal_pins]
+
+    def trace_colors(self):
+        names = [c.strip() for c in self.colors.split(',') if c.strip()] or ['red']
+        colors = []
+        for i in range(self.traces):
+            try:
+                colors.append(gtk.gdk.Color(names[i % len(names)]))
+            except ValueError:
+                colors.append(self.fg_color)
+        return colors
+
+    def do_set_property(self, property, value):
+        name = property.name.replace('-', '_')
+        if name == 'traces' and value != getattr(self, 'traces', None):
+            self.ticks = SampleBuffer(channels=value)
+            self.ticks_saved = None
+        return HAL_Graph.do_set_property(self, property, value)
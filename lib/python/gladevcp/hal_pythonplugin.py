@@ -25,7 +25,7 @@ from offsetpage_widget import OffsetPage
 from hal_bar import HAL_HBar, HAL_VBar
 from hal_meter import HAL_Meter
 from hal_gremlin import HAL_Gremlin
-from hal_graph import HAL_Graph
+from hal_graph import HAL_Graph, HAL_MultiGraph
 from hal_lightbutton import HAL_LightButton
 from overridewidget import Override
 
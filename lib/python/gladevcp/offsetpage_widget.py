@@ -21,7 +21,7 @@
 # set the var file to search
 # set the text formatting for metric/imperial separately
 
-import sys, os, pango, linuxcnc
+import sys, os, time, pango, linuxcnc
 from hal_glib import GStat
 datadir = os.path.abspath(os.path.dirname(__file__))
 AXISLIST = ['offset', 'X', 'Y', 'Z', 'A', 'B', 'C', 'U', 'V', 'W', 'name']
@@ -81,7 +81,7 @@ class OffsetPage(gtk.VBox):
         self.gstat = GStat()
         self.filename = filename
         self.linuxcnc = linuxcnc
-        self.status = linuxcnc.stat()
+        self.status = self.gstat.stat
         self.cmd = linuxcnc.command()
         self.hash_check = None
         self.display_units_mm = 0 # imperial
@@ -150,8 +150,10 @@ class OffsetPage(gtk.VBox):
             self.machine_units_mm = 0
             self.conversion = [25.4] * 3 + [1] * 3 + [25.4] * 3
 
-        # check linuxcnc status every half second
-        gobject.timeout_add(500, self.periodic_check)
+        # check linuxcnc status after every poll of the shared status,
+        # the offsets are read back every half second
+        self.last_reload = 0
+        self.gstat.connect('periodic', self.periodic_check)
 
     # Reload the offsets into display
     def reload_offsets(self):
@@ -413,10 +415,9 @@ class OffsetPage(gtk.VBox):
 
     # check for linnuxcnc ON and IDLE which is the only safe time to edit the tool file.
     # if in editing mode don't update else you can't actually edit
-    def periodic_check(self):
+    def periodic_check(self, widget = None):
         convert = ("None", "G54", "G55", "G56", "G57", "G58", "G59", "G59.1", "G59.2", "G59.3")
         try:
-            self.status.poll()
             on = self.status.task_state > linuxcnc.STATE_OFF
             idle = self.status.interp_state == linuxcnc.INTERP_IDLE
             self.edit_button.set_sensitive(bool(on and idle))
@@ -430,7 +431,9 @@ class OffsetPage(gtk.VBox):
             self.current_system = "G54"
             lncnc_running = False
 
-        if self.filename and not self.editing_mode:
+        now = time.time()
+        if self.filename and not self.editing_mode and now - self.last_reload >= .5:
+            self.last_reload = now
             self.reload_offsets()
         return True
 
@@ -13,7 +13,7 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU General Public License for more details.
 
-import sys, os, pango, linuxcnc, hashlib
+import sys, os, time, pango, linuxcnc, hashlib
 datadir = os.path.abspath(os.path.dirname(__file__))
 KEYWORDS = ['','T', 'P', 'X', 'Y', 'Z', 'A', 'B', 'C', 'U', 'V', 'W', 'D', 'I', 'J', 'Q', ';']
 try:
@@ -21,6 +21,7 @@ try:
 except:
     print('GTK not available')
     sys.exit(1)
+from hal_glib import GStat
 
 # localization
 import locale
@@ -40,7 +41,8 @@ class ToolEdit(gtk.VBox):
 
     def __init__(self,toolfile=None, *a, **kw):
         super(ToolEdit, self).__init__()
-        self.emcstat = linuxcnc.stat()
+        self.gstat = GStat()
+        self.emcstat = self.gstat.stat
         self.hash_check = None 
         self.toolfile = toolfile
         self.num_of_col = 1
@@ -86,8 +88,10 @@ class ToolEdit(gtk.VBox):
         # If the toolfile was specified when tooledit was created load it
         if toolfile:
             self.reload(None)
-        # check linuxcnc status every second
-        gobject.timeout_add(1000, self.periodic_check)
+        # check linuxcnc status after every poll of the shared status,
+        # the tool file every second
+        self.last_file_check = 0
+        self.gstat.connect('periodic', self.periodic_check)
 
         # delete the selected tools
     def delete(self,widget):
@@ -272,15 +276,16 @@ class ToolEdit(gtk.VBox):
 
         # check for linnuxcnc ON and IDLE which is the only safe time to edit the tool file.
         # check to see if the tool file is current
-    def periodic_check(self):
+    def periodic_check(self, widget = None):
         try:
-            self.emcstat.poll()
             on = self.emcstat.task_state > linuxcnc.STATE_OFF
             idle = self.emcstat.interp_state == linuxcnc.INTERP_IDLE
             self.apply.set_sensitive(bool(on and idle))
         except:
             pass
-        if self.toolfile:
+        now = time.time()
+        if self.toolfile and now - self.last_file_check >= 1:
+            self.last_file_check = now
             self.file_current_check()
         return True
 
@@ -6,6 +6,7 @@ import linuxcnc
 import sys
 import os
 import time
+import array
 import zmq
 import uuid
 
@@ -20,21 +21,120 @@ import avahi
 from machinetalk.protobuf.message_pb2 import Container
 from machinetalk.protobuf.types_pb2 import *
 
+class GPinWatch:
+    """Change detection for the GPins of one rate class.
+
+    The values of all pins are read into one snapshot array of 8 byte
+    slots and compared with the previous values in a single
+    hal.diff_items() call, only the pins whose value changed emit
+    'value-changed'.  Newly watched pins emit once on their first tick."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.pins = []
+        self.timer = None
+        self.watched = []
+        self.items = None
+        self.fresh = []
+        self.snapshot = array.array('d')
+
+    def add(self, pin):
+        self.pins.append(pin)
+        self.items = None
+
+    def remove(self, pin):
+        self.pins.remove(pin)
+        self.items = None
+
+    def rebuild(self):
+        # keep the raw snapshot slots of pins already watched, the slots
+        # of new pins are filled in by the next diff
+        raw = self.snapshot.tostring()
+        prev = dict((p, raw[8*i:8*i+8]) for i, p in enumerate(self.watched))
+        empty = '\0' * 8
+        self.watched = list(self.pins)
+        self.items = [self._unwrap(p) for p in self.watched]
+        self.fresh = [i for i, p in enumerate(self.watched) if p not in prev]
+        self.snapshot = array.array('d')
+        self.snapshot.fromstring(''.join(prev.get(p, empty) for p in self.watched))
+
+    @staticmethod
+    def _unwrap(pin):
+        # a GPin built from a hal.Pin wraps the wrapper, not the _hal.item
+        item = pin._item
+        while not isinstance(item, _hal.item):
+            item = item._item
+        return item
+
+    def start(self):
+        if self.timer is None:
+            self.timer = gobject.timeout_add(self.interval, self.update)
+
+    def stop(self):
+        if self.timer is not None:
+            gobject.source_remove(self.timer)
+            self.timer = None
+
+    def update(self):
+        if self.items is None:
+            self.rebuild()
+        try:
+            changed = hal.diff_items(self.items, self.snapshot)
+        except:
+            self.remove_broken()
+            return True
+        if self.fresh:
+            changed = sorted(set(changed).union(self.fresh))
+            self.fresh = []
+        watched = self.watched
+        for i in changed:
+            watched[i].emit('value-changed')
+        return True
+
+    def remove_broken(self):
+        for p in list(self.pins):
+            try:
+                p.get()
+            except:
+                print "Error updating pin %s; Removing" % p
+                self.remove(p)
+                GPin.REGISTRY.remove(p)
+
+
 class GPin(gobject.GObject, hal.Pin):
     __gtype_name__ = 'GPin'
     __gsignals__ = {'value-changed': (gobject.SIGNAL_RUN_FIRST, gobject.TYPE_NONE, ())}
 
     REGISTRY = []
     UPDATE = False
+    # update interval in ms of the rate classes
+    RATES = {'fast': 50, 'normal': 100, 'slow': 500}
+    WATCHES = {}
 
     def __init__(self, *a, **kw):
         gobject.GObject.__init__(self)
         hal.Pin.__init__(self, *a, **kw)
         self._item_wrap(self._item)
         self._prev = None
+        self.rate = None
         self.REGISTRY.append(self)
+        self.set_rate('normal')
         self.update_start()
 
+    def set_rate(self, rate):
+        """Move the pin to the rate class 'fast', 'normal' or 'slow'"""
+        if rate == self.rate:
+            return
+        if self.rate is not None:
+            self.WATCHES[self.rate].remove(self)
+        watch = self.WATCHES.get(rate)
+        if watch is None:
+            watch = self.WATCHES[rate] = GPinWatch(self.RATES[rate])
+            if GPin.UPDATE:
+                watch.start()
+        watch.add(self)
+        self.rate = rate
+
     def update(self):
         tmp = self.get()
         if tmp != self._prev:
@@ -45,27 +145,31 @@ class GPin(gobject.GObject, hal.Pin):
     def update_all(self):
         if not self.UPDATE:
             return
-        kill = []
-        for p in self.REGISTRY:
-            try:
-                p.update()
-            except:
-                kill.append(p)
-                print "Error updating pin %s; Removing" % p
-        for p in kill:
-            self.REGISTRY.remove(p)
+        for watch in self.WATCHES.values():
+            watch.update()
         return self.UPDATE
 
     @classmethod
-    def update_start(self, timeout=100):
+    def update_start(self, timeout=None):
+        if timeout is not None:
+            GPin.RATES['normal'] = timeout
+            watch = GPin.WATCHES.get('normal')
+            if watch is not None and watch.interval != timeout:
+                watch.interval = timeout
+                if watch.timer is not None:
+                    watch.stop()
+                    watch.start()
         if GPin.UPDATE:
             return
         GPin.UPDATE = True
-        gobject.timeout_add(timeout, self.update_all)
+        for watch in GPin.WATCHES.values():
+            watch.start()
 
     @classmethod
     def update_stop(self, timeout=100):
         GPin.UPDATE = False
+        for watch in GPin.WATCHES.values():
+            watch.stop()
 
 class GComponent:
     def __init__(self, comp):
@@ -612,8 +716,61 @@ class _GStat(gobject.GObject):
         'reload-display': (gobject.SIGNAL_RUN_FIRST, gobject.TYPE_NONE, ()),
         'line-changed': (gobject.SIGNAL_RUN_FIRST, gobject.TYPE_NONE, (gobject.TYPE_INT,)),
         'tool-in-spindle-changed': (gobject.SIGNAL_RUN_FIRST, gobject.TYPE_NONE, (gobject.TYPE_INT,)),
+
+        # emitted after every poll, GStat().stat holds the fresh status
+        'periodic': (gobject.SIGNAL_RUN_FIRST, gobject.TYPE_NONE, ()),
+
+        # field signals, see FIELDS
+        'position-changed': (gobject.SIGNAL_RUN_FIRST, gobject.TYPE_NONE, (gobject.TYPE_PYOBJECT,)),
+        'actual-position-changed': (gobject.SIGNAL_RUN_FIRST, gobject.TYPE_NONE, (gobject.TYPE_PYOBJECT,)),
+        'joint-position-changed': (gobject.SIGNAL_RUN_FIRST, gobject.TYPE_NONE, (gobject.TYPE_PYOBJECT,)),
+        'dtg-changed': (gobject.SIGNAL_RUN_FIRST, gobject.TYPE_NONE, (gobject.TYPE_PYOBJECT,)),
+        'g5x-index-changed': (gobject.SIGNAL_RUN_FIRST, gobject.TYPE_NONE, (gobject.TYPE_INT,)),
+        'g5x-offset-changed': (gobject.SIGNAL_RUN_FIRST, gobject.TYPE_NONE, (gobject.TYPE_PYOBJECT,)),
+        'g92-offset-changed': (gobject.SIGNAL_RUN_FIRST, gobject.TYPE_NONE, (gobject.TYPE_PYOBJECT,)),
+        'tool-offset-changed': (gobject.SIGNAL_RUN_FIRST, gobject.TYPE_NONE, (gobject.TYPE_PYOBJECT,)),
+        'rotation-xy-changed': (gobject.SIGNAL_RUN_FIRST, gobject.TYPE_NONE, (gobject.TYPE_FLOAT,)),
+        'gcodes-changed': (gobject.SIGNAL_RUN_FIRST, gobject.TYPE_NONE, (gobject.TYPE_PYOBJECT,)),
+        'mcodes-changed': (gobject.SIGNAL_RUN_FIRST, gobject.TYPE_NONE, (gobject.TYPE_PYOBJECT,)),
+        'settings-changed': (gobject.SIGNAL_RUN_FIRST, gobject.TYPE_NONE, (gobject.TYPE_PYOBJECT,)),
+        'program-units-changed': (gobject.SIGNAL_RUN_FIRST, gobject.TYPE_NONE, (gobject.TYPE_INT,)),
+        'current-velocity-changed': (gobject.SIGNAL_RUN_FIRST, gobject.TYPE_NONE, (gobject.TYPE_FLOAT,)),
+        'feed-override-changed': (gobject.SIGNAL_RUN_FIRST, gobject.TYPE_NONE, (gobject.TYPE_FLOAT,)),
+        'rapid-override-changed': (gobject.SIGNAL_RUN_FIRST, gobject.TYPE_NONE, (gobject.TYPE_FLOAT,)),
+        'spindle-override-changed': (gobject.SIGNAL_RUN_FIRST, gobject.TYPE_NONE, (gobject.TYPE_FLOAT,)),
+        'spindle-speed-changed': (gobject.SIGNAL_RUN_FIRST, gobject.TYPE_NONE, (gobject.TYPE_FLOAT,)),
+        'spindle-direction-changed': (gobject.SIGNAL_RUN_FIRST, gobject.TYPE_NONE, (gobject.TYPE_INT,)),
+        'spindle-enabled-changed': (gobject.SIGNAL_RUN_FIRST, gobject.TYPE_NONE, (gobject.TYPE_BOOLEAN,)),
+        'flood-changed': (gobject.SIGNAL_RUN_FIRST, gobject.TYPE_NONE, (gobject.TYPE_BOOLEAN,)),
+        'mist-changed': (gobject.SIGNAL_RUN_FIRST, gobject.TYPE_NONE, (gobject.TYPE_BOOLEAN,)),
         }
 
+    # field signal -> stat attribute. A field is only compared while a
+    # handler is connected to its signal.
+    FIELDS = { 'position-changed':          'position'
+             , 'actual-position-changed':   'actual_position'
+             , 'joint-position-changed':    'joint_actual_position'
+             , 'dtg-changed':               'dtg'
+             , 'g5x-index-changed':         'g5x_index'
+             , 'g5x-offset-changed':        'g5x_offset'
+             , 'g92-offset-changed':        'g92_offset'
+             , 'tool-offset-changed':       'tool_offset'
+             , 'rotation-xy-changed':       'rotation_xy'
+             , 'gcodes-changed':            'gcodes'
+             , 'mcodes-changed':            'mcodes'
+             , 'settings-changed':          'settings'
+             , 'program-units-changed':     'program_units'
+             , 'current-velocity-changed':  'current_vel'
+             , 'feed-override-changed':     'feedrate'
+             , 'rapid-override-changed':    'rapidrate'
+             , 'spindle-override-changed':  'spindlerate'
+             , 'spindle-speed-changed':     'spindle_speed'
+             , 'spindle-direction-changed': 'spindle_direction'
+             , 'spindle-enabled-changed':   'spindle_enabled'
+             , 'flood-changed':             'flood'
+             , 'mist-changed':              'mist'
+             }
+
     STATES = { linuxcnc.STATE_ESTOP:       'state-estop'
              , linuxcnc.STATE_ESTOP_RESET: 'state-estop-reset'
              , linuxcnc.STATE_ON:          'state-on'
@@ -631,16 +788,32 @@ class _GStat(gobject.GObject):
              , linuxcnc.INTERP_IDLE: 'interp-idle'
              }
 
-    def __init__(self, stat = None):
+    def __init__(self, stat = None, interval = 100):
         gobject.GObject.__init__(self)
         self.stat = stat or linuxcnc.stat()
         self.old = {}
+        self.fields = {}
         try:
             self.stat.poll()
             self.merge()
         except:
             pass
-        gobject.timeout_add(100, self.update)
+        self.interval = interval
+        self.timer = gobject.timeout_add(interval, self.update)
+
+    def set_interval(self, interval):
+        """Change the poll interval in ms"""
+        if interval == self.interval:
+            return
+        gobject.source_remove(self.timer)
+        self.interval = interval
+        self.timer = gobject.timeout_add(interval, self.update)
+
+    def connect(self, signal, *args):
+        # subscribing to a field signal enables its comparison
+        if signal in self.FIELDS and signal not in self.fields:
+            self.fields[signal] = None
+        return gobject.GObject.connect(self, signal, *args)
 
     def merge(self):
         self.old['state'] = self.stat.task_state
@@ -731,11 +904,29 @@ class _GStat(gobject.GObject):
             else:
                 self.emit('not-all-homed',unhomed)
 
+        for signal, old_value in self.fields.items():
+            value = getattr(self.stat, self.FIELDS[signal])
+            if value != old_value:
+                self.fields[signal] = value
+                self.emit(signal, value)
+
+        self.emit('periodic')
         return True
 
 class GStat(_GStat):
+    """Process wide status hub: all users share one linuxcnc.stat which
+    is polled once per tick. Read GStat().stat from a 'periodic' handler
+    instead of polling a private stat object."""
     _instance = None
+    _initialized = False
     def __new__(cls, *args, **kwargs):
         if not cls._instance:
             cls._instance = _GStat.__new__(cls, *args, **kwargs)
         return cls._instance
+
+    def __init__(self, *args, **kwargs):
+        # __init__ runs on every GStat() call, only start polling once
+        if self._initialized:
+            return
+        self._initialized = True
+        _GStat.__init__(self, *args, **kwargs)
@@ -14,7 +14,7 @@
 #    along with this program; if not, write to the Free Software
 #    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
-import struct, fcntl, array, os, select, glob, fnmatch, time, re
+import struct, fcntl, array, os, select, glob, fnmatch, time, re, errno, io
 
 size_shift = 16
 def SZ(a,b): return a | (b<<size_shift)
@@ -110,12 +110,21 @@ class Event:
     format = "llHHi"
     size = struct.calcsize(format)
 
-    def __init__(self, buf):
-	data = struct.unpack(self.format, buf)
-	self.time = data[0] + data[1] * 1e-9
-	self.type = EV_invert[data[2]]
-	self.code = data[3]
-	self.value = data[4]
+    def __init__(self, buf=None):
+	if buf is not None:
+	    self.set(*struct.unpack(self.format, buf))
+
+    def set(self, sec, usec, type, code, value):
+	self.time = sec + usec * 1e-6
+	self.type = EV_invert.get(type, type)
+	self.code = code
+	self.value = value
+
+    @classmethod
+    def from_tuple(cls, data):
+	e = cls()
+	e.set(*data)
+	return e
 
     @classmethod
     def read(cls, f):
@@ -148,6 +157,8 @@ class Event:
 	if isinstance(code, int): code = "%04x" % code
 	return "<Event %s %s %8d>" % (self.type, code, self.value)
 
+event_struct = struct.Struct(Event.format)
+
 EV = {
 	'EV_SYN': 0x00,
 	'EV_KEY': 0x01,
@@ -770,7 +781,35 @@ def humanize(s):
         return ss
     return map(maybe_int, s)
 
-def find(pattern):
+def matches(f, pattern):
+    name = get_name(f)
+    if name.find(pattern) != -1 or fnmatch.fnmatch(name, pattern):
+	return True
+
+    try:
+	phys = get_phys(f)
+    except IOError:
+	pass
+    else:
+	if phys.find(pattern) != -1 or fnmatch.fnmatch(phys, pattern):
+	    return True
+
+    id = InputId.get(f)
+    sid = "Bus=%s Vendor=%04x Product=%04x Version=%04x" % (\
+	id.bustype, id.vendor, id.product, id.version)
+    if sid.find(pattern) != -1 or fnmatch.fnmatch(sid, pattern):
+	return True
+
+    sid = "%04x:%04x" % (id.vendor, id.product)
+    return sid.find(pattern) != -1 or fnmatch.fnmatch(sid, pattern)
+
+def find(pattern, exclude=()):
+    """Open the input device matching pattern.
+
+    exclude holds the st_rdev of devices which are already open.  They
+    are never returned, and each of them takes the place of one device
+    in front of the ":idx" requested, so a device that is replugged next
+    to identical ones still held open is found again."""
     if ":" in pattern:
         pattern, idx = pattern.rsplit(":", 1)
         idx = int(idx)
@@ -782,6 +821,8 @@ def find(pattern):
     candidates = glob.glob("/dev/input/event*")
     candidates.sort(key=humanize)
     successful_opens = 0
+    found = []
+    excluded = 0
     for c in candidates:
 	try:
 	    f = os.open(c, os.O_RDWR)
@@ -789,45 +830,19 @@ def find(pattern):
 	    continue
         successful_opens += 1
 
-	name = get_name(f)
-	if name.find(pattern) != -1 or fnmatch.fnmatch(name, pattern):
-            if idx == 0:
-                return f
-            else:
-                idx -= 1
-                continue
-
-        try:
-            phys = get_phys(f)
-        except IOError:
-            pass
-        else:
-            if phys.find(pattern) != -1 or fnmatch.fnmatch(phys, pattern):
-                if idx == 0:
-                    return f
-                else:
-                    idx -= 1
-                    continue
-
-	id = InputId.get(f)
-	sid = "Bus=%s Vendor=%04x Product=%04x Version=%04x" % (\
-	    id.bustype, id.vendor, id.product, id.version)
-	if sid.find(pattern) != -1 or fnmatch.fnmatch(sid, pattern):
-            if idx == 0:
-                return f
-            else:
-                idx -= 1
-                continue
-
-	sid = "%04x:%04x" % (id.vendor, id.product)
-	if sid.find(pattern) != -1 or fnmatch.fnmatch(sid, pattern):
-            if idx == 0:
-                return f
-            else:
-                idx -= 1
-                continue
-
-	os.close(f)
+	if not matches(f, pattern):
+	    os.close(f)
+	elif os.fstat(f).st_rdev in exclude:
+	    excluded += 1
+	    os.close(f)
+	else:
+	    found.append(f)
+
+    idx = max(idx - excluded, 0)
+    for i, f in enumerate(found):
+	if i != idx: os.close(f)
+    if idx < len(found):
+	return found[idx]
     if not successful_opens:
         raise LookupError, """\
 No input devices could be opened.  This usually indicates a misconfigured
@@ -842,19 +857,49 @@ def decode(map, mapname, code):
     if code in map: return map[code]
     return "%s_%s" % (mapname, code)
 
+def encode(type, code):
+    """Return the numeric value of a code name as returned by get_bits"""
+    if not isinstance(code, str): return code
+    if type == 'EV_KEY': return KEY.get(code, BTN.get(code))
+    if type == 'EV_ABS': return ABS[code]
+    if type == 'EV_REL': return REL[code]
+    if type == 'EV_LED': return LED[code]
+    raise ValueError, "encode: unexpected map %s" % type
+
+def decode_event(e):
+    if e.type == 'EV_KEY': e.code = decode(KEYBTN_invert, 'KEY', e.code)
+    elif e.type == 'EV_ABS': e.code = decode(ABS_invert, 'ABS', e.code)
+    elif e.type == 'EV_REL': e.code = decode(REL_invert, 'REL', e.code)
+    elif e.type == 'EV_LED': e.code = decode(LED_invert, 'LED', e.code)
+    return e
+
 class InputDevice:
     def __init__(self, pattern):
 	if pattern.startswith("+"):
-	    exclusive = 1
+	    self.exclusive = 1
 	    pattern = pattern[1:]
 	else:
-	    exclusive = 0
+	    self.exclusive = 0
+
+	self.pattern = pattern
+	self.f = None
+	self.open()
 
-	self.f = find(pattern)
+    def open(self, exclude=()):
+	self.f = find(self.pattern, exclude)
 
-	if exclusive:
+	if self.exclusive:
 	    fcntl.ioctl(self.f, EVIOCGRAB, 1)
-    	
+
+    def close(self):
+	if self.f is not None:
+	    try:
+		os.close(self.f)
+	    except OSError:
+		pass
+	    self.f = None
+
+    def connected(self): return self.f is not None
     def fileno(self): return self.f
     def readable(self):
 	r, w, x = select.select([self.f], [], [], 0)
@@ -863,12 +908,161 @@ class InputDevice:
     def get_bits(self, arg): return get_bits(self.f, arg)
     def get_absinfo(self, arg): return AbsInfo.get(self.f, arg)
     def read_event(self):
-	e = Event.read(self.f)
-	if e.type == 'EV_KEY': e.code = decode(KEYBTN_invert, 'KEY', e.code)
-	elif e.type == 'EV_ABS': e.code = decode(ABS_invert, 'ABS', e.code)
-	elif e.type == 'EV_REL': e.code = decode(REL_invert, 'REL', e.code)
-	elif e.type == 'EV_LED': e.code = decode(LED_invert, 'LED', e.code)
-	return e
+	return decode_event(Event.read(self.f))
+
+    def read_events(self, max_events=64):
+	"""Read up to max_events pending events with a single read.
+
+	Blocks until at least one event is available.  The events are
+	returned undecoded as (sec, usec, type, code, value) tuples."""
+	buf = os.read(self.f, Event.size * max_events)
+	unpack_from = event_struct.unpack_from
+	return [unpack_from(buf, o) for o in range(0, len(buf), Event.size)]
 
     def write_event(self, *args):
 	Event.write(self.f, *args)
+
+IN_ATTRIB = 0x00000004
+IN_CREATE = 0x00000100
+IN_NONBLOCK = os.O_NONBLOCK
+
+def inotify_watch(path, mask):
+    """Return a non-blocking inotify descriptor watching path, or None
+    if inotify is not available"""
+    try:
+	import ctypes, ctypes.util
+	libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+	    use_errno=True)
+	fd = libc.inotify_init1(IN_NONBLOCK)
+    except (ImportError, OSError, AttributeError):
+	return None
+    if fd < 0: return None
+    if libc.inotify_add_watch(fd, path, mask) < 0:
+	os.close(fd)
+	return None
+    return fd
+
+class InputDeviceSet:
+    """Wait for events on many input devices with a single epoll instance.
+
+    poll() returns a list of (device, events) for every device that had
+    events pending.  All devices are read into one preallocated buffer.
+    Devices that go away are closed and reopened by their pattern when a
+    new node shows up in /dev/input; if inotify is not available this is
+    retried every rescan seconds instead.  reconnected, if given, is
+    called with the device after it was reopened."""
+
+    def __init__(self, devices=(), max_events=64, hotplug=True,
+	    reconnected=None, rescan=1.):
+	self.epoll = select.epoll()
+	self.buf = bytearray(Event.size * max_events)
+	self.files = {}
+	self.devices = []
+	self.lost = []
+	self.reconnected = reconnected
+	self.rescan = rescan
+	self.next_rescan = 0
+	self.inotify = None
+	if hotplug:
+	    self.inotify = inotify_watch("/dev/input", IN_CREATE | IN_ATTRIB)
+	    if self.inotify is not None:
+		self.epoll.register(self.inotify, select.EPOLLIN)
+	for device in devices: self.add(device)
+
+    def add(self, device):
+	self.devices.append(device)
+	if device.connected(): self.register(device)
+	else: self.lost.append(device)
+
+    def remove(self, device):
+	self.devices.remove(device)
+	if device in self.lost: self.lost.remove(device)
+	else: self.unregister(device)
+
+    def register(self, device):
+	fd = device.fileno()
+	self.files[fd] = (device, io.FileIO(fd, 'r', closefd=False))
+	self.epoll.register(fd, select.EPOLLIN)
+
+    def unregister(self, device):
+	fd = device.fileno()
+	if self.files.pop(fd, None) is not None:
+	    self.epoll.unregister(fd)
+
+    def disconnect(self, device):
+	self.unregister(device)
+	device.close()
+	self.lost.append(device)
+
+    def reconnect(self):
+	exclude = set()
+	for device in self.devices:
+	    if device.connected():
+		exclude.add(os.fstat(device.fileno()).st_rdev)
+	for device in self.lost[:]:
+	    try:
+		device.open(exclude)
+	    except (LookupError, IOError, OSError):
+		device.close()
+		continue
+	    exclude.add(os.fstat(device.fileno()).st_rdev)
+	    self.lost.remove(device)
+	    self.register(device)
+	    if self.reconnected: self.reconnected(device)
+
+    def drain_inotify(self):
+	while 1:
+	    try:
+		if not os.read(self.inotify, 4096): break
+	    except OSError, e:
+		if e.errno == errno.EAGAIN: break
+		raise
+
+    def poll(self, timeout=-1, decode=True):
+	"""Wait up to timeout seconds for events.
+
+	With decode=False the events are returned as raw
+	(sec, usec, type, code, value) tuples, otherwise as Event
+	objects with decoded codes.  Times are the kernel timestamps."""
+	if self.lost and self.inotify is None:
+	    now = time.time()
+	    if now >= self.next_rescan:
+		self.next_rescan = now + self.rescan
+		self.reconnect()
+	    if self.lost and (timeout < 0 or timeout > self.rescan):
+		timeout = self.rescan
+
+	try:
+	    ready = self.epoll.poll(timeout)
+	except IOError, e:
+	    if e.errno == errno.EINTR: return []
+	    raise
+
+	buf = self.buf
+	size = Event.size
+	unpack_from = event_struct.unpack_from
+	result = []
+	for fd, mask in ready:
+	    if fd == self.inotify:
+		self.drain_inotify()
+		if self.lost: self.reconnect()
+		continue
+	    entry = self.files.get(fd)
+	    if entry is None: continue
+	    device, f = entry
+	    try:
+		n = f.readinto(buf)
+	    except (IOError, OSError), e:
+		if e.errno in (errno.EAGAIN, errno.EINTR): continue
+		n = 0
+	    if n is None: continue
+	    if not n:
+		# ENODEV or end of file: the device was unplugged
+		self.disconnect(device)
+		continue
+	    events = [unpack_from(buf, o) for o in range(0, n, size)]
+	    if decode:
+		events = [decode_event(Event.from_tuple(data))
+		    for data in events]
+	    result.append((device, events))
+	return result
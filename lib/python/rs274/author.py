@@ -16,6 +16,8 @@
 #    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
 import sys, math
+import collections
+import multiprocessing
 
 def dist_lseg(l1, l2, p):
     "Compute the 3D distance from the line segment l1..l2 to the point p."
@@ -266,11 +268,71 @@ be specified only when there is only movement on 2 axes
 	if _first: yield "G1", st[0], None
 	if _first: yield "G1", st[-1], None
 
+def simplify(st, tolerance=.001, plane=None):
+    "Return the moves douglas() finds for 'st' as a list"
+    return list(douglas(st, tolerance, plane))
+
+class ParallelSimplifier:
+    """\
+Run douglas() in a pool of worker processes.
+
+Paths that are known in advance are handed to submit() in the order they
+will be flushed.  When Gcode.flush() asks for the moves of a path, the
+result computed by the workers is used if that path was submitted, so
+simplification of later paths overlaps with writing earlier ones.  Any
+other path is simplified in the calling process, the output is the same
+either way."""
+    def __init__(self, processes=None, lookahead=None):
+        if processes is None: processes = multiprocessing.cpu_count()
+        self.pool = multiprocessing.Pool(processes)
+        self.lookahead = lookahead or 4 * processes
+        self.pending = collections.deque()
+
+    def submit(self, st, tolerance=.001, plane=None):
+        self.pending.append(((st, tolerance, plane),
+            self.pool.apply_async(simplify, (st, tolerance, plane))))
+
+    def simplify(self, st, tolerance=.001, plane=None):
+        key = st, tolerance, plane
+        for i in range(min(len(self.pending), self.lookahead)):
+            if self.pending[i][0] == key:
+                # earlier submissions were never flushed on their own
+                for j in range(i): self.pending.popleft()
+                return self.pending.popleft()[1].get()
+        return simplify(st, tolerance, plane)
+
+    def close(self):
+        self.pool.terminate()
+        self.pending.clear()
+
+class BufferedTarget:
+    """\
+A Gcode target which collects lines and writes them to the file 'f' in
+chunks of about 'size' bytes, instead of one write call per line."""
+    def __init__(self, f, size=1<<16):
+        self.f = f
+        self.size = size
+        self.lines = []
+        self.pending = 0
+
+    def __call__(self, s):
+        self.lines.append(s)
+        self.pending += len(s) + 1
+        if self.pending >= self.size: self.flush()
+
+    def flush(self):
+        if self.lines:
+            self.lines.append("")
+            self.f.write("\n".join(self.lines))
+            self.lines = []
+            self.pending = 0
+        self.f.flush()
+
 class Gcode:
     "For creating rs274ngc files"
     def __init__(self, homeheight = 1.5, safetyheight = 0.04, tolerance=0.001,
             spindle_speed=1000, units="G20",
-            target=lambda s: sys.stdout.write(s + "\n")):
+            target=lambda s: sys.stdout.write(s + "\n"), simplifier=None):
         self.lastx = self.lasty = self.lastz = self.lasta = None
         self.lastgcode = self.lastfeed = None
         self.homeheight = homeheight
@@ -282,6 +344,7 @@ class Gcode:
         self.time = 0
         self.spindle_speed = spindle_speed
 	self.plane = None
+        self.simplifier = simplifier
 
     def set_plane(self, p):
 	assert p in (17,18,19)
@@ -313,7 +376,12 @@ that the last 'cut' coordinate is actually in the output file, and it may
 give better performance because this means that the simplification algorithm
 will examine fewer points per run."""
         if not self.cuts: return
-        for move, (x, y, z), cent in douglas(self.cuts, self.tolerance, self.plane):
+        if self.simplifier:
+            moves = self.simplifier.simplify(self.cuts, self.tolerance,
+                self.plane)
+        else:
+            moves = douglas(self.cuts, self.tolerance, self.plane)
+        for move, (x, y, z), cent in moves:
 	    if cent:
 		self.write("%s X%.4f Y%.4f Z%.4f %s" % (move, x, y, z, cent))
 		self.lastgcode = None
@@ -329,6 +397,16 @@ will examine fewer points per run."""
         self.flush()
         self.safety()
         self.write("M2")
+        if hasattr(self.write, "flush"): self.write.flush()
+
+    def moved_to(self, x, y, z):
+	"""\
+Record that a move written directly with write() ended at x, y, z, so the
+next move is written with its motion mode and only the changed axes."""
+        self.lastgcode = None
+        self.lastx = x
+        self.lasty = y
+        self.lastz = z
 
     def exactpath(self):
 	"""\
@@ -16,6 +16,7 @@
 #    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
 from rs274 import Translated, ArcsToSegmentsMixin, OpenGLTk
+from rs274.segments import SegmentStore, calc_extents
 from minigl import *
 import math
 import glnav
@@ -41,14 +42,16 @@ limiticon = array.array('B',
 class GLCanon(Translated, ArcsToSegmentsMixin):
     lineno = -1
     def __init__(self, colors, geometry, is_foam=0):
-        # traverse list - [line number, [start position], [end position], [tlo x, tlo y, tlo z]]
-        self.traverse = []; self.traverse_append = self.traverse.append
-        # feed list - [line number, [start position], [end position], feedrate, [tlo x, tlo y, tlo z]]
-        self.feed = []; self.feed_append = self.feed.append
-        # arcfeed list - [line number, [start position], [end position], feedrate, [tlo x, tlo y, tlo z]]
-        self.arcfeed = []; self.arcfeed_append = self.arcfeed.append
+        # segment stores, see rs274.segments - columns line number,
+        # start position, end position, feedrate (not for traverse) and
+        # tlo x, tlo y, tlo z
+        self.traverse = SegmentStore(False); self.traverse_append = self.traverse.append
+        self.feed = SegmentStore(); self.feed_append = self.feed.append
+        self.arcfeed = SegmentStore(); self.arcfeed_append = self.arcfeed.append
         # dwell list - [line number, color, pos x, pos y, pos z, plane]
         self.dwells = []; self.dwells_append = self.dwells.append
+        # line number -> indices into self.dwells
+        self.dwell_index = {}
         self.choice = None
         self.feedrate = 1
         self.lo = (0,) * 9
@@ -88,6 +91,10 @@ class GLCanon(Translated, ArcsToSegmentsMixin):
         self.notify = 0
         self.notify_message = ""
         self.highlight_line = None
+        # offsets in effect when the first move was made, and whether the
+        # program left them alone from there on (see GlCanonDraw.update_offsets)
+        self.load_offsets = self.offsets()
+        self.offsets_fixed = True
 
     def comment(self, arg):
         if arg.startswith("AXIS,"):
@@ -126,8 +133,38 @@ class GLCanon(Translated, ArcsToSegmentsMixin):
         self.state = st
         self.lineno = self.state.sequence_number
 
+    def offsets(self):
+        """Current (g5x, g92, rotation_xy) offsets, in inches"""
+        return ((self.g5x_offset_x, self.g5x_offset_y, self.g5x_offset_z,
+                self.g5x_offset_a, self.g5x_offset_b, self.g5x_offset_c,
+                self.g5x_offset_u, self.g5x_offset_v, self.g5x_offset_w),
+            (self.g92_offset_x, self.g92_offset_y, self.g92_offset_z,
+                self.g92_offset_a, self.g92_offset_b, self.g92_offset_c,
+                self.g92_offset_u, self.g92_offset_v, self.g92_offset_w),
+            self.rotation_xy)
+
+    def offsets_changed(self):
+        if not (len(self.traverse) or len(self.feed) or len(self.arcfeed)
+                or self.dwells):
+            self.load_offsets = self.offsets()
+        elif self.offsets() != self.load_offsets:
+            self.offsets_fixed = False
+
+    def set_g5x_offset(self, *args):
+        Translated.set_g5x_offset(self, *args)
+        self.offsets_changed()
+
+    def set_g92_offset(self, *args):
+        Translated.set_g92_offset(self, *args)
+        self.offsets_changed()
+
+    def set_xy_rotation(self, theta):
+        Translated.set_xy_rotation(self, theta)
+        self.offsets_changed()
+
     def draw_lines(self, lines, for_selection, j=0, geometry=None):
-        return linuxcnc.draw_lines(geometry or self.geometry, lines, for_selection)
+        return linuxcnc.draw_segments(geometry or self.geometry,
+            lines.lineno, lines.start, lines.end, for_selection)
 
     def colored_lines(self, color, lines, for_selection, j=0):
         if self.is_foam:
@@ -148,11 +185,28 @@ class GLCanon(Translated, ArcsToSegmentsMixin):
                 self.color_with_alpha(color)
             self.draw_lines(lines, for_selection, j)
 
+    def segment_vertices(self, lines, geometry=None, counts=False):
+        return linuxcnc.segment_vertices(geometry or self.geometry,
+            lines.start, lines.end, counts)
+
+    def make_picker(self):
+        """Return an rs274.picking.SegmentPicker over everything draw()
+        would draw for selection"""
+        from rs274 import picking
+        p = picking.SegmentPicker()
+        for kind, lines in ((picking.TRAVERSE, self.traverse),
+                (picking.FEED, self.feed), (picking.FEED, self.arcfeed)):
+            vertices, counts = self.segment_vertices(lines, counts=True)
+            p.add_vertices(vertices, counts, lines.lineno, kind)
+        p.add_points([d[2:5] for d in self.dwells], [d[0] for d in self.dwells])
+        p.build()
+        return p
+
     def draw_dwells(self, dwells, alpha, for_selection, j0=0):
         return linuxcnc.draw_dwells(self.geometry, dwells, alpha, for_selection, self.is_lathe())
 
     def calc_extents(self):
-        self.min_extents, self.max_extents, self.min_extents_notool, self.max_extents_notool = gcode.calc_extents(self.arcfeed, self.feed, self.traverse)
+        self.min_extents, self.max_extents, self.min_extents_notool, self.max_extents_notool = calc_extents(self.arcfeed, self.feed, self.traverse)
         if self.is_foam:
             min_z = min(self.foam_z, self.foam_w)
             max_z = max(self.foam_z, self.foam_w)
@@ -188,7 +242,7 @@ class GLCanon(Translated, ArcsToSegmentsMixin):
         if self.suppress > 0: return
         l = self.rotate_and_translate(x,y,z,a,b,c,u,v,w)
         if not self.first_move:
-                self.traverse_append((self.lineno, self.lo, l, [self.xo, self.yo, self.zo]))
+                self.traverse_append(self.lineno, self.lo, l, 0, (self.xo, self.yo, self.zo))
         self.lo = l
 
     def rigid_tap(self, x, y, z):
@@ -197,9 +251,9 @@ class GLCanon(Translated, ArcsToSegmentsMixin):
         l = self.rotate_and_translate(x,y,z,0,0,0,0,0,0)[:3]
         l += [self.lo[3], self.lo[4], self.lo[5],
                self.lo[6], self.lo[7], self.lo[8]]
-        self.feed_append((self.lineno, self.lo, l, self.feedrate, [self.xo, self.yo, self.zo]))
+        self.feed_append(self.lineno, self.lo, l, self.feedrate, (self.xo, self.yo, self.zo))
 #        self.dwells_append((self.lineno, self.colors['dwell'], x + self.offset_x, y + self.offset_y, z + self.offset_z, 0))
-        self.feed_append((self.lineno, l, self.lo, self.feedrate, [self.xo, self.yo, self.zo]))
+        self.feed_append(self.lineno, l, self.lo, self.feedrate, (self.xo, self.yo, self.zo))
 
     def arc_feed(self, *args):
         if self.suppress > 0: return
@@ -212,33 +266,30 @@ class GLCanon(Translated, ArcsToSegmentsMixin):
 
     def straight_arcsegments(self, segs):
         self.first_move = False
-        lo = self.lo
-        lineno = self.lineno
-        feedrate = self.feedrate
-        to = [self.xo, self.yo, self.zo]
-        append = self.arcfeed_append
-        for l in segs:
-            append((lineno, lo, l, feedrate, to))
-            lo = l
-        self.lo = lo
+        if not segs: return
+        self.arcfeed.extend_path(self.lineno, self.lo, segs, self.feedrate,
+            (self.xo, self.yo, self.zo))
+        self.lo = segs[-1]
 
     def straight_feed(self, x,y,z, a,b,c, u, v, w):
         if self.suppress > 0: return
         self.first_move = False
         l = self.rotate_and_translate(x,y,z,a,b,c,u,v,w)
-        self.feed_append((self.lineno, self.lo, l, self.feedrate, [self.xo, self.yo, self.zo]))
+        self.feed_append(self.lineno, self.lo, l, self.feedrate, (self.xo, self.yo, self.zo))
         self.lo = l
     straight_probe = straight_feed
 
     def user_defined_function(self, i, p, q):
         if self.suppress > 0: return
         color = self.colors['m1xx']
+        self.dwell_index.setdefault(self.lineno, []).append(len(self.dwells))
         self.dwells_append((self.lineno, color, self.lo[0], self.lo[1], self.lo[2], self.state.plane/10-17))
 
     def dwell(self, arg):
         if self.suppress > 0: return
         self.dwell_time += arg
         color = self.colors['dwell']
+        self.dwell_index.setdefault(self.lineno, []).append(len(self.dwells))
         self.dwells_append((self.lineno, color, self.lo[0], self.lo[1], self.lo[2], self.state.plane/10-17))
 
 
@@ -248,31 +299,22 @@ class GLCanon(Translated, ArcsToSegmentsMixin):
         glColor3f(*c)
         glBegin(GL_LINES)
         coords = []
-        for line in self.traverse:
-            if line[0] != lineno: continue
-            linuxcnc.line9(geometry, line[1], line[2])
-            coords.append(line[1][:3])
-            coords.append(line[2][:3])
-        for line in self.arcfeed:
-            if line[0] != lineno: continue
-            linuxcnc.line9(geometry, line[1], line[2])
-            coords.append(line[1][:3])
-            coords.append(line[2][:3])
-        for line in self.feed:
-            if line[0] != lineno: continue
-            linuxcnc.line9(geometry, line[1], line[2])
-            coords.append(line[1][:3])
-            coords.append(line[2][:3])
+        for store in (self.traverse, self.arcfeed, self.feed):
+            for i in store.line_segments(lineno):
+                start, end = store.segment(i)
+                linuxcnc.line9(geometry, start, end)
+                coords.append(start[:3])
+                coords.append(end[:3])
         glEnd()
-        for line in self.dwells:
-            if line[0] != lineno: continue
+        for i in self.dwell_index.get(lineno, ()):
+            line = self.dwells[i]
             self.draw_dwells([(line[0], c) + line[2:]], 2, 0)
             coords.append(line[2:5])
         glLineWidth(1)
         if coords:
-            x = reduce(lambda x,y:x+y, [c[0] for c in coords]) / len(coords)
-            y = reduce(lambda x,y:x+y, [c[1] for c in coords]) / len(coords)
-            z = reduce(lambda x,y:x+y, [c[2] for c in coords]) / len(coords)
+            x = sum(c[0] for c in coords) / len(coords)
+            y = sum(c[1] for c in coords) / len(coords)
+            z = sum(c[2] for c in coords) / len(coords)
         else:
             x = (self.min_extents[0] + self.max_extents[0])/2
             y = (self.min_extents[1] + self.max_extents[1])/2
@@ -378,6 +420,12 @@ class GlCanonDraw:
         self.lp = lp
         self.canon = g
         self._dlists = {}
+        self._buffers = {}
+        self.program_matrix = None
+        self.load_stat_offsets = None
+        self.load_extents = None
+        self.preview_cache = None
+        self.picker = None
         self.select_buffer_size = 100
         self.cached_tool = -1
         self.initialised = 0
@@ -390,6 +438,9 @@ class GlCanonDraw:
 
     def set_canon(self, canon):
         self.canon = canon
+        self.picker = None
+        self.program_matrix = None
+        self.load_extents = None
 
     @with_context
     def basic_lighting(self):
@@ -406,6 +457,8 @@ class GlCanonDraw:
 
     def select(self, x, y):
         if self.canon is None: return
+        if self.get_use_cpu_pick() and not self.is_foam():
+            return self.select_cpu(x, y)
         pmatrix = glGetDoublev(GL_PROJECTION_MATRIX)
         glMatrixMode(GL_PROJECTION)
         glPushMatrix()
@@ -442,6 +495,18 @@ class GlCanonDraw:
         glPopMatrix()
         glMatrixMode(GL_MODELVIEW)
 
+    def select_cpu(self, x, y):
+        if self.picker is None:
+            self.picker = self.canon.make_picker()
+        from rs274 import picking
+        kinds = picking.FEED | picking.DWELL
+        if self.get_show_rapids(): kinds |= picking.TRAVERSE
+        vport = glGetIntegerv(GL_VIEWPORT)
+        self.set_highlight_line(self.picker.pick(
+            glGetDoublev(GL_MODELVIEW_MATRIX),
+            glGetDoublev(GL_PROJECTION_MATRIX),
+            vport, x, vport[3]-y, kinds=kinds, model=self.program_matrix))
+
     def dlist(self, name, n=1, gen=lambda n: None):
         if name not in self._dlists:
             base = glGenLists(n)
@@ -454,9 +519,28 @@ class GlCanonDraw:
         base, count = self._dlists.pop(name)
         glDeleteLists(base, count)
 
+    def vbo(self, name, gen):
+        """Return (buffer, vertex count) of a buffer object holding a
+        GL_LINES vertex array, uploading the data from gen() on first use"""
+        if name not in self._buffers:
+            data = gen()
+            buf, = glGenBuffers(1)
+            glBindBuffer(GL_ARRAY_BUFFER, buf)
+            glBufferData(GL_ARRAY_BUFFER, data, GL_STATIC_DRAW)
+            glBindBuffer(GL_ARRAY_BUFFER, 0)
+            self._buffers[name] = buf, len(data) / 12
+        return self._buffers[name]
+
+    def stale_vbos(self):
+        if not self._buffers: return
+        glDeleteBuffers([buf for buf, count in self._buffers.values()])
+        self._buffers.clear()
+
     def __del__(self):
         for base, count in self._dlists.values():
             glDeleteLists(base, count)
+        if self._buffers:
+            glDeleteBuffers([buf for buf, count in self._buffers.values()])
 
     def update_highlight_variable(self,line):
         self.highlight_line = line
@@ -795,6 +879,76 @@ class GlCanonDraw:
         if self.canon and self.canon.grid: return self.canon.grid
         return 5./25.4
 
+    # Draw the program from vertex buffer objects instead of display lists.
+    # The vertex data is uploaded once per loaded program; override to
+    # enable on GL implementations that support OpenGL 1.5.
+    def get_use_vbo(self):
+        return False
+
+    # Resolve clicks in the preview on the CPU (see rs274.picking) instead
+    # of a GL_SELECT render pass.  Needs numpy.
+    def get_use_cpu_pick(self):
+        return False
+
+    def set_program_matrix(self, matrix):
+        """Set a 4x4 column-major matrix applied to the program preview
+        and its highlight at draw time, or None for the identity.
+
+        This allows a UI to move or rotate the preview, e.g. after a
+        work offset change, without rebuilding any geometry."""
+        self.program_matrix = matrix
+
+    def stat_offsets(self):
+        """Active (g5x, g92, rotation_xy) offsets from self.stat, in inches"""
+        s = self.stat
+        return (tuple(self.to_internal_units(s.g5x_offset)),
+            tuple(self.to_internal_units(s.g92_offset)), s.rotation_xy)
+
+    def update_offsets(self):
+        """Move the preview to the work offsets in self.stat.
+
+        The program was interpreted with the offsets active at load time
+        baked into its segments; instead of interpreting it again the
+        difference is applied with set_program_matrix, and the extents are
+        moved along.  Returns False if that is not possible and the program
+        has to be reloaded: when the program selects or sets offsets
+        itself, when the xy rotation or offsets other than x, y and z
+        changed, or for foam and rotary axis geometries."""
+        canon = self.canon
+        if canon is None: return True
+        if self.load_extents is None: return False
+        g5x, g92, rotation = self.stat_offsets()
+        g5x_old, g92_old, rotation_old = canon.load_offsets
+        def same(a, b):
+            return all(abs((i or 0) - (j or 0)) < 1e-9 for i, j in zip(a, b))
+        if not (same(self.load_stat_offsets[0], g5x_old)
+                and same(self.load_stat_offsets[1], g92_old)
+                and same([self.load_stat_offsets[2]], [rotation_old])):
+            return False
+        if (not canon.offsets_fixed or self.is_foam()
+                or set(self.get_geometry()) - set("XYZ-")
+                or not same([rotation], [rotation_old])
+                or not same(g5x[3:], g5x_old[3:])
+                or not same(g92[3:], g92_old[3:])):
+            return False
+        # machine = g5x + R(rotation) * (p + g92), with R unchanged
+        t = math.radians(rotation)
+        c, s = math.cos(t), math.sin(t)
+        gx, gy, gz = [(g92[i] or 0) - (g92_old[i] or 0) for i in range(3)]
+        d = (g5x[0] - g5x_old[0] + c * gx - s * gy,
+            g5x[1] - g5x_old[1] + s * gx + c * gy,
+            g5x[2] - g5x_old[2] + gz)
+        if same(d, (0, 0, 0)):
+            self.set_program_matrix(None)
+        else:
+            self.set_program_matrix([1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0,
+                d[0], d[1], d[2], 1])
+        for name, extents in zip(('min_extents', 'max_extents',
+                'min_extents_notool', 'max_extents_notool'),
+                self.load_extents):
+            setattr(canon, name, [a + b for a, b in zip(extents, d)])
+        return True
+
     def comp(self, (sx, sy), (cx, cy)):
         return -(sx*cx + sy*cy) / (sx*sx + sy*sy)
 
@@ -930,10 +1084,18 @@ class GlCanonDraw:
                 glEnable(GL_BLEND)
                 glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
 
-            if self.get_show_rapids():
-                glCallList(self.dlist('program_rapids', gen=self.make_main_list))
-            glCallList(self.dlist('program_norapids', gen=self.make_main_list))
+            if self.program_matrix is not None:
+                glPushMatrix()
+                glMultMatrixd(self.program_matrix)
+            if self.get_use_vbo() and not self.is_foam():
+                self.draw_program_vbos()
+            else:
+                if self.get_show_rapids():
+                    glCallList(self.dlist('program_rapids', gen=self.make_main_list))
+                glCallList(self.dlist('program_norapids', gen=self.make_main_list))
             glCallList(self.dlist('highlight'))
+            if self.program_matrix is not None:
+                glPopMatrix()
 
             if self.get_program_alpha():
                 glDisable(GL_BLEND)
@@ -1582,6 +1744,39 @@ class GlCanonDraw:
         if self.canon: self.canon.draw(1, True)
         glEndList()
 
+    def draw_program_vbos(self):
+        canon = self.canon
+        if canon is None: return
+        def draw(name, lines, color):
+            buf, count = self.vbo(name, lambda: canon.segment_vertices(lines))
+            if not count: return
+            canon.color_with_alpha(color)
+            glBindBuffer(GL_ARRAY_BUFFER, buf)
+            glVertexPointer(3, GL_FLOAT, 0, 0)
+            glDrawArrays(GL_LINES, 0, count)
+
+        glEnableClientState(GL_VERTEX_ARRAY)
+        try:
+            if self.get_show_rapids():
+                glEnable(GL_LINE_STIPPLE)
+                draw('traverse', canon.traverse, 'traverse')
+                glDisable(GL_LINE_STIPPLE)
+            draw('feed', canon.feed, 'straight_feed')
+            draw('arcfeed', canon.arcfeed, 'arc_feed')
+        finally:
+            glBindBuffer(GL_ARRAY_BUFFER, 0)
+            glDisableClientState(GL_VERTEX_ARRAY)
+        glCallList(self.dlist('program_dwells', gen=self.make_dwell_list))
+
+    def make_dwell_list(self, dwells):
+        glNewList(dwells, GL_COMPILE)
+        if self.canon:
+            glLineWidth(2)
+            self.canon.draw_dwells(self.canon.dwells,
+                self.canon.colors.get('dwell_alpha', 1/3.), 0)
+            glLineWidth(1)
+        glEndList()
+
     def make_main_list(self, unused=None):
         program = self.dlist('program_norapids')
         rapids = self.dlist('program_rapids')
@@ -1593,17 +1788,41 @@ class GlCanonDraw:
         if self.canon: self.canon.draw(0, False)
         glEndList()
 
+    def set_preview_cache(self, cache):
+        """Use an rs274.previewcache.PreviewCache for load_preview"""
+        self.preview_cache = cache
+
     def load_preview(self, f, canon, unitcode, initcode, interpname=""):
         self.set_canon(canon)
-        result, seq = gcode.parse(f, canon, unitcode, initcode, interpname)
+        self.load_stat_offsets = self.stat_offsets()
+        cache = self.preview_cache
+        cached = None
+        if cache is not None:
+            key = cache.key(f, unitcode, initcode, interpname, canon)
+            cached = cache.load(key, canon)
+
+        if cached is not None:
+            result, seq = cached
+        else:
+            result, seq = gcode.parse(f, canon, unitcode, initcode, interpname)
 
         if result <= gcode.MIN_ERROR:
             self.canon.progress.nextphase(1)
-            canon.calc_extents()
+            if cached is None:
+                canon.calc_extents()
+            self.load_extents = (canon.min_extents, canon.max_extents,
+                canon.min_extents_notool, canon.max_extents_notool)
             self.stale_dlist('program_rapids')
             self.stale_dlist('program_norapids')
             self.stale_dlist('select_rapids')
             self.stale_dlist('select_norapids')
+            self.stale_dlist('program_dwells')
+            self.stale_vbos()
+            if self.get_use_cpu_pick() and not self.is_foam():
+                self.picker = canon.make_picker()
+
+        if cache is not None and cached is None:
+            cache.store(key, canon, result, seq)
 
         return result, seq
 
@@ -0,0 +1,172 @@
+#    This is a component of AXIS, a front-end for emc
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# CPU side picking for the program preview.
+#
+# Picking with GL_SELECT renders the whole program once more through the
+# (often software) selection path for every click.  Instead, the preview
+# geometry is sorted once into a uniform grid of cells when a program is
+# loaded.  A click projects the bounding boxes of the non-empty cells to
+# the screen, and only the segments of cells near the click are projected
+# and tested by their 2D distance to the click position.  Of all segments
+# within the pick radius the one nearest to the viewer wins, like the
+# minimum depth hit of GL_SELECT.
+
+import numpy
+
+TRAVERSE, FEED, DWELL = 1, 2, 4
+
+def project(points, matrix, viewport):
+    """Window coordinates (x, y, ndc z) and clip w of points using the
+    combined column-major projection * modelview matrix"""
+    clip = numpy.dot(points, matrix[:3]) + matrix[3]
+    w = clip[:, 3]
+    # points behind the eye get a huge but finite position
+    safe = numpy.where(w > 1e-9, w, 1e-9)
+    x = viewport[0] + (clip[:, 0] / safe + 1) * viewport[2] / 2.
+    y = viewport[1] + (clip[:, 1] / safe + 1) * viewport[3] / 2.
+    return x, y, clip[:, 2] / safe, w
+
+class SegmentPicker(object):
+    def __init__(self, per_cell=64, max_cells=32):
+        self.per_cell = per_cell
+        self.max_cells = max_cells
+        self.starts = []; self.ends = []
+        self.linenos = []; self.kinds = []
+        self.built = False
+
+    def add_vertices(self, vertices, counts, linenos, kind):
+        """Add GL_LINES vertices as produced by linuxcnc.segment_vertices;
+        counts holds the number of vertices of each source segment"""
+        v = numpy.frombuffer(vertices, numpy.float32).reshape(-1, 2, 3)
+        if not len(v): return
+        counts = numpy.frombuffer(counts, numpy.intc)
+        linenos = numpy.frombuffer(linenos, numpy.intc)
+        self.starts.append(v[:, 0])
+        self.ends.append(v[:, 1])
+        self.linenos.append(numpy.repeat(linenos, counts // 2))
+        self.kinds.append(numpy.repeat(numpy.uint8(kind), len(v)))
+
+    def add_points(self, points, linenos, kind=DWELL):
+        if not len(points): return
+        points = numpy.asarray(points, numpy.float32).reshape(-1, 3)
+        self.starts.append(points)
+        self.ends.append(points)
+        self.linenos.append(numpy.asarray(linenos, numpy.intc))
+        self.kinds.append(numpy.repeat(numpy.uint8(kind), len(points)))
+
+    def build(self):
+        """Sort everything added so far into the grid"""
+        if self.starts:
+            starts = numpy.concatenate(self.starts).astype(numpy.float64)
+            ends = numpy.concatenate(self.ends).astype(numpy.float64)
+            linenos = numpy.concatenate(self.linenos)
+            kinds = numpy.concatenate(self.kinds)
+        else:
+            starts = ends = numpy.zeros((0, 3))
+            linenos = numpy.zeros(0, numpy.intc)
+            kinds = numpy.zeros(0, numpy.uint8)
+        self.starts = self.ends = self.linenos = self.kinds = None
+
+        if len(starts):
+            lo = numpy.minimum(starts, ends).min(0)
+            hi = numpy.maximum(starts, ends).max(0)
+        else:
+            lo = hi = numpy.zeros(3)
+        # aim for per_cell segments in an average cell, so culling the
+        # cells costs about as much as testing the remaining segments
+        n = int(round((len(starts) / float(self.per_cell)) ** (1/3.)))
+        self.cells = max(1, min(self.max_cells, n))
+        size = numpy.maximum((hi - lo) / self.cells, 1e-9)
+        # segments are binned by their midpoint, so each cell box is
+        # grown to the actual extent of its segments below
+        mid = (starts + ends) / 2
+        ijk = numpy.minimum(((mid - lo) / size).astype(int), self.cells - 1)
+        cell = (ijk[:, 0] * self.cells + ijk[:, 1]) * self.cells + ijk[:, 2]
+        order = numpy.argsort(cell, kind='mergesort')
+        cell = cell[order]
+        self.start = starts[order]
+        self.end = ends[order]
+        self.lineno = linenos[order]
+        self.kind = kinds[order]
+
+        first = numpy.flatnonzero(numpy.r_[True, cell[1:] != cell[:-1]]) \
+            if len(cell) else numpy.zeros(0, int)
+        self.cell_begin = first
+        self.cell_end = numpy.r_[first[1:], len(cell)].astype(int)
+        if len(cell):
+            self.cell_lo = numpy.minimum.reduceat(
+                numpy.minimum(self.start, self.end), first)
+            self.cell_hi = numpy.maximum.reduceat(
+                numpy.maximum(self.start, self.end), first)
+        else:
+            self.cell_lo = self.cell_hi = numpy.zeros((0, 3))
+        self.built = True
+
+    def __len__(self):
+        return len(self.lineno)
+
+    def candidate_cells(self, matrix, viewport, x, y, radius):
+        lo, hi = self.cell_lo, self.cell_hi
+        corners = numpy.empty((len(lo), 8, 3))
+        for c in range(8):
+            corners[:, c, 0] = (lo, hi)[c & 1][:, 0]
+            corners[:, c, 1] = (lo, hi)[(c >> 1) & 1][:, 1]
+            corners[:, c, 2] = (lo, hi)[(c >> 2) & 1][:, 2]
+        sx, sy, sz, w = project(corners.reshape(-1, 3), matrix, viewport)
+        sx = sx.reshape(-1, 8); sy = sy.reshape(-1, 8)
+        # a box reaching behind the eye can cover any part of the screen
+        behind = (w.reshape(-1, 8) <= 1e-9).any(1)
+        near = ((sx.min(1) <= x + radius) & (sx.max(1) >= x - radius)
+            & (sy.min(1) <= y + radius) & (sy.max(1) >= y - radius))
+        return numpy.flatnonzero(near | behind)
+
+    def pick(self, modelview, projection, viewport, x, y, radius=3,
+            kinds=TRAVERSE | FEED | DWELL, model=None):
+        """Line number of the segment under window position x, y (with
+        y counted from the bottom like GL), or None if there is none.
+
+        The matrices are column-major like glGetDoublev returns them;
+        model is an optional extra matrix applied before modelview."""
+        if not self.built: self.build()
+        if not len(self.lineno): return None
+        matrix = numpy.dot(
+            numpy.asarray(modelview, float).reshape(4, 4),
+            numpy.asarray(projection, float).reshape(4, 4))
+        if model is not None:
+            matrix = numpy.dot(numpy.asarray(model, float).reshape(4, 4),
+                matrix)
+        cells = self.candidate_cells(matrix, viewport, x, y, radius)
+        if not len(cells): return None
+        index = numpy.concatenate([numpy.arange(b, e) for b, e in
+            zip(self.cell_begin[cells], self.cell_end[cells])])
+        index = index[(self.kind[index] & kinds) != 0]
+        if not len(index): return None
+
+        x0, y0, z0, w0 = project(self.start[index], matrix, viewport)
+        x1, y1, z1, w1 = project(self.end[index], matrix, viewport)
+        dx = x1 - x0; dy = y1 - y0
+        l2 = dx*dx + dy*dy
+        t = ((x - x0) * dx + (y - y0) * dy) / numpy.where(l2 > 0, l2, 1)
+        t = numpy.clip(t, 0, 1)
+        ex = x0 + t * dx - x; ey = y0 + t * dy - y
+        # ndc z is linear in window space along the projected segment
+        depth = z0 + t * (z1 - z0)
+        hit = ((ex*ex + ey*ey <= radius * radius) & (w0 > 1e-9) & (w1 > 1e-9)
+            & (depth >= -1) & (depth <= 1))
+        if not hit.any(): return None
+        hits = numpy.flatnonzero(hit)
+        return int(self.lineno[index[hits[numpy.argmin(depth[hits])]]])
@@ -0,0 +1,266 @@
+#    This is a component of AXIS, a front-end for emc
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# Persistent cache of interpreted previews.
+#
+# An entry stores everything GLCanon collected while interpreting a program
+# (segment stores, dwells, extents, foam heights) plus the parse result, so
+# reopening an unchanged program skips the interpreter completely.  The key
+# is a hash over everything that influences the interpretation: program
+# text, unit and startup code, interpreter, parameter file, tool table,
+# the canon settings that shape the segments, the ini file and every file
+# the interpreter may load while parsing.  The latter are found through the
+# ini file: o<name> call subroutines (and remap ngc files) are searched in
+# PROGRAM_PREFIX, SUBROUTINE_PATH and WIZARD_ROOT, python remaps and
+# o-word handlers live in [PYTHON]TOPLEVEL and the PATH_APPEND/PATH_PREPEND
+# directories.  Since a subroutine name can be computed at run time, the
+# size and mtime of every file in those places goes into the key instead
+# of just the files a program names.
+#
+# Of the side effects a parse has on the canon, the tool table changes are
+# stored and restored, as are the work offsets the segments were made with
+# (used to move the preview on offset changes, see
+# GlCanonDraw.update_offsets).  Messages a UI shows while interpreting, like the
+# AXIS (AXIS,notify) comments, are not repeated on a cache hit.
+#
+# File layout:
+#   MAGIC
+#   '<Q' length of the pickled header, the pickled header
+#   every segment column as raw native-endian array data, 8 byte aligned,
+#   at the offsets recorded in the header
+#
+# Because the columns are stored unmodified and aligned they can be read
+# with a single array.fromfile per column, or mmap()ed by other readers.
+
+import os
+import sys
+import array
+import struct
+import hashlib
+import tempfile
+import cPickle as pickle
+
+MAGIC = "RS274PREVIEW4\n"
+STORES = ('traverse', 'feed', 'arcfeed')
+COLUMNS = (('lineno', 'i'), ('start', 'd'), ('end', 'd'), ('feedrate', 'd'),
+    ('tool', 'd'), ('run_begin', 'i'))
+
+def hash_tree(h, directory, suffixes, recursive=False):
+    """Hash name, size and mtime of the files below directory ending in
+    one of suffixes"""
+    h.update("\0dir\0%s\0" % directory)
+    if not os.path.isdir(directory): return
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if not name.endswith(suffixes): continue
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            h.update("%s\0%d\0%r\0" % (path, st.st_size, st.st_mtime))
+        if not recursive: break
+
+def hash_interpreter_files(h, inifile):
+    """Hash the ini file and the places the interpreter loads subroutines
+    and python plugins from"""
+    hash_file(h, inifile)
+    if not inifile or not os.path.exists(inifile): return
+    import linuxcnc
+    ini = linuxcnc.ini(inifile)
+    def path(p):
+        return os.path.realpath(os.path.expanduser(p))
+    dirs = []
+    prefix = ini.find("DISPLAY", "PROGRAM_PREFIX")
+    if prefix: dirs.append(prefix)
+    subroutines = ini.find("RS274NGC", "SUBROUTINE_PATH")
+    if subroutines: dirs.extend(d for d in subroutines.split(":") if d)
+    for d in dirs:
+        hash_tree(h, path(d), (".ngc",))
+    wizard = ini.find("WIZARD", "WIZARD_ROOT")
+    if wizard:
+        hash_tree(h, path(wizard), (".ngc",), True)
+    toplevel = ini.find("PYTHON", "TOPLEVEL")
+    if toplevel:
+        hash_file(h, path(toplevel))
+        hash_tree(h, os.path.dirname(path(toplevel)), (".py",))
+    for option in ("PATH_APPEND", "PATH_PREPEND"):
+        for d in ini.findall("PYTHON", option) or ():
+            hash_tree(h, path(d), (".py",), True)
+
+def hash_file(h, filename):
+    if not filename or not os.path.exists(filename):
+        h.update("\0missing\0")
+        return
+    f = open(filename, "rb")
+    try:
+        while 1:
+            data = f.read(1 << 20)
+            if not data: break
+            h.update(data)
+    finally:
+        f.close()
+    h.update("\0")
+
+class PreviewCache(object):
+    def __init__(self, directory, max_entries=16):
+        self.directory = os.path.expanduser(directory)
+        self.max_entries = max_entries
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def key(self, filename, unitcode, initcode, interpname, canon):
+        h = hashlib.sha1()
+        h.update(MAGIC)
+        h.update(sys.byteorder)
+        hash_file(h, filename)
+        hash_file(h, getattr(canon, 'parameter_file', None))
+        hash_interpreter_files(h, os.environ.get("INI_FILE_NAME"))
+        h.update(repr((unitcode, initcode, interpname,
+            [tuple(t) for t in getattr(canon, 'tools', ())],
+            canon.geometry, canon.is_foam, canon.arcdivision)))
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".preview")
+
+    def load(self, key, canon):
+        """Fill canon from the cache entry for key.
+
+        Returns the cached (result, seq) of gcode.parse, or None if there
+        is no usable entry."""
+        try:
+            f = open(self.path(key), "rb")
+        except IOError:
+            return None
+        try:
+            try:
+                if f.read(len(MAGIC)) != MAGIC: return None
+                n, = struct.unpack('<Q', f.read(8))
+                header = pickle.loads(f.read(n))
+                loaded = []
+                for name in STORES:
+                    for column, typecode in COLUMNS:
+                        offset, count = header['columns'][name][column]
+                        f.seek(offset)
+                        data = array.array(typecode)
+                        data.fromfile(f, count)
+                        loaded.append((name, column, data))
+            except (EOFError, ValueError, KeyError, struct.error,
+                    pickle.UnpicklingError):
+                return None
+        finally:
+            f.close()
+
+        for name, column, data in loaded:
+            if column == 'run_begin': data = data.tolist()
+            setattr(getattr(canon, name), column, data)
+        for name in STORES:
+            getattr(canon, name).reindex()
+        canon.traverse_append = canon.traverse.append
+        canon.feed_append = canon.feed.append
+        canon.arcfeed_append = canon.arcfeed.append
+        canon.dwells[:] = header['dwells']
+        canon.dwells_append = canon.dwells.append
+        canon.dwell_index = header['dwell_index']
+        if header['tools'] is not None:
+            canon.tools[:] = header['tools']
+        if header['load_offsets'] is not None:
+            canon.load_offsets = header['load_offsets']
+            canon.offsets_fixed = header['offsets_fixed']
+        for name in ('min_extents', 'max_extents',
+                'min_extents_notool', 'max_extents_notool',
+                'foam_z', 'foam_w', 'dwell_time'):
+            setattr(canon, name, header[name])
+        os.utime(self.path(key), None)
+        return header['result'], header['seq']
+
+    def store(self, key, canon, result, seq):
+        header = {
+            'result': result, 'seq': seq,
+            'dwells': canon.dwells, 'dwell_index': canon.dwell_index,
+            'min_extents': canon.min_extents,
+            'max_extents': canon.max_extents,
+            'min_extents_notool': canon.min_extents_notool,
+            'max_extents_notool': canon.max_extents_notool,
+            'foam_z': canon.foam_z, 'foam_w': canon.foam_w,
+            'dwell_time': canon.dwell_time,
+            'tools': None,
+            'load_offsets': getattr(canon, 'load_offsets', None),
+            'offsets_fixed': getattr(canon, 'offsets_fixed', None),
+        }
+        # the tool table as left by the tool changes in the program
+        if hasattr(canon, 'tools'):
+            header['tools'] = [tuple(t) for t in canon.tools]
+
+        # the header records the column offsets, so its size has to be
+        # known first; lay the columns out after a header with dummy
+        # offsets of the same pickled length
+        columns = []
+        for name in STORES:
+            store = getattr(canon, name)
+            for column, typecode in COLUMNS:
+                data = getattr(store, column)
+                if column == 'run_begin': data = array.array('i', data)
+                columns.append((name, column, data))
+        header['columns'] = dict((name, {}) for name in STORES)
+        for name, column, data in columns:
+            header['columns'][name][column] = (1 << 62, 1 << 62)
+        base = len(MAGIC) + 8 + len(pickle.dumps(header, 2))
+        offset = (base + 7) & ~7
+        for name, column, data in columns:
+            nbytes = len(data) * data.itemsize
+            header['columns'][name][column] = (offset, len(data))
+            offset = (offset + nbytes + 7) & ~7
+        # the real offsets never pickle longer than the placeholders, any
+        # gap before the first column is zero filled below
+        pickled = pickle.dumps(header, 2)
+
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            f = os.fdopen(fd, "wb")
+            try:
+                f.write(MAGIC)
+                f.write(struct.pack('<Q', len(pickled)))
+                f.write(pickled)
+                for name, column, data in columns:
+                    f.write("\0" * (header['columns'][name][column][0]
+                        - f.tell()))
+                    data.tofile(f)
+            finally:
+                f.close()
+            os.rename(tmp, self.path(key))
+        except:
+            if os.path.exists(tmp): os.unlink(tmp)
+            raise
+        self.prune()
+
+    def prune(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".preview"): continue
+            path = os.path.join(self.directory, name)
+            try:
+                entries.append((os.stat(path).st_mtime, path))
+            except OSError:
+                pass
+        entries.sort()
+        for mtime, path in entries[:-self.max_entries or None]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
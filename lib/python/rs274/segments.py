@@ -0,0 +1,140 @@
+#    This is a component of AXIS, a front-end for emc
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# Columnar storage for the preview geometry collected by rs274.glcanon.
+#
+# Instead of one python tuple (plus two 9-element lists and a tool offset
+# list) per segment, every column lives in a flat array.array:
+#
+#   lineno    'i'  one entry per segment
+#   start     'd'  9 entries per segment (x y z a b c u v w)
+#   end       'd'  9 entries per segment
+#   feedrate  'd'  one entry per segment (feed and arc stores only)
+#   tool      'd'  3 entries per segment (tool length offset x y z)
+#
+# array.array grows its buffer geometrically, so appending stays amortized
+# O(1) while the data stays contiguous and can be handed to the C drawing
+# and extents code through the buffer interface without any conversion.
+#
+# While segments are appended the store also records runs of consecutive
+# segments sharing a line number, so all segments of one line can be found
+# without scanning the whole store (see line_segments).
+
+import array
+import gcode
+
+class SegmentStore(object):
+    def __init__(self, has_feedrate=True):
+        self.has_feedrate = has_feedrate
+        self.lineno = array.array('i')
+        self.start = array.array('d')
+        self.end = array.array('d')
+        self.feedrate = array.array('d')
+        self.tool = array.array('d')
+        # first segment index of each run, and line number -> run numbers
+        self.run_begin = []
+        self.line_runs = {}
+        self.last_lineno = None
+
+    def new_run(self, lineno):
+        self.last_lineno = lineno
+        self.line_runs.setdefault(lineno, []).append(len(self.run_begin))
+        self.run_begin.append(len(self.lineno))
+
+    def append(self, lineno, start, end, feedrate, tool):
+        if lineno != self.last_lineno: self.new_run(lineno)
+        self.lineno.append(lineno)
+        self.start.extend(start)
+        self.end.extend(end)
+        if self.has_feedrate:
+            self.feedrate.append(feedrate)
+        self.tool.extend(tool)
+
+    def extend_path(self, lineno, start, points, feedrate, tool):
+        """Append the polyline start -> points[0] -> points[1] ...
+
+        All segments share the same line number, feedrate and tool offset,
+        which is the shape of the output of ArcsToSegmentsMixin."""
+        n = len(points)
+        if not n: return
+        if lineno != self.last_lineno: self.new_run(lineno)
+        self.lineno.extend(array.array('i', [lineno]) * n)
+        start_extend = self.start.extend
+        end_extend = self.end.extend
+        start_extend(start)
+        for p in points[:-1]:
+            start_extend(p)
+        for p in points:
+            end_extend(p)
+        if self.has_feedrate:
+            self.feedrate.extend(array.array('d', [feedrate]) * n)
+        self.tool.extend(array.array('d', tool) * n)
+
+    def reindex(self):
+        """Rebuild line_runs after lineno and run_begin were replaced"""
+        self.line_runs = line_runs = {}
+        lineno = self.lineno
+        for r, b in enumerate(self.run_begin):
+            line_runs.setdefault(lineno[b], []).append(r)
+        if self.run_begin: self.last_lineno = lineno[self.run_begin[-1]]
+        else: self.last_lineno = None
+
+    def __len__(self):
+        return len(self.lineno)
+
+    def segment(self, i):
+        """Return the (start, end) points of segment i"""
+        return self.start[9*i:9*i+9], self.end[9*i:9*i+9]
+
+    def line_segments(self, lineno):
+        """Yield the indices of all segments belonging to lineno"""
+        run_begin = self.run_begin
+        nruns = len(run_begin)
+        for r in self.line_runs.get(lineno, ()):
+            if r + 1 < nruns: stop = run_begin[r+1]
+            else: stop = len(self)
+            for i in xrange(run_begin[r], stop):
+                yield i
+
+    def __getitem__(self, i):
+        # compatibility with the historical tuple format:
+        #   (lineno, start, end, [feedrate,] tool)
+        if i < 0: i += len(self)
+        if not 0 <= i < len(self): raise IndexError(i)
+        start, end = self.segment(i)
+        tool = list(self.tool[3*i:3*i+3])
+        if self.has_feedrate:
+            return (self.lineno[i], list(start), list(end),
+                self.feedrate[i], tool)
+        return (self.lineno[i], list(start), list(end), tool)
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+
+    def extents(self):
+        return gcode.calc_segment_extents(self.start, self.end, self.tool)
+
+def calc_extents(*stores):
+    """Combined (min, max, min_notool, max_notool) extents of stores"""
+    mn = [9e99] * 3; mx = [-9e99] * 3
+    mnt = [9e99] * 3; mxt = [-9e99] * 3
+    for s in stores:
+        if not len(s): continue
+        smn, smx, smnt, smxt = s.extents()
+        mn = map(min, mn, smn); mx = map(max, mx, smx)
+        mnt = map(min, mnt, smnt); mxt = map(max, mxt, smxt)
+    return mn, mx, mnt, mxt
@@ -14,28 +14,40 @@
 #    along with this program; if not, write to the Free Software
 #    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
-import rs274.OpenGLTk, Tkinter, signal
+import rs274.OpenGLTk, Tkinter, signal, os
+import numpy
+import minigl
 from minigl import *
 from math import *
 import glnav
 
+def traverse_parts(parts):
+    for p in parts:
+	if hasattr(p, "apply"):
+	    p.apply()
+	if hasattr(p, "capture"):
+	    p.capture()
+	if hasattr(p, "draw"):
+	    p.draw()
+	if hasattr(p, "traverse"):
+	    p.traverse()
+	if hasattr(p, "unapply"):
+	    p.unapply()
+
 class Collection(object):
     def __init__(self, parts):
 	self.parts = parts
 	self.vol = 0
 
     def traverse(self):
-	for p in self.parts:
-	    if hasattr(p, "apply"):
-		p.apply()
-	    if hasattr(p, "capture"):
-		p.capture()
-	    if hasattr(p, "draw"):
-		p.draw()
-	    if hasattr(p, "traverse"):
-		p.traverse()
-	    if hasattr(p, "unapply"):
-		p.unapply()
+	if StaticBatch.compiling:
+	    traverse_parts(self.parts)
+	    return
+	# runs of consecutive static parts are drawn from one display list
+	batches = self.__dict__.get("_batches")
+	if batches is None or batches[0] is not self.parts:
+	    batches = self._batches = (self.parts, batch_parts(self.parts))
+	traverse_parts(batches[1])
 
     def volume(self):
 	if hasattr(self, "vol") and self.vol != 0:
@@ -82,6 +94,9 @@ class HalTranslate(Collection):
 	self.comp = comp
 	self.var = var
 
+    def state(self):
+	return self.comp[self.var]
+
     def apply(self):
 	x, y, z = self.where
 	v = self.comp[self.var]
@@ -100,6 +115,9 @@ class HalRotate(Collection):
 	self.comp = comp
 	self.var = var
 
+    def state(self):
+	return self.comp[self.var]
+
     def apply(self):
 	th, x, y, z = self.where
 	glPushMatrix()
@@ -134,6 +152,11 @@ class Track(Collection):
 	self.position = position
 	self.world2view = world
 	
+    def state(self):
+	# only depends on the captured coordinate systems, which report
+	# their own state
+	return None
+
     def angle_to(self,x,y,z):
 	'''returns polar coordinates in degrees to a point from the origin
 	a rotates around the x-axis; b rotates around the y axis; r is the distance'''
@@ -188,6 +211,11 @@ class CoordsBase(object):
     def coords(self):
 	return self._coords
 
+    def state(self):
+	# subclasses computing their coords from HAL pins are redrawn
+	# when the coords change
+	return self.coords()
+
 # give endpoint X values and radii
 # resulting cylinder is on the X axis
 class CylinderX(CoordsBase):
@@ -630,6 +658,11 @@ class Capture(object):
     def __init__(self):
 	self.t = []
 
+    def state(self):
+	# a Track reads the matrix captured in the previous frame, so a
+	# frame that moves the capture has to be followed by one more
+	return tuple(map(tuple, self.t))
+
     def capture(self):
 	self.t = glGetDoublev(GL_MODELVIEW_MATRIX)
 	
@@ -883,115 +916,272 @@ class Color(Collection):
     def unapply(self):
         glPopAttrib()
 
-class AsciiSTL:
-    def __init__(self, filename=None, data=None):
-        if data is None:
-            data = open(filename, "r")
-        elif isinstance(data, str):
-            data = data.split("\n")
+# parsed meshes are cached next to the source file as interleaved
+# float32 arrays in GL_N3F_V3F layout.  Bump MESH_CACHE_VERSION whenever
+# the parsers or the layout change, so stale caches are not picked up.
+MESH_CACHE_VERSION = 1
+MESH_CACHE_SUFFIX = ".v%d.vismach.npy" % MESH_CACHE_VERSION
+
+def facet_normals(v):
+    """Unit normals of the triangles in v, an array of shape (n, 3, 3)"""
+    n = numpy.cross(v[:,1] - v[:,0], v[:,2] - v[:,0])
+    length = numpy.sqrt((n * n).sum(axis=1))
+    length[length == 0] = 1
+    return n / length[:,None]
+
+def interleave(normals, vertices):
+    """Interleave per vertex normals and vertices, both (n, 3)"""
+    data = numpy.empty((len(vertices), 6), numpy.float32)
+    data[:,:3] = normals
+    data[:,3:] = vertices
+    return data
+
+def parse_stl(data):
+    if len(data) >= 84:
+        count = int(numpy.frombuffer(data, '<u4', 1, 80)[0])
+        if len(data) == 84 + 50 * count:
+            facets = numpy.frombuffer(data, [('n', '<f4', 3),
+                ('v', '<f4', (3, 3)), ('attr', '<u2')], count, 84)
+            n = facets['n'].astype(numpy.float32)
+            v = facets['v'].astype(numpy.float32)
+            return n, v
+
+    words = numpy.array(data.split())
+    i = numpy.flatnonzero(words == 'vertex')
+    v = words[i[:,None] + [1, 2, 3]].astype(numpy.float32).reshape(-1, 3, 3)
+    i = numpy.flatnonzero(words == 'normal')
+    if len(i) == len(v):
+        n = words[i[:,None] + [1, 2, 3]].astype(numpy.float32)
+    else:
+        n = numpy.zeros((len(v), 3), numpy.float32)
+    return n, v
+
+def parse_obj(data):
+    v = []
+    vn = []
+    faces = []
+    for line in data.splitlines():
+        w = line.split()
+        if not w: continue
+        if w[0] == 'v': v.append(w[1:4])
+        elif w[0] == 'vn': vn.append(w[1:4])
+        elif w[0] == 'f': faces.append(w[1:])
+    v = numpy.array(v, numpy.float32).reshape(-1, 3)
+    vn = numpy.array(vn, numpy.float32).reshape(-1, 3)
+
+    def index(i, count):
+        i = int(i)
+        if i < 0: return count + i
+        return i - 1
+
+    # triangulate polygons as fans, -1 marks a missing normal
+    vi = []
+    ni = []
+    for f in faces:
+        f = [w.split("/") for w in f]
+        fv = [index(w[0], len(v)) for w in f]
+        fn = [index(w[2], len(vn)) if len(w) > 2 and w[2] else -1 for w in f]
+        for j in range(1, len(f) - 1):
+            vi.extend((fv[0], fv[j], fv[j+1]))
+            ni.extend((fn[0], fn[j], fn[j+1]))
+    vertices = v[numpy.array(vi, int)].reshape(-1, 3, 3)
+    ni = numpy.array(ni, int)
+    normals = numpy.repeat(facet_normals(vertices), 3, axis=0)
+    has_normal = ni >= 0
+    normals[has_normal] = vn[ni[has_normal]]
+    return normals, vertices.reshape(-1, 3)
+
+class TriangleMesh(object):
+    """Triangles drawn from a buffer object.
+
+    data is a float32 array of interleaved normals and vertices, each
+    row holding nx ny nz x y z."""
+    def __init__(self, data):
+        self.data = data
+        self.count = len(data)
+        self.buf = None
         self.list = None
-        t = []
-        n = [0,0,0]
-        self.d = d = []
-        for line in data:
-            if line.find("normal") != -1:
-                line = line.split()
-                x, y, z = map(float, line[-3:])
-                n = [x,y,z] 
-            elif line.find("vertex") != -1:
-                line = line.split()
-                x, y, z = map(float, line[-3:])
-                t.append([x,y,z])
-                if len(t) == 3:
-                    if n == [0,0,0]:
-                        dx1 = t[1][0] - t[0][0]
-                        dy1 = t[1][1] - t[0][1]
-                        dz1 = t[1][2] - t[0][2]
-                        dx2 = t[2][0] - t[0][0]
-                        dy2 = t[2][1] - t[0][1]
-                        dz2 = t[2][2] - t[0][2]
-                        n = [y1*z2 - y2*z1, z1*x2 - z2*x1, y1*x2 - y2*x1]
-                    d.append((n, t))
-                    t = []
-                    n = [0,0,0]
 
-    def draw(self):
-        if self.list is None:
-            # OpenGL isn't ready yet in __init__ so the display list
-            # is created during the first draw
+    @staticmethod
+    def load(filename, parse):
+        """Parse filename, or load the cached result of an earlier parse"""
+        cache = filename + MESH_CACHE_SUFFIX
+        try:
+            if os.stat(cache).st_mtime >= os.stat(filename).st_mtime:
+                data = numpy.load(cache)
+                if (data.dtype == numpy.float32 and data.ndim == 2
+                        and data.shape[1] == 6):
+                    return data
+        except (OSError, IOError, ValueError):
+            pass
+        data = parse(open(filename, "rb").read())
+        try:
+            numpy.save(cache, data)
+        except (OSError, IOError):
+            pass
+        return data
+
+    def upload(self):
+        # OpenGL isn't ready yet in __init__ so the buffer is created
+        # during the first draw
+        try:
+            self.buf, = glGenBuffers(1)
+            glBindBuffer(GL_ARRAY_BUFFER, self.buf)
+            glBufferData(GL_ARRAY_BUFFER, self.data, GL_STATIC_DRAW)
+            glBindBuffer(GL_ARRAY_BUFFER, 0)
+        except minigl.error:
+            # no buffer objects, fall back to a display list
+            self.buf = None
             self.list = glGenLists(1)
-            glNewList(self.list, GL_COMPILE_AND_EXECUTE)
+            glNewList(self.list, GL_COMPILE)
             glBegin(GL_TRIANGLES)
-            for n, t in self.d:
-                glNormal3f(*n)
-                glVertex3f(*t[0])
-                glVertex3f(*t[1])
-                glVertex3f(*t[2])
+            for nx, ny, nz, x, y, z in self.data.tolist():
+                glNormal3f(nx, ny, nz)
+                glVertex3f(x, y, z)
             glEnd()
             glEndList()
-            del self.d
-        else:
-            glCallList(self.list)
+        del self.data
 
-class AsciiOBJ:
+    def draw(self):
+        if self.buf is None and self.list is None:
+            self.upload()
+        if self.list is not None:
+            glCallList(self.list)
+            return
+        glBindBuffer(GL_ARRAY_BUFFER, self.buf)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_NORMAL_ARRAY)
+        glNormalPointer(GL_FLOAT, 24, 0)
+        glVertexPointer(3, GL_FLOAT, 24, 12)
+        glDrawArrays(GL_TRIANGLES, 0, self.count)
+        glDisableClientState(GL_NORMAL_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+class AsciiSTL(TriangleMesh):
+    """STL mesh, despite the name binary files are accepted too"""
+    def __init__(self, filename=None, data=None):
+        if data is None:
+            data = self.load(filename, self.parse)
+        else:
+            data = self.parse(data)
+        TriangleMesh.__init__(self, data)
+
+    @staticmethod
+    def parse(data):
+        n, v = parse_stl(data)
+        # facets without a normal get the one of their winding
+        missing = ~n.any(axis=1)
+        n[missing] = facet_normals(v[missing])
+        return interleave(numpy.repeat(n, 3, axis=0), v.reshape(-1, 3))
+
+class AsciiOBJ(TriangleMesh):
     def __init__(self, filename=None, data=None):
         if data is None:
-            data = open(filename, "r")
-        elif isinstance(data, str):
-            data = data.split("\n")
-
-        self.v = v = []
-        self.vn = vn = []
-        self.f = f = []
-        for line in data:
-            if line.startswith("#"): continue
-            if line.startswith("vn"):
-                vn.append([float(w) for w in line.split()[1:]])
-            elif line.startswith("v"):
-                v.append([float(w) for w in line.split()[1:]])
-            elif line.startswith("f"):
-                f.append(self.parse_face(line))
-
-#        print v[:5]
-#        print vn[:5]
-#        print f[:5]
+            data = self.load(filename, self.parse)
+        else:
+            data = self.parse(data)
+        TriangleMesh.__init__(self, data)
 
-        self.list = None
+    @staticmethod
+    def parse(data):
+        return interleave(*parse_obj(data))
 
+    def draw(self):
+        glDisable(GL_CULL_FACE)
+        TriangleMesh.draw(self)
 
-    def parse_int(self, i):
-        if i == '': return None
-        return int(i)
 
-    def parse_slash(self, word):
-        return [self.parse_int(i) for i in word.split("/")]
+# parts of exactly these types never change once built, subclasses may
+# draw from HAL pins and are left alone
+STATIC_TYPES = set([Collection, Translate, Scale, Rotate, Color,
+    CylinderX, CylinderY, CylinderZ, Sphere, TriangleXY, TriangleXZ,
+    TriangleYZ, ArcX, Box, BoxCentered, BoxCenteredXY,
+    TriangleMesh, AsciiSTL, AsciiOBJ])
 
-    def parse_face(self, line):
-        return [self.parse_slash(w) for w in line.split()[1:]]
+def is_static(part):
+    if type(part) not in STATIC_TYPES:
+	return False
+    return all(is_static(p) for p in getattr(part, "parts", ()))
 
-    def draw(self):
-        if self.list is None:
-            # OpenGL isn't ready yet in __init__ so the display list
-            # is created during the first draw
-            self.list = glGenLists(1)
-            glNewList(self.list, GL_COMPILE)
-            glDisable(GL_CULL_FACE)
-            glBegin(GL_TRIANGLES)
-            #print "obj", len(self.f)
-            for f in self.f:
-                for v, t, n in f:
-                    if n:
-                        glNormal3f(*self.vn[n-1])
-                    glVertex3f(*self.v[v-1])
-            glEnd()
-            glEndList()
-            del self.v
-            del self.vn
-            del self.f
-        glCallList(self.list)
+def prepare(part):
+    if hasattr(part, "upload") and getattr(part, "data", None) is not None:
+	part.upload()
+    for p in getattr(part, "parts", ()):
+	prepare(p)
 
+class StaticBatch(object):
+    """Consecutive static parts drawn from a single display list"""
+    compiling = False
 
-def main(model, tool, work, size=10, hud=0, rotation_vectors=None, lat=0, lon=0):
+    def __init__(self, parts):
+	self.parts = parts
+	self.list = None
+
+    def draw(self):
+	if self.list is None:
+	    # buffer objects and display lists of the parts have to exist
+	    # before compiling, display lists can't be nested
+	    for p in self.parts:
+		prepare(p)
+	    self.list = glGenLists(1)
+	    glNewList(self.list, GL_COMPILE)
+	    StaticBatch.compiling = True
+	    try:
+		traverse_parts(self.parts)
+	    finally:
+		StaticBatch.compiling = False
+		glEndList()
+	glCallList(self.list)
+
+def batch_parts(parts):
+    result = []
+    run = []
+    for p in parts:
+	if is_static(p):
+	    run.append(p)
+	    continue
+	if run:
+	    result.append(StaticBatch(run))
+	    run = []
+	result.append(p)
+    if run:
+	result.append(StaticBatch(run))
+    return result
+
+class SceneState(object):
+    """Tells whether the model has to be redrawn.
+
+    Every part that is not static must report the values it is drawn
+    from with state(), otherwise the model is redrawn on every update."""
+    def __init__(self, model, hud=None):
+	self.hud = hud
+	self.sources = []
+	self.always = False
+	self.collect(model)
+	self.last = None
+
+    def collect(self, part):
+	if is_static(part):
+	    return
+	if hasattr(part, "state"):
+	    self.sources.append(part.state)
+	elif type(part) not in STATIC_TYPES:
+	    self.always = True
+	for p in getattr(part, "parts", ()):
+	    self.collect(p)
+
+    def changed(self):
+	state = [source() for source in self.sources]
+	hud = self.hud
+	if hud is not None and hasattr(hud, "strs"):
+	    state.append((hud.showme, tuple(hud.strs), tuple(hud.messages)))
+	if not self.always and state == self.last:
+	    return False
+	self.last = state
+	return True
+
+def main(model, tool, work, size=10, hud=0, rotation_vectors=None, lat=0, lon=0, interval=100):
     app = Tkinter.Tk()
 
     t = O(app, double=1, depth=1)
@@ -1025,9 +1215,13 @@ def main(model, tool, work, size=10, hud=0, rotation_vectors=None, lat=0, lon=0)
 
     t.pack(fill="both", expand=1)
 
+    # redraw only when a HAL pin moved the model, window and view
+    # changes are redrawn by the widget itself
+    scene = SceneState(t.model, t.hud)
     def update():
-	t.tkRedraw()
-	t.after(100, update)
+	if scene.changed():
+	    t.tkRedraw()
+	t.after(interval, update)
     update()
 
     def quit(*args):
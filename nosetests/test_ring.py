@@ -57,5 +57,51 @@ def test_ring_read():
         r1.shift()
     assert nr > 0
 
+def test_buffer_write():
+    r2 = hal.Ring("ring2", size=4096)
+    assert r2.write(bytearray("abc"))
+    assert r2.write(memoryview("defg"))
+    assert r2.read().tobytes() == "abc"
+    r2.shift()
+    assert r2.read().tobytes() == "defg"
+    r2.shift()
+
+def test_reserve_commit():
+    r3 = hal.Ring("ring3", size=4096)
+    m = r3.reserve(8)
+    m[0:5] = "hello"
+    r3.commit(5)
+    assert r3.read().tobytes() == "hello"
+    r3.shift()
+    assert r3.read() is None
+
+def test_multiframe_reserve_commit():
+    mr = hal.MultiframeRing(hal.Ring("ring5", size=4096))
+    m = mr.reserve(4)
+    m[0:3] = "abc"
+    try:
+        mr.commit(5)
+        raise "should not happen"
+    except ValueError:
+        pass
+    mr.commit(3)
+    mr.flush()
+    assert [f.data.tobytes() for f in mr.read()] == ["abc"]
+    mr.shift()
+
+def test_drain():
+    r4 = hal.Ring("ring4", size=4096)
+    for rec in ["a", "bc", "", "def"]:
+        r4.write(rec)
+    data, offsets = r4.drain(max_records=3)
+    assert list(offsets) == [0, 1, 3, 3]
+    assert data == bytearray("abc")
+    data, offsets = r4.drain()
+    assert list(offsets) == [0, 3]
+    assert data == bytearray("def")
+    assert not r4.wait(timeout=0.05)
+    data, offsets = r4.drain(timeout=0.05)
+    assert len(data) == 0 and list(offsets) == [0]
+
 (lambda s=__import__('signal'):
      s.signal(s.SIGTERM, s.SIG_IGN))()
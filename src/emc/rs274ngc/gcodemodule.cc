@@ -832,6 +832,61 @@ static PyObject *rs274_calc_extents(PyObject *self, PyObject *args) {
         min_xt, min_yt, min_zt,  max_xt, max_yt, max_zt);
 }
 
+static int get_double_buffer(PyObject *o, const double **data, Py_ssize_t *count) {
+    const void *vdata;
+    Py_ssize_t len;
+    if(PyObject_AsReadBuffer(o, &vdata, &len) < 0) return -1;
+    *data = (const double *)vdata;
+    *count = len / sizeof(double);
+    return 0;
+}
+
+static PyObject *rs274_calc_segment_extents(PyObject *self, PyObject *args) {
+    PyObject *ostart, *oend, *otool;
+    const double *start, *end, *tool;
+    Py_ssize_t nstart, nend, ntool;
+    double min_x = 9e99, min_y = 9e99, min_z = 9e99,
+           min_xt = 9e99, min_yt = 9e99, min_zt = 9e99,
+           max_x = -9e99, max_y = -9e99, max_z = -9e99,
+           max_xt = -9e99, max_yt = -9e99, max_zt = -9e99;
+
+    if(!PyArg_ParseTuple(args, "OOO:calc_segment_extents",
+                &ostart, &oend, &otool))
+        return NULL;
+    if(get_double_buffer(ostart, &start, &nstart) < 0
+            || get_double_buffer(oend, &end, &nend) < 0
+            || get_double_buffer(otool, &tool, &ntool) < 0)
+        return NULL;
+    if(nstart != nend || nstart % 9 || ntool * 3 != nstart) {
+        PyErr_SetString(PyExc_ValueError,
+            "calc_segment_extents: column lengths do not match");
+        return NULL;
+    }
+
+    for(Py_ssize_t i=0; i<nstart/9; i++) {
+        const double *pts[2] = { start + 9*i, end + 9*i };
+        const double *t = tool + 3*i;
+        for(int k=0; k<2; k++) {
+            const double *p = pts[k];
+            max_x = std::max(max_x, p[0]);
+            max_y = std::max(max_y, p[1]);
+            max_z = std::max(max_z, p[2]);
+            min_x = std::min(min_x, p[0]);
+            min_y = std::min(min_y, p[1]);
+            min_z = std::min(min_z, p[2]);
+            max_xt = std::max(max_xt, p[0]+t[0]);
+            max_yt = std::max(max_yt, p[1]+t[1]);
+            max_zt = std::max(max_zt, p[2]+t[2]);
+            min_xt = std::min(min_xt, p[0]+t[0]);
+            min_yt = std::min(min_yt, p[1]+t[1]);
+            min_zt = std::min(min_zt, p[2]+t[2]);
+        }
+    }
+    return Py_BuildValue("[ddd][ddd][ddd][ddd]",
+        min_x, min_y, min_z,  max_x, max_y, max_z,
+        min_xt, min_yt, min_zt,  max_xt, max_yt, max_zt);
+}
+
 #if PY_VERSION_HEX < 0x02050000
 #define PyObject_GetAttrString(o,s) \
     PyObject_GetAttrString((o),const_cast<char*>((s)))
@@ -995,6 +1050,8 @@ static PyMethodDef gcode_methods[] = {
         "Convert a numeric error to a string"},
     {"calc_extents", (PyCFunction)rs274_calc_extents, METH_VARARGS,
         "Calculate information about extents of gcode"},
+    {"calc_segment_extents", (PyCFunction)rs274_calc_segment_extents, METH_VARARGS,
+        "Calculate extents of preview segments stored in flat double arrays"},
     {"arc_to_segments", (PyCFunction)rs274_arc_to_segments, METH_VARARGS,
         "Convert an arc to straight segments"},
     {NULL}
@@ -38,6 +38,12 @@ using namespace google::protobuf;
 static zsock_t *z_preview, *z_status;
 static const char *istat_topic = "status";
 static int batch_limit = 100;
+static int abort_interval = 1000; // ms between check_abort callbacks
+static int flush_interval = 0;   // ms, send a partial batch after this time,
+                                 // checked on each message and between lines
+static int total_lines = 0;      // > 0: add progress reports to each batch
+static int progress_line = 0;    // last line read by the interpreter
+static struct timeval last_flush;
 static const char *p_client = "preview"; //NULL; // single client for now
 
 static machinetalk::Container istat, output;
@@ -69,19 +75,53 @@ static void publish_istat(machinetalk::InterpreterStateType state)
     }
 }
 
-// send off a preview frame if sufficent preview frames accumulated, or flushing
-// is is assumed a repeated submessage preview was just added
-static void send_preview(const char *client, bool flush = false)
+static long ms_since(const struct timeval *then)
+{
+    struct timeval now;
+    gettimeofday(&now, NULL);
+    return (now.tv_sec - then->tv_sec) * 1000 +
+	(now.tv_usec - then->tv_usec) / 1000;
+}
+
+// append a progress report if enabled
+static void add_progress()
+{
+    if (total_lines > 0) {
+	machinetalk::Preview *p = output.add_preview();
+	p->set_type(machinetalk::PV_PREVIEW_PROGRESS);
+	p->set_line_number(progress_line);
+	p->set_total_lines(total_lines);
+    }
+}
+
+// publish the batched preview frames, send_pbcontainer clears output
+static void flush_preview(const char *client)
 {
     int retval;
+
+    gettimeofday(&last_flush, NULL);
+    n_containers++;
+    n_bytes += output.ByteSize();
+    output.set_type(machinetalk::MT_PREVIEW);
+    retval = send_pbcontainer(client, output, z_preview);
+    assert(retval == 0);
+}
+
+static bool flush_due()
+{
+    return (flush_interval > 0) && (ms_since(&last_flush) >= flush_interval);
+}
+
+// send off a preview frame if sufficent preview frames accumulated or
+// the flush interval expired
+// is is assumed a repeated submessage preview was just added
+static void send_preview(const char *client)
+{
     n_messages++;
 
-    if ((output.preview_size() > batch_limit) || flush) {
-	n_containers++;
-	n_bytes += output.ByteSize();
-	output.set_type(machinetalk::MT_PREVIEW);
-	retval = send_pbcontainer(client, output, z_preview);
-	assert(retval == 0);
+    if ((output.preview_size() > batch_limit) || flush_due()) {
+	add_progress();
+	flush_preview(client);
     }
 }
 
@@ -93,12 +133,15 @@ static void preview_start()
     send_preview(p_client);
 }
 
-// send preview end message
+// send preview end message together with whatever is still batched
+// the final progress report precedes it, nothing follows it
 static void preview_end()
 {
+    add_progress();
     machinetalk::Preview *p = output.add_preview();
     p->set_type(machinetalk::PV_PREVIEW_END);
-    send_preview(p_client);
+    n_messages++;
+    flush_preview(p_client);
 }
 
 static int z_init(void)
@@ -1011,8 +1054,7 @@ static PyObject *parse_file(PyObject *self, PyObject *args) {
     char *f;
     char *unitcode=0, *initcode=0, *interpname=0;
     int error_line_offset = 0;
-    struct timeval t0, t1;
-    int wait = 1;
+    struct timeval t0;
     if(!PyArg_ParseTuple(args, "sO|sss", &f, &callback, &unitcode, &initcode, &interpname))
         return NULL;
 
@@ -1029,6 +1071,8 @@ static PyObject *parse_file(PyObject *self, PyObject *args) {
         USER_DEFINED_FUNCTION[i] = user_defined_function;
 
     gettimeofday(&t0, NULL);
+    last_flush = t0;
+    progress_line = 0;
 
     interp_error = 0;
     last_sequence_number = -1;
@@ -1064,10 +1108,23 @@ static PyObject *parse_file(PyObject *self, PyObject *args) {
     while(!interp_error && RESULT_OK) {
         error_line_offset = 1;
         result = interp_new.read();
-        gettimeofday(&t1, NULL);
-        if(t1.tv_sec > t0.tv_sec + wait) {
-            if(check_abort()) return NULL;
-            t0 = t1;
+        progress_line = interp_new.sequence_number();
+        if(ms_since(&t0) >= abort_interval) {
+            if(check_abort()) {
+                // drop what is still batched and terminate the stream
+                output.Clear();
+                preview_end();
+                publish_istat(machinetalk::INTERP_IDLE);
+                if(pinterp) pinterp->close();
+                return NULL;
+            }
+            // a partial batch would otherwise wait for the next preview
+            // message, which may be far off in code that does not move
+            if(output.preview_size() > 0 && flush_due()) {
+                add_progress();
+                flush_preview(p_client);
+            }
+            gettimeofday(&t0, NULL);
         }
         if(!RESULT_OK) break;
         error_line_offset = 0;
@@ -1076,7 +1133,6 @@ static PyObject *parse_file(PyObject *self, PyObject *args) {
 
 out_error:
     preview_end();
-    send_preview(p_client, true);
     publish_istat(machinetalk::INTERP_IDLE);
 
     if(pinterp) pinterp->close();
@@ -1327,6 +1383,23 @@ static PyObject *rs274_arc_to_segments(PyObject *self, PyObject *args) {
     return segs;
 }
 
+static PyObject *stream_config(PyObject *self, PyObject *args) {
+    int batch = batch_limit, interval = flush_interval, lines = total_lines;
+    if(!PyArg_ParseTuple(args, "|iii:stream_config", &batch, &interval, &lines))
+        return NULL;
+    if(batch < 0 || interval < 0) {
+        PyErr_SetString(PyExc_ValueError, "stream_config: negative value");
+        return NULL;
+    }
+    batch_limit = batch;
+    flush_interval = interval;
+    total_lines = lines;
+    // with a flush interval, aborts are noticed at least as fast as
+    // the stream advances
+    abort_interval = (interval > 0 && interval < 1000) ? interval : 1000;
+    Py_RETURN_NONE;
+}
+
 static PyObject *bind_sockets(PyObject *self, PyObject *args) {
     char *preview_uri, *status_uri;
     if(!PyArg_ParseTuple(args, "ss", &preview_uri, &status_uri))
@@ -1360,6 +1433,8 @@ static PyMethodDef gcode_methods[] = {
     {"arc_to_segments", (PyCFunction)rs274_arc_to_segments, METH_VARARGS,
         "Convert an arc to straight segments"},
     {"bind", (PyCFunction)bind_sockets, METH_VARARGS, "pass an IP address and return a tuple (status uri, preview uri)"},
+    {"stream_config", (PyCFunction)stream_config, METH_VARARGS,
+        "stream_config(batch_limit, flush_interval_ms, total_lines): configure preview batching and progress reports"},
 
     {NULL}
 };
@@ -32,6 +32,7 @@
 #include "rcs_print.hh"
 
 #include <cmath>
+#include <vector>
 
 #ifndef T_BOOL
 // The C++ standard probably doesn't specify the amount of storage for a 'bool',
@@ -1664,6 +1665,41 @@ static void line9b(const double p1[9], const double p2[9], const char *geometry)
     }
 }
 
+static void push_vertex9(std::vector<float> &v, const double pt[9], const char *geometry) {
+    double p[3];
+    vertex9(pt, p, geometry);
+    v.push_back(p[0]);
+    v.push_back(p[1]);
+    v.push_back(p[2]);
+}
+
+// same subdivision as line9, but appending GL_LINES vertex pairs to v
+static void line9_vertices(std::vector<float> &v, const double p1[9], const double p2[9], const char *geometry) {
+    if(p1[3] != p2[3] || p1[4] != p2[4] || p1[5] != p2[5]) {
+        double dc = max3(
+            rtapi_fabs(p2[3] - p1[3]),
+            rtapi_fabs(p2[4] - p1[4]),
+            rtapi_fabs(p2[5] - p1[5]));
+        int st = (int)rtapi_ceil(max(10, dc/10));
+        int i;
+        double pl[9];
+
+        memcpy(pl, p1, sizeof(pl));
+        for(i=1; i<=st; i++) {
+            double t = i * 1.0 / st;
+            double v1 = 1.0 - t;
+            double pt[9];
+            for(int j=0; j<9; j++) { pt[j] = t * p2[j] + v1 * p1[j]; }
+            push_vertex9(v, pl, geometry);
+            push_vertex9(v, pt, geometry);
+            memcpy(pl, pt, sizeof(pl));
+        }
+    } else {
+        push_vertex9(v, p1, geometry);
+        push_vertex9(v, p2, geometry);
+    }
+}
+
 static PyObject *pyline9(PyObject *s, PyObject *o) {
     double pt1[9], pt2[9];
     const char *geometry;
@@ -1745,6 +1781,105 @@ static PyObject *pydraw_lines(PyObject *s, PyObject *o) {
     return Py_None;
 }
 
+static PyObject *pydraw_segments(PyObject *s, PyObject *o) {
+    PyObject *olineno, *ostart, *oend;
+    const void *vlineno, *vstart, *vend;
+    Py_ssize_t llineno, lstart, lend;
+    int for_selection = 0;
+    int first = 1;
+    int nl = -1;
+    const double *pl = NULL;
+    char *geometry;
+
+    if(!PyArg_ParseTuple(o, "sOOO|i:draw_segments",
+			    &geometry, &olineno, &ostart, &oend, &for_selection))
+        return NULL;
+    if(PyObject_AsReadBuffer(olineno, &vlineno, &llineno) < 0
+            || PyObject_AsReadBuffer(ostart, &vstart, &lstart) < 0
+            || PyObject_AsReadBuffer(oend, &vend, &lend) < 0)
+        return NULL;
+
+    Py_ssize_t count = llineno / sizeof(int);
+    if(lstart != lend || lstart != count * 9 * (Py_ssize_t)sizeof(double)) {
+        PyErr_SetString(PyExc_ValueError,
+            "draw_segments: column lengths do not match");
+        return NULL;
+    }
+
+    const int *lineno = (const int *)vlineno;
+    const double *start = (const double *)vstart;
+    const double *end = (const double *)vend;
+
+    for(Py_ssize_t i=0; i<count; i++) {
+        const double *p1 = start + 9*i, *p2 = end + 9*i;
+        int n = lineno[i];
+        if(first || memcmp(p1, pl, 9*sizeof(double))
+                || (for_selection && n != nl)) {
+            if(!first) glEnd();
+            if(for_selection && n != nl) {
+                glLoadName(n);
+                nl = n;
+            }
+            glBegin(GL_LINE_STRIP);
+            glvertex9(p1, geometry);
+            first = 0;
+        }
+        line9(p1, p2, geometry);
+        pl = p2;
+    }
+
+    if(!first) glEnd();
+
+    Py_RETURN_NONE;
+}
+
+static PyObject *pysegment_vertices(PyObject *s, PyObject *o) {
+    PyObject *ostart, *oend;
+    const void *vstart, *vend;
+    Py_ssize_t lstart, lend;
+    char *geometry;
+    int with_counts = 0;
+
+    if(!PyArg_ParseTuple(o, "sOO|i:segment_vertices",
+			    &geometry, &ostart, &oend, &with_counts))
+        return NULL;
+    if(PyObject_AsReadBuffer(ostart, &vstart, &lstart) < 0
+            || PyObject_AsReadBuffer(oend, &vend, &lend) < 0)
+        return NULL;
+    if(lstart != lend || lstart % (9 * sizeof(double))) {
+        PyErr_SetString(PyExc_ValueError,
+            "segment_vertices: column lengths do not match");
+        return NULL;
+    }
+
+    Py_ssize_t count = lstart / (9 * sizeof(double));
+    const double *start = (const double *)vstart;
+    const double *end = (const double *)vend;
+    std::vector<float> v;
+    std::vector<int> counts;
+    v.reserve(count * 6);
+    if(with_counts) counts.reserve(count);
+
+    for(Py_ssize_t i=0; i<count; i++) {
+        size_t before = v.size();
+        line9_vertices(v, start + 9*i, end + 9*i, geometry);
+        if(with_counts) counts.push_back((v.size() - before) / 3);
+    }
+
+    PyObject *vertices;
+    if(v.empty()) vertices = PyString_FromStringAndSize("", 0);
+    else vertices = PyString_FromStringAndSize((const char *)&v[0],
+            v.size() * sizeof(float));
+    if(!with_counts || !vertices) return vertices;
+
+    PyObject *ocounts;
+    if(counts.empty()) ocounts = PyString_FromStringAndSize("", 0);
+    else ocounts = PyString_FromStringAndSize((const char *)&counts[0],
+            counts.size() * sizeof(int));
+    if(!ocounts) { Py_DECREF(vertices); return NULL; }
+    return Py_BuildValue("(NN)", vertices, ocounts);
+}
+
 static PyObject *pydraw_dwells(PyObject *s, PyObject *o) {
     PyListObject *li;
     int for_selection = 0, is_lathe = 0, i, n;
@@ -2182,6 +2317,8 @@ static PyTypeObject PositionLoggerType = {
 static PyMethodDef emc_methods[] = {
 #define METH(name, doc) { #name, (PyCFunction) py##name, METH_VARARGS, doc }
 METH(draw_lines, "Draw a bunch of lines in the 'rs274.glcanon' format"),
+METH(draw_segments, "Draw lines stored in the columnar 'rs274.segments' format"),
+METH(segment_vertices, "Convert columnar 'rs274.segments' lines to a GL_LINES float vertex array; with a true 4th argument also return the int vertex count of each segment"),
 METH(draw_dwells, "Draw a bunch of dwell positions in the 'rs274.glcanon' format"),
 METH(line9, "Draw a single line in the 'rs274.glcanon' format; assumes glBegin(GL_LINES)"),
 METH(vertex9, "Get the 3d location for a 9d point"),
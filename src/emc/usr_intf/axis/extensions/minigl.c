@@ -150,6 +150,9 @@ GLCALL3V(glStencilFunc, "iii", int, int, int);
 GLCALL3V(glStencilOp, "iii", int, int, int);
 GLCALL1V(glDrawBuffer, "i", int)
 GLCALL3V(glDrawArrays, "iii", int, int, int)
+GLCALL2V(glBindBuffer, "ii", int, int)
+GLCALL1V(glEnableClientState, "i", int)
+GLCALL1V(glDisableClientState, "i", int)
 GLCALL1V(glMatrixMode, "i", int)
 GLCALL6V(glOrtho, "ffffff", float, float, float, float, float, float);
 GLCALL3V(glTranslatef, "fff", float, float, float);
@@ -207,6 +210,87 @@ static PyObject *pyglGenLists(PyObject *s, PyObject *o) {
     return PyInt_FromLong(glGenLists(range));
 }
 
+static PyObject *pyglGenBuffers(PyObject *s, PyObject *o) {
+    int n, i;
+    GLuint *buffers;
+    PyObject *r;
+    if(!PyArg_ParseTuple(o, "i:glGenBuffers", &n)) return NULL;
+    if(n < 0) {
+        PyErr_SetString(PyExc_ValueError, "glGenBuffers: negative count");
+        return NULL;
+    }
+    buffers = malloc(sizeof(GLuint) * (n ? n : 1));
+    if(!buffers) return PyErr_NoMemory();
+    glGenBuffers(n, buffers);
+    r = PyList_New(n);
+    for(i=0; i<n; i++)
+        PyList_SET_ITEM(r, i, PyInt_FromLong(buffers[i]));
+    free(buffers);
+    CHECK_ERROR;
+    return r;
+}
+
+static PyObject *pyglDeleteBuffers(PyObject *s, PyObject *o) {
+    PyObject *seq;
+    int n, i;
+    GLuint *buffers;
+    if(!PyArg_ParseTuple(o, "O:glDeleteBuffers", &seq)) return NULL;
+    seq = PySequence_Fast(seq, "glDeleteBuffers: expected a sequence");
+    if(!seq) return NULL;
+    n = PySequence_Fast_GET_SIZE(seq);
+    buffers = malloc(sizeof(GLuint) * (n ? n : 1));
+    if(!buffers) { Py_DECREF(seq); return PyErr_NoMemory(); }
+    for(i=0; i<n; i++)
+        buffers[i] = PyInt_AsLong(PySequence_Fast_GET_ITEM(seq, i));
+    Py_DECREF(seq);
+    if(PyErr_Occurred()) { free(buffers); return NULL; }
+    glDeleteBuffers(n, buffers);
+    free(buffers);
+    CHECK_ERROR;
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+static PyObject *pyglBufferData(PyObject *s, PyObject *o) {
+    int target, usage;
+    PyObject *data;
+    const void *buf;
+    Py_ssize_t size;
+    if(!PyArg_ParseTuple(o, "iOi:glBufferData", &target, &data, &usage))
+        return NULL;
+    if(PyObject_AsReadBuffer(data, &buf, &size) < 0) return NULL;
+    glBufferData(target, size, buf, usage);
+    CHECK_ERROR;
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+static PyObject *pyglVertexPointer(PyObject *s, PyObject *o) {
+    // only buffer object offsets are supported; client memory passed
+    // from python would not outlive the call
+    int size, type, stride;
+    long offset;
+    if(!PyArg_ParseTuple(o, "iiil:glVertexPointer",
+                &size, &type, &stride, &offset))
+        return NULL;
+    glVertexPointer(size, type, stride, (const GLvoid *)offset);
+    CHECK_ERROR;
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+static PyObject *pyglNormalPointer(PyObject *s, PyObject *o) {
+    // only buffer object offsets are supported, see glVertexPointer
+    int type, stride;
+    long offset;
+    if(!PyArg_ParseTuple(o, "iil:glNormalPointer", &type, &stride, &offset))
+        return NULL;
+    glNormalPointer(type, stride, (const GLvoid *)offset);
+    CHECK_ERROR;
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
 static PyObject *pyglGetDoublev(PyObject *s, PyObject *o) {
     int what;
     if(!PyArg_ParseTuple(o, "i:glGetDoublev", &what)) return NULL;
@@ -737,6 +821,14 @@ METH(glStencilOp, "specify the stencil buffer operation"),
 METH(glFlush, "force execution of GL commands in finite time"),
 METH(glDrawBuffer, "specify which color buffers are to be drawn into"),
 METH(glDrawArrays, "render primitives from array data"),
+METH(glGenBuffers, "generate buffer object names"),
+METH(glDeleteBuffers, "delete named buffer objects"),
+METH(glBindBuffer, "bind a named buffer object"),
+METH(glBufferData, "creates and initializes a buffer object's data store"),
+METH(glVertexPointer, "define an array of vertex data in the bound buffer object"),
+METH(glNormalPointer, "define an array of normals in the bound buffer object"),
+METH(glEnableClientState, "enable or disable client-side capability"),
+METH(glDisableClientState, "enable or disable client-side capability"),
 METH(glDrawPixels, "write a block of pixels to the frame buffer"),
 METH(glMatrixMode, "specify which matrix is the current matrix"),
 METH(glOrtho, "multiply the current matrix with an orthographic matrix"),
@@ -870,5 +962,10 @@ void initminigl(void) {
     CONST(GL_UNPACK_ALIGNMENT);
     CONST(GL_LUMINANCE);
     CONST(GL_UNSIGNED_BYTE);
+    CONST(GL_FLOAT);
+    CONST(GL_ARRAY_BUFFER);
+    CONST(GL_STATIC_DRAW);
+    CONST(GL_VERTEX_ARRAY);
+    CONST(GL_NORMAL_ARRAY);
 
 }
@@ -60,6 +60,7 @@ sys.setdlopenflags(old_flags)
 from rs274.OpenGLTk import *
 from rs274.interpret import StatMixin
 from rs274.glcanon import GLCanon, GlCanonDraw
+from rs274.previewcache import PreviewCache
 from hershey import Hershey
 from propertywindow import properties
 import rs274.options
@@ -442,6 +443,8 @@ class MyOpengl(GlCanonDraw, Opengl):
     def get_show_commanded(self): return vars.display_type.get()
     def get_show_rapids(self): return vars.show_rapids.get()
     def get_geometry(self): return geometry
+    def get_use_vbo(self): return preview_vbo
+    def get_use_cpu_pick(self): return preview_cpu_pick
     def is_foam(self): return foam
     def get_num_joints(self): return num_joints
     def get_program_alpha(self): return vars.program_alpha.get()
@@ -2481,8 +2484,9 @@ class TclCommands(nf.TclCommands):
         c.wait_complete()
         ensure_mode(linuxcnc.MODE_MANUAL)
         s.poll()
+        if not o.update_offsets():
+            reload_file(False)
         o.tkRedraw()
-        reload_file(False)
         
     def touch_off(event=None, new_axis_value = None):
         global system
@@ -2521,8 +2525,10 @@ class TclCommands(nf.TclCommands):
 
         ensure_mode(linuxcnc.MODE_MANUAL)
         s.poll()
+        # tool offsets change the tool table the preview was made with
+        if system.split()[0] == "T" or not o.update_offsets():
+            reload_file(False)
         o.tkRedraw()
-        reload_file(False)
 
     def set_axis_offset(event=None):
         commands.touch_off(new_axis_value=0.)
@@ -3050,6 +3056,8 @@ vars.display_type.set(inifile.find("DISPLAY", "POSITION_FEEDBACK") == "COMMANDED
 coordinate_display = inifile.find("DISPLAY", "POSITION_UNITS")
 lathe = bool(inifile.find("DISPLAY", "LATHE"))
 foam = bool(inifile.find("DISPLAY", "FOAM"))
+preview_vbo = bool(inifile.find("DISPLAY", "PREVIEW_VBO"))
+preview_cpu_pick = bool(inifile.find("DISPLAY", "PREVIEW_CPU_PICK"))
 editor = inifile.find("DISPLAY", "EDITOR")
 vars.has_editor.set(editor is not None)
 tooleditor = inifile.find("DISPLAY", "TOOL_EDITOR") or "tooledit"
@@ -3215,6 +3223,9 @@ c.wait_complete()
 o = MyOpengl(widgets.preview_frame, width=400, height=300, double=1, depth=1)
 o.last_line = 1
 o.pack(fill="both", expand=1)
+preview_cache = inifile.find("DISPLAY", "PREVIEW_CACHE")
+if preview_cache:
+    o.set_preview_cache(PreviewCache(preview_cache))
 
 def match_grid_size(v):
     for idx in range(3, widgets.menu_grid.index("end")+1):
@@ -34,8 +34,11 @@ try:
 except ImportError:
     import numarray, numarray.ieeespecial
     plus_inf = numarray.ieeespecial.inf
+import numpy
+import multiprocessing
+import collections
 
-from rs274.author import Gcode
+from rs274.author import Gcode, ParallelSimplifier, BufferedTarget
 import rs274.options
 
 from math import *
@@ -76,6 +79,59 @@ def make_tool_shape(f, wdia, resp):
     n = n - n.min()
     return n
 
+def dilate_band(args):
+    image, kernel = args
+    kh, kw = kernel.shape
+    rows = image.shape[0] - kh + 1
+    cols = image.shape[1] - kw + 1
+    out = numpy.empty((rows, cols), numpy.float32)
+    out.fill(-numpy.inf)
+    tmp = numpy.empty_like(out)
+    for ky, kx in zip(*numpy.nonzero(numpy.isfinite(kernel))):
+        numpy.subtract(image[ky:ky+rows, kx:kx+cols], kernel[ky, kx], out=tmp)
+        numpy.maximum(out, tmp, out=out)
+    return out
+
+def dilate(image, kernel, processes=None, progress=None, min_work=2e8):
+    """Return out[y, x] = (image[y:y+kh, x:x+kw] - kernel).max() for every
+    position where the kernel fits inside image.
+
+    This is a grayscale dilation with a non-flat structuring element;
+    infinite kernel entries (outside the tool) never contribute.  The
+    rows are split into bands which are dilated by a pool of processes,
+    unless there are fewer than min_work pixel operations to do."""
+    image = numpy.asarray(image, numpy.float32)
+    kernel = numpy.asarray(kernel, numpy.float32)
+    kh, kw = kernel.shape
+    rows = image.shape[0] - kh + 1
+    cols = image.shape[1] - kw + 1
+    # the kernel does not fit anywhere in an image smaller than the tool
+    if rows <= 0 or cols <= 0:
+        return numpy.empty((max(rows, 0), max(cols, 0)), numpy.float32)
+    if processes is None: processes = multiprocessing.cpu_count()
+    # small jobs are not worth starting processes for
+    work = rows * image.shape[1] * numpy.isfinite(kernel).sum()
+    if work < min_work: processes = 1
+    band = max(16, -(-rows // (4 * processes)))
+    bands = [(image[y:min(y+band, rows)+kh-1], kernel)
+        for y in range(0, rows, band)]
+    if processes > 1 and len(bands) > 1:
+        pool = multiprocessing.Pool(min(processes, len(bands)))
+        try:
+            results = pool.imap(dilate_band, bands)
+            out = []
+            for i, r in enumerate(results):
+                if progress: progress(i, len(bands))
+                out.append(r)
+        finally:
+            pool.terminate()
+    else:
+        out = []
+        for i, b in enumerate(bands):
+            if progress: progress(i, len(bands))
+            out.append(dilate_band(b))
+    return numpy.concatenate(out)
+
 def amax(seq):
     res = 0
     for i in seq:
@@ -205,12 +261,17 @@ def progress(a, b):
         print >>sys.stderr, "FILTER_PROGRESS=%d" % int(a*100./b+.5)
         sys.stderr.flush()
 
+def filter_progress(phase, done, total):
+    """Default Converter progress callback; phase is one of "roughing",
+    "heights", "rows" or "columns", AXIS is sent the progress of each"""
+    progress(done, total)
+
 class Converter:
     def __init__(self,
             image, units, tool_shape, pixelsize, pixelstep, safetyheight, \
             tolerance, feed, convert_rows, convert_cols, cols_first_flag,
             entry_cut, spindle_speed, roughing_offset, roughing_delta,
-            roughing_feed):
+            roughing_feed, processes=None, progress=None, target=None):
         self.image = image
         self.units = units
         self.tool = tool_shape
@@ -227,8 +288,13 @@ class Converter:
         self.roughing_offset = roughing_offset
         self.roughing_delta = roughing_delta
         self.roughing_feed = roughing_feed
+        if processes is None: processes = multiprocessing.cpu_count()
+        self.processes = processes
+        self.progress = progress or filter_progress
+        self.target = target or BufferedTarget(sys.stdout)
 
-        self.cache = {}
+        # tool compensated heights of the whole image, see heights()
+        self.field = None
 
         w, h = self.w, self.h = image.shape
         ts = self.ts = tool_shape.shape[0]
@@ -260,10 +326,21 @@ class Converter:
         g.safety()
 
     def convert(self):
+        if self.processes > 1:
+            self.simplifier = ParallelSimplifier(self.processes)
+        else:
+            self.simplifier = None
+        try:
+            self.convert_all()
+        finally:
+            if self.simplifier: self.simplifier.close()
+
+    def convert_all(self):
         self.g = g = Gcode(safetyheight=self.safetyheight,
                            tolerance=self.tolerance,
                            spindle_speed=self.spindle_speed,
-                           units=self.units)
+                           units=self.units, target=self.target,
+                           simplifier=self.simplifier)
         g.begin()
         g.continuous(self.tolerance)
         g.safety()
@@ -275,13 +352,11 @@ class Converter:
             tw, th = rough.shape
             w1 = w + tw
             h1 = h + th
-            nim1 = numarray.zeros((w1, h1), 'Float32') + base_image.min()
+            nim1 = numpy.zeros((w1, h1), numpy.float32) + base_image.min()
             nim1[tw/2:tw/2+w, th/2:th/2+h] = base_image
-            self.image = numarray.zeros((w,h), type="Float32")
-            for j in range(0, w):
-                progress(j,w)
-                for i in range(0, h):
-                    self.image[j,i] = (nim1[j:j+tw,i:i+th] - rough).max()
+            self.image = dilate(nim1, rough, self.processes,
+                lambda a, b: self.progress("roughing", a, b))[:w, :h]
+            self.field = None
             self.feed = self.roughing_feed
             r = -self.roughing_delta
             m = self.image.min()
@@ -294,21 +369,47 @@ class Converter:
                 self.rd = m
                 self.one_pass()
             self.image = base_image
-            self.cache.clear()
+            self.field = None
         self.feed = self.base_feed
         self.ro = 0
         self.rd = self.image.min()
         self.one_pass()
         g.end()
 
+    def heights(self):
+        """Tool compensated height of every tool position, indexed [y, x]"""
+        if self.field is None:
+            self.field = dilate(self.image, self.tool, self.processes,
+                lambda a, b: self.progress("heights", a, b))
+        return self.field
+
+    def pass_heights(self):
+        """Heights of the current pass, limited by the roughing depth and
+        offset and the top of the stock"""
+        return numpy.minimum(0,
+            numpy.maximum(self.rd, self.heights().astype(numpy.float64))
+            + self.ro)
+
     def get_z(self, x, y):
-        try:
-            return min(0, max(self.rd, self.cache[x,y]) + self.ro)
-        except KeyError:
-            m1 = self.image[y:y+self.ts, x:x+self.ts]
-            self.cache[x,y] = d = (m1 - self.tool).max()
-            return min(0, max(self.rd, d) + self.ro)
-        
+        return min(0, max(self.rd, float(self.heights()[y, x])) + self.ro)
+
+    def scan_data(self):
+        """Return (z, dz/dx, dz/dy) arrays of the current pass, indexed
+        [y, x] like get_z, get_dz_dx and get_dz_dy"""
+        z = self.pass_heights()
+        zx = numpy.empty_like(z); zy = numpy.empty_like(z)
+        for d, axis in ((zx, 1), (zy, 0)):
+            n = z.shape[axis]
+            if n < 2:
+                d.fill(0)
+                continue
+            lo = numpy.maximum(numpy.arange(n) - 1, 0)
+            hi = numpy.minimum(numpy.arange(n) + 1, n - 1)
+            dist = self.pixelsize * (hi - lo)
+            if axis: d[:] = (z[:, hi] - z[:, lo]) / dist
+            else: d[:] = (z[hi] - z[lo]) / dist[:, None]
+        return z, zx, zy
+
     def get_dz_dy(self, x, y):
         y1 = max(0, y-1)
         y2 = min(self.image.shape[0]-1, y+1)
@@ -321,23 +422,43 @@ class Converter:
         dx = self.pixelsize * (x2-x1)
         return (self.get_z(x2, y) - self.get_z(x1, y)) / dx
 
+    def lookahead(self, scanlines):
+        """Yield the (j, spans) items of scanlines unchanged, but only after
+        the cuts of the following spans were handed to the simplifier"""
+        s = self.simplifier
+        if s is None:
+            for item in scanlines: yield item
+            return
+        tolerance = self.g.tolerance; plane = self.g.plane
+        window = collections.deque()
+        for item in scanlines:
+            for flag, points in item[1]:
+                s.submit([list(p[1]) for p in points], tolerance, plane)
+            window.append(item)
+            while window and len(s.pending) > s.lookahead:
+                yield window.popleft()
+        while window: yield window.popleft()
+
     def mill_rows(self, convert_scan, primary):
         w1 = self.w1; h1 = self.h1;
         pixelsize = self.pixelsize; pixelstep = self.pixelstep
         jrange = range(0, w1, pixelstep)
         if w1-1 not in jrange: jrange.append(w1-1)
         irange = range(h1)
-
-        for j in jrange:
-            progress(jrange.index(j), len(jrange))
-            y = (w1-j) * pixelsize
-            scan = []
-            for i in irange:
-                x = i * pixelsize
-                milldata = (i, (x, y, self.get_z(i, j)),
-                    self.get_dz_dx(i, j), self.get_dz_dy(i, j))
-                scan.append(milldata)
-            for flag, points in convert_scan(primary, scan):
+        xs = [i * pixelsize for i in irange]
+        z, zx, zy = self.scan_data()
+
+        def scanlines():
+            for j in jrange:
+                y = (w1-j) * pixelsize
+                scan = [(i, (x, y, zi), dx, dy) for i, x, zi, dx, dy in
+                    zip(irange, xs, z[j, :h1].tolist(), zx[j, :h1].tolist(),
+                        zy[j, :h1].tolist())]
+                yield j, list(convert_scan(primary, scan))
+
+        for n, (j, spans) in enumerate(self.lookahead(scanlines())):
+            self.progress("rows", n, len(jrange))
+            for flag, points in spans:
                 if flag:
                     self.entry_cut(self, points[0][0], j, points)
                 for p in points:
@@ -351,17 +472,20 @@ class Converter:
         irange = range(w1)
         if h1-1 not in jrange: jrange.append(h1-1)
         jrange.reverse()
-
-        for j in jrange:
-            progress(jrange.index(j), len(jrange))
-            x = j * pixelsize
-            scan = []
-            for i in irange:
-                y = (w1-i) * pixelsize
-                milldata = (i, (x, y, self.get_z(j, i)),
-                    self.get_dz_dy(j, i), self.get_dz_dx(j, i))
-                scan.append(milldata)
-            for flag, points in convert_scan(primary, scan):
+        ys = [(w1-i) * pixelsize for i in irange]
+        z, zx, zy = self.scan_data()
+
+        def scanlines():
+            for j in jrange:
+                x = j * pixelsize
+                scan = [(i, (x, y, zi), dy, dx) for i, y, zi, dy, dx in
+                    zip(irange, ys, z[:w1, j].tolist(), zy[:w1, j].tolist(),
+                        zx[:w1, j].tolist())]
+                yield j, list(convert_scan(primary, scan))
+
+        for n, (j, spans) in enumerate(self.lookahead(scanlines())):
+            self.progress("columns", n, len(jrange))
+            for flag, points in spans:
                 if flag:
                     self.entry_cut(self, j, points[0][0], points)
                 for p in points:
@@ -453,14 +577,12 @@ class ArcEntryCut:
             conv.g.rapid(x1, p1[1])
             conv.g.cut(z=z1)
 
-            conv.g.flush(); conv.g.lastgcode = None
+            conv.g.flush()
             if cx > 0:
                 conv.g.write("G3 X%f Z%f R%f" % (p1[0], p1[2], radius))
             else:
                 conv.g.write("G2 X%f Z%f R%f" % (p1[0], p1[2], radius))
-            conv.g.lastx = p1[0]
-            conv.g.lasty = p1[1]
-            conv.g.lastz = p1[2]
+            conv.g.moved_to(*p1)
         else:
             w1 = conv.w1
             for dj in r:
@@ -482,14 +604,12 @@ class ArcEntryCut:
             conv.g.rapid(p1[0], y1)
             conv.g.cut(z=z1)
 
-            conv.g.flush(); conv.g.lastgcode = None
+            conv.g.flush()
             if cy > 0:
                 conv.g.write("G2 Y%f Z%f R%f" % (p1[1], p1[2], radius))
             else:
                 conv.g.write("G3 Y%f Z%f R%f" % (p1[1], p1[2], radius))
-            conv.g.lastx = p1[0]
-            conv.g.lasty = p1[1]
-            conv.g.lastz = p1[2]
+            conv.g.moved_to(*p1)
         if self.feed:
             conv.g.set_feed(conv.feed)
 
@@ -145,7 +145,9 @@ class gmoccapy( object ):
         # needed components to comunicate with hal and linuxcnc
         self.halcomp = hal.component( "gmoccapy" )
         self.command = linuxcnc.command()
-        self.stat = linuxcnc.stat()
+        # the status is shared with the gladevcp widgets and polled by GStat
+        self.gstat = hal_glib.GStat()
+        self.stat = self.gstat.stat
         self.error_channel = linuxcnc.error_channel()
         # initial poll, so all is up to date
         self.stat.poll()
@@ -680,9 +682,8 @@ class gmoccapy( object ):
 
         # since the main loop is needed to handle the UI and its events, blocking calls like sleep()
         # will block the UI as well, so everything goes through event handlers (aka callbacks)
-        # The gobject.timeout_add() function sets a function to be called at regular intervals
-        # the time between calls to the function, in milliseconds
-        gobject.timeout_add( 100, self._periodic )  # time between calls to the function, in milliseconds
+        # GStat polls the status every 100 ms and emits 'periodic' afterwards
+        self.gstat.connect( "periodic", self._periodic )
 
     def _get_axis_list( self ):
         temp = self.get_ini_info.get_coordinates()
@@ -1413,10 +1414,9 @@ class gmoccapy( object ):
             self.widgets.ntb_preview.set_current_page( 0 )
             self.widgets.ntb_info.set_current_page( 0 )
 
-    # every 100 milli seconds this gets called
-    # check linuxcnc for status, error and then update the readout
-    def _periodic( self ):
-        self.stat.poll()
+    # every 100 milli seconds this gets called, after GStat polled the status
+    # check linuxcnc for error and then update the readout
+    def _periodic( self, widget = None ):
         error = self.error_channel.poll()
         if error:
             self._show_error( error )
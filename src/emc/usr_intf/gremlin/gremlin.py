@@ -38,6 +38,7 @@ import pango
 
 import rs274.glcanon
 import rs274.interpret
+import rs274.previewcache
 import linuxcnc
 import gcode
 
@@ -98,6 +99,10 @@ class Gremlin(gtk.gtkgl.widget.DrawingArea, glnav.GlNavBase,
         thread.start_new_thread(self.logger.start, (.01,))
 
         rs274.glcanon.GlCanonDraw.__init__(self, linuxcnc.stat(), self.logger)
+        preview_cache = self.inifile.find("DISPLAY", "PREVIEW_CACHE")
+        if preview_cache:
+            self.set_preview_cache(
+                rs274.previewcache.PreviewCache(preview_cache))
 
         self.current_view = 'z'
 
@@ -119,6 +124,7 @@ class Gremlin(gtk.gtkgl.widget.DrawingArea, glnav.GlNavBase,
         self.add_events(gtk.gdk.BUTTON_RELEASE_MASK)
 
         self.fingerprint = ()
+        self.offsets = None
 
         self.lat = 0
         self.minlat = -90
@@ -142,6 +148,7 @@ class Gremlin(gtk.gtkgl.widget.DrawingArea, glnav.GlNavBase,
         temp = inifile.find("DISPLAY", "LATHE")
         self.lathe_option = bool(temp == "1" or temp == "True" or temp == "true" )
         self.foam_option = bool(inifile.find("DISPLAY", "FOAM"))
+        self.cpu_pick_option = bool(inifile.find("DISPLAY", "PREVIEW_CPU_PICK"))
         self.show_offsets = False
         self.use_default_controls = True
         self.mouse_btn_mode = 0
@@ -210,6 +217,15 @@ class Gremlin(gtk.gtkgl.widget.DrawingArea, glnav.GlNavBase,
             self.fingerprint = fingerprint
             self.queue_draw()
 
+        # move the preview along with work offset changes made from the
+        # UI; offsets a running program selects are its own business
+        offsets = (s.g5x_offset, s.g92_offset, s.rotation_xy)
+        if s.interp_state == linuxcnc.INTERP_IDLE and offsets != self.offsets:
+            self.offsets = offsets
+            if self.canon is not None and not self.update_offsets():
+                self.load(self._current_file)
+            self.queue_draw()
+
         # return self.visible
         return True
 
@@ -311,6 +327,7 @@ class Gremlin(gtk.gtkgl.widget.DrawingArea, glnav.GlNavBase,
         return self.font_charwidth, self.font_linespace, self.font_base
 
     def get_show_offsets(self): return self.show_offsets
+    def get_use_cpu_pick(self): return self.cpu_pick_option
 
     def select_prime(self, x, y):
         self.select_primed = x, y
@@ -261,7 +261,7 @@ class emc_control:
             return self.emcstat.task_mode
 
 class emc_status:
-        def __init__(self, data, emc):
+        def __init__(self, data, emc, stat = None):
             self.data = data
             self.emc = emc
             self.resized_dro = 0
@@ -269,7 +269,9 @@ class emc_status:
             self.machine_units_mm=0
             self.unit_convert=[1]*9
             self.actual = 1
-            self.emcstat = emc.stat()
+            # a stat shared with GStat is polled there
+            self.emcstat = stat or emc.stat()
+            self.poll_stat = stat is None
             self.emcerror = emc.error_channel()
 
         def get_feedrate(self):
@@ -330,7 +332,8 @@ class emc_status:
                 return 1
 
         def periodic(self):
-            self.emcstat.poll()
+            if self.poll_stat:
+                self.emcstat.poll()
             am = self.emcstat.axis_mask
             lathe = not (self.emcstat.axis_mask & 2)
             dtg = self.emcstat.dtg
@@ -488,8 +488,12 @@ class Gscreen:
 
         # access to EMC control
         self.emc = emc_interface.emc_control(linuxcnc)
+        # shared status, polled once per display cycle by GStat
+        self.gstat = hal_glib.GStat()
+        self.emcstat = self.gstat.stat
+        self.emcerror = linuxcnc.error_channel()
         # access to EMC status
-        self.status = emc_interface.emc_status( self.data, linuxcnc)
+        self.status = emc_interface.emc_status( self.data, linuxcnc, self.emcstat)
         # access to MDI
         mdi_labels = mdi_eventboxes = []
         self.mdi_control = mdi.mdi_control(gtk, linuxcnc, mdi_labels, mdi_eventboxes)
@@ -730,10 +734,11 @@ class Gscreen:
             self.add_alarm_entry(_("CYCLE_TIME in [DISPLAY] of INI file is too small: defaulting to 100ms"))
             temp = 100
         print _("timeout %d" % int(temp))
+        self.gstat.set_interval(int(temp))
         if "timer_interrupt" in dir(self.handler_instance):
             gobject.timeout_add(int(temp), self.handler_instance.timer_interrupt)
         else:
-            gobject.timeout_add(int(temp), self.timer_interrupt)
+            self.gstat.connect('periodic', self.timer_interrupt)
 
     def initialize_keybindings(self):
         self.widgets.window1.connect('key_press_event', self.on_key_event,1)
@@ -3355,11 +3360,9 @@ class Gscreen:
         settings.set_string_property("gtk-theme-name", theme, "")
 
     # check linuxcnc for status, error and then update the readout
-    def timer_interrupt(self):
+    # runs after every poll of the shared status
+    def timer_interrupt(self, *args):
         self.emc.mask()
-        self.emcstat = linuxcnc.stat()
-        self.emcerror = linuxcnc.error_channel()
-        self.emcstat.poll()
         self.data.task_mode = self.emcstat.task_mode 
         self.status.periodic()
         self.data.system = self.status.get_current_system()
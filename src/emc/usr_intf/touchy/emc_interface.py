@@ -214,7 +214,8 @@ class emc_status:
                      dro_table,
                      error,
                      estops, machines, override_limit, status,
-                     floods, mists, spindles, prefs, opstop, blockdel):
+                     floods, mists, spindles, prefs, opstop, blockdel,
+                     stat = None):
                 self.gtk = gtk
                 self.emc = emc
                 self.listing = listing
@@ -239,7 +240,9 @@ class emc_status:
                 self.machine_units_mm=0
                 self.unit_convert=[1]*9
                 self.actual = 0
-                self.emcstat = emc.stat()
+                # a stat shared with GStat is polled there
+                self.emcstat = stat or emc.stat()
+                self.poll_stat = stat is None
                 self.emcerror = emc.error_channel()
 
         def dro_inch(self, b):
@@ -276,7 +279,8 @@ class emc_status:
                 return 1
 
         def periodic(self):
-                self.emcstat.poll()
+                if self.poll_stat:
+                        self.emcstat.poll()
                 am = self.emcstat.axis_mask
                 lathe = not (self.emcstat.axis_mask & 2)
                 dtg = self.emcstat.dtg
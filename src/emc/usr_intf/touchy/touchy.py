@@ -63,6 +63,7 @@ def set_text(w, t):
 	if ot != t: w.set_label(t)
 
 import linuxcnc
+import hal_glib
 from touchy import emc_interface
 from touchy import mdi
 from touchy import hal_interface
@@ -240,6 +241,9 @@ class touchy:
                 opstop = dict((i, self.wTree.get_widget("opstop_" + i)) for i in opstop)
                 blockdel = ['on', 'off']
                 blockdel = dict((i, self.wTree.get_widget("blockdel_" + i)) for i in blockdel)
+                # shared status, polled by GStat every 50 ms
+                self.gstat = hal_glib.GStat()
+                self.gstat.set_interval(50)
                 self.status = emc_interface.emc_status(gtk, linuxcnc, self.listing, relative, absolute, distance,
                                                        self.wTree.get_widget("dro_table"),
                                                        self.wTree.get_widget("error"),
@@ -247,7 +251,7 @@ class touchy:
                                                        self.wTree.get_widget("override_limits"),
                                                        stats,
                                                        floods, mists, spindles, prefs,
-                                                       opstop, blockdel)
+                                                       opstop, blockdel, self.gstat.stat)
 
                 self.current_file = self.status.emcstat.file
                 # check the ini file if UNITS are set to mm"
@@ -295,7 +299,7 @@ class touchy:
 
                 self.linuxcnc.max_velocity(self.mv_val)
                                 
-                gobject.timeout_add(50, self.periodic_status)
+                self.gstat.connect('periodic', self.periodic_status)
                 gobject.timeout_add(100, self.periodic_radiobuttons)
 
                 # event bindings
@@ -658,7 +662,7 @@ class touchy:
                 self.current_file = self.filechooser.select(eb, e)
                 self.listing.clear_startline()
 
-        def periodic_status(self):
+        def periodic_status(self, widget = None):
                 self.linuxcnc.mask()
                 self.radiobutton_mask = 1
                 self.status.periodic()
@@ -676,8 +680,7 @@ class touchy:
 
         def periodic_radiobuttons(self):
                 self.radiobutton_mask = 1
-                s = linuxcnc.stat()
-                s.poll()
+                s = self.gstat.stat
                 am = s.axis_mask
                 if not self.resized_wheelbuttons:
                         at = self.wTree.get_widget("axis_table")
@@ -107,3 +107,11 @@ cdef extern from "Python.h":
     object PyObject_Format(object obj, object format_spec)
     # Takes an arbitrary object and returns the result of calling
     # obj.__format__(format_spec).
+
+    int PyObject_AsReadBuffer(object obj, const void **buffer,
+                              Py_ssize_t *buffer_len) except -1
+    # Old style buffer interface, for objects which do not support
+    # the new buffer protocol (e.g. array.array on Python 2).
+
+    object PyByteArray_FromStringAndSize(const char *string, Py_ssize_t len)
+    char *PyByteArray_AsString(object bytearray) except NULL
@@ -8,18 +8,38 @@
 
 from libc.errno cimport EAGAIN
 from libc.string cimport memcpy
-from buffer cimport PyBuffer_FillInfo
+from buffer cimport PyBuffer_FillInfo, PyBuffer_Release, PyObject_CheckBuffer
+from buffer cimport PyObject_GetBuffer, PyObject_AsReadBuffer, PyBUF_CONTIG_RO
+from buffer cimport PyByteArray_FromStringAndSize, PyByteArray_AsString
 from cpython.bytes cimport PyBytes_AsString, PyBytes_Size, PyBytes_FromStringAndSize
 from cpython.string cimport PyString_FromStringAndSize
 from cpython cimport bool
+from cpython cimport array
+import array
+import time
 
 from .ring cimport *
 
 
+# export any object supporting the buffer protocol (bytes, bytearray,
+# memoryview, numpy arrays..) as a contiguous read-only buffer without
+# copying. Objects only supporting the old style buffer interface, like
+# array.array, are wrapped. Release with PyBuffer_Release().
+cdef int get_read_buffer(object s, Py_buffer *view) except -1:
+    cdef const void *buf
+    cdef Py_ssize_t size
+    if PyObject_CheckBuffer(s):
+        return PyObject_GetBuffer(s, view, PyBUF_CONTIG_RO)
+    PyObject_AsReadBuffer(s, &buf, &size)
+    return PyBuffer_FillInfo(view, s, <void *>buf, size, 1, PyBUF_CONTIG_RO)
+
+
 cdef class Ring:
     cdef ringbuffer_t _rb
     cdef hal_ring_t *_hr
     cdef uint32_t flags,aflags
+    cdef void *_reserved
+    cdef ringsize_t _reserved_size
 
     def __cinit__(self, char *name,
                   int size = 0,
@@ -29,6 +49,7 @@ cdef class Ring:
                   bool use_wmutex = False,
                   bool in_halmem = False):
         self._hr = NULL
+        self._reserved = NULL
         self.flags = (type & RINGTYPE_MASK);
         if use_rmutex: self.flags |= USE_RMUTEX;
         if use_wmutex: self.flags |= USE_RMUTEX;
@@ -59,18 +80,61 @@ cdef class Ring:
                                        (name, r, hal_lasterror()))
 
     def write(self, s):
+        '''write s as one record. s may be any object supporting the
+        buffer protocol. Returns False if the ring is full.'''
         cdef void *ptr
-        cdef size_t size = PyBytes_Size(s)
-        cdef int r = record_write_begin(&self._rb, &ptr, size)
+        cdef Py_buffer view
+        cdef int r
+        get_read_buffer(s, &view)
+        try:
+            r = record_write_begin(&self._rb, &ptr, view.len)
+            if r == 0:
+                memcpy(ptr, view.buf, view.len)
+                record_write_end(&self._rb, ptr, view.len)
+        finally:
+            PyBuffer_Release(&view)
         if r:
             if r != EAGAIN:
                 raise IOError("Ring %s write failed: %d - %s" %
                               (self.name, r, strerror(r)))
             return False
-        memcpy(ptr, PyBytes_AsString(s), size)
-        record_write_end(&self._rb, ptr, size)
         return True
 
+    def reserve(self, int size):
+        '''reserve a record of size bytes and return a writable memoryview
+        into the ring memory, or None if the ring is currently full.
+        Fill in the record in place, then commit() it. The view must not
+        be used after commit() or abort().'''
+        cdef void *ptr
+        if self._reserved != NULL:
+            raise RuntimeError("Ring %s: reserve() while a record is reserved" %
+                               self.name)
+        cdef int r = record_write_begin(&self._rb, &ptr, size)
+        if r:
+            if r != EAGAIN:
+                raise IOError("Ring %s reserve failed: %d - %s" %
+                              (self.name, r, strerror(r)))
+            return None
+        self._reserved = ptr
+        self._reserved_size = size
+        return memoryview(mview(<long>ptr, size))
+
+    def commit(self, size=None):
+        '''publish the reserved record, optionally shortened to size bytes'''
+        if self._reserved == NULL:
+            raise RuntimeError("Ring %s: commit() without reserve()" % self.name)
+        if size is None:
+            size = self._reserved_size
+        elif not 0 <= size <= self._reserved_size:
+            raise ValueError("Ring %s: commit size %d exceeds reserved size %d" %
+                             (self.name, size, self._reserved_size))
+        record_write_end(&self._rb, self._reserved, size)
+        self._reserved = NULL
+
+    def abort(self):
+        '''drop the reserved record'''
+        self._reserved = NULL
+
     def read(self):
         cdef const void * ptr
         cdef ringsize_t size
@@ -86,6 +150,67 @@ cdef class Ring:
     def shift(self):
         record_shift(&self._rb)
 
+    def wait(self, timeout=None):
+        '''wait until a record is available, at most timeout seconds
+        (forever if None). Returns True if a record is available.
+        Rings have no writer notification, so this sleeps in between
+        checks, starting at 1ms and backing off to 50ms.'''
+        cdef double delay = 0.001
+        deadline = None if timeout is None else time.time() + timeout
+        while record_next_size(&self._rb) < 0:
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                delay = min(delay, remaining)
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+        return True
+
+    def drain(self, int max_records = 0, timeout = 0.0):
+        '''read and consume up to max_records records (all available
+        if 0) in one call. If the ring is empty, wait up to timeout
+        seconds for a record first (forever if None).
+
+        Returns (data, offsets): data is a bytearray holding the records
+        back to back, offsets an array('I') of len(records) + 1 entries,
+        record i being data[offsets[i]:offsets[i+1]]. Fixed size records
+        can be viewed without copying, e.g. numpy.frombuffer(data, dtype).'''
+        cdef ringiter_t it
+        cdef const void *ptr
+        cdef ringsize_t size
+        cdef size_t total = 0
+        cdef int n = 0
+        cdef int i
+        cdef char *dst
+        cdef array.array offsets
+
+        if timeout is None or timeout > 0:
+            self.wait(timeout)
+
+        # size the result first, without consuming
+        if record_iter_init(&self._rb, &it):
+            raise RuntimeError("Ring %s: failed to initialize iterator" % self.name)
+        while max_records == 0 or n < max_records:
+            if record_iter_read(&it, &ptr, &size):
+                break
+            total += size
+            n += 1
+            record_iter_shift(&it)
+
+        data = PyByteArray_FromStringAndSize(NULL, total)
+        dst = PyByteArray_AsString(data)
+        offsets = array.clone(array.array('I'), n + 1, False)
+        offsets.data.as_uints[0] = 0
+        total = 0
+        for i in range(n):
+            record_read(&self._rb, &ptr, &size)
+            memcpy(dst + total, ptr, size)
+            total += size
+            offsets.data.as_uints[i + 1] = total
+            record_shift(&self._rb)
+        return data, offsets
+
     def __iter__(self):
         return RingIter(self)
 
@@ -222,7 +347,12 @@ cdef class StreamRing:
         nozero return value indicates the number
 	of bytes actually written. '''
 
-        return stream_write(self._rb,  PyBytes_AsString(s), PyBytes_Size(s))
+        cdef Py_buffer view
+        get_read_buffer(s, &view)
+        try:
+            return stream_write(self._rb, <const char *>view.buf, view.len)
+        finally:
+            PyBuffer_Release(&view)
 
     def read(self):
         ''' return all bytes readable as a string, or None'''
@@ -244,9 +374,11 @@ cdef class StreamRing:
 cdef class MultiframeRing:
     cdef msgbuffer_t _rb
     cdef object _pyring
+    cdef int _reserved_size
 
     def __cinit__(self, ring):
         self._pyring = ring
+        self._reserved_size = -1
         self._rb.ring = &(<Ring>ring)._rb
         self._rb.ring.header.type = RINGTYPE_MULTIPART
 
@@ -264,15 +396,47 @@ cdef class MultiframeRing:
         msg_read_flush(&self._rb)
 
     def write(self, s, flags = 0):
-        cdef void * ptr
-        cdef size_t size = PyBytes_Size(s)
-        r = frame_write(&self._rb, PyBytes_AsString(s), size, flags)
+        '''add a frame to the current message. s may be any object
+        supporting the buffer protocol.'''
+        cdef Py_buffer view
+        get_read_buffer(s, &view)
+        try:
+            r = frame_write(&self._rb, view.buf, view.len, flags)
+        finally:
+            PyBuffer_Release(&view)
         if not r:
             return True
         if r != EAGAIN:
             raise IOError("Ring write failed")
         return False
 
+    def reserve(self, int size, flags = 0):
+        '''add a frame of size bytes to the current message and return a
+        writable memoryview into the ring memory, or None if the ring is
+        currently full. Fill it in place and commit() it before adding the
+        next frame or flushing the message.'''
+        cdef void * ptr
+        r = frame_write_begin(&self._rb, &ptr, size, flags)
+        if not r:
+            self._reserved_size = size
+            return memoryview(mview(<long>ptr, size))
+        if r != EAGAIN:
+            raise IOError("Ring reserve failed")
+        return None
+
+    def commit(self, int size):
+        '''commit the reserved frame with its final size'''
+        if self._reserved_size < 0:
+            raise RuntimeError("Ring %s: commit() without reserve()" %
+                               self._pyring.name)
+        if not 0 <= size <= self._reserved_size:
+            raise ValueError("Ring %s: commit size %d exceeds reserved size %d" %
+                             (self._pyring.name, size, self._reserved_size))
+        self._reserved_size = -1
+        r = frame_write_end(&self._rb, size)
+        if r:
+            raise IOError("Ring commit failed: %d - %s" % (r, strerror(r)))
+
     def flush(self):
         msg_write_flush(&self._rb)
 
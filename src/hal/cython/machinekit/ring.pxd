@@ -76,7 +76,7 @@ cdef extern from "ring.h":
     int record_read(const ringbuffer_t *ring, const void **data, ringsize_t *size)
     int record_shift(ringbuffer_t *ring)
     void *record_next(ringbuffer_t *ring)
-    ringsize_t record_next_size(ringbuffer_t *ring)
+    int32_t record_next_size(ringbuffer_t *ring)
 
     size_t record_write_space(const ringheader_t *h)
     int record_shift(ringbuffer_t *ring)
@@ -18,6 +18,7 @@
 
 #include <Python.h>
 #include <string>
+#include <string.h>
 #include <map>
 using namespace std;
 
@@ -299,6 +300,44 @@ static PyObject *pyhal_read_common(halitem *item) {
     return NULL;
 }
 
+// compare the value of an item with the one stored in an 8 byte
+// snapshot slot and store the new value there.  Floats are kept as
+// doubles, where two NaNs count as equal, the integer types as exact
+// 64 bit integers.  Returns 1 if the value changed, 0 if not, -1 on error.
+static int pyhal_diff_value(halitem *item, char *slot) {
+    union { double f; hal_s64_t s; hal_u64_t u; } v, old;
+    union paramunion *p = &item->u->param;
+    union paramunion pv;
+    if(item->is_pin) {
+        switch(item->type) {
+            case HAL_BIT: pv.b = *(item->u->pin.b); break;
+            case HAL_U32: pv.u32 = *(item->u->pin.u32); break;
+            case HAL_S32: pv.s32 = *(item->u->pin.s32); break;
+            case HAL_U64: pv.u64 = *(item->u->pin.u64); break;
+            case HAL_S64: pv.s64 = *(item->u->pin.s64); break;
+            case HAL_FLOAT: pv.f = *(item->u->pin.f); break;
+            default: break;
+        }
+        p = &pv;
+    }
+    switch(item->type) {
+        case HAL_BIT: v.s = p->b; break;
+        case HAL_U32: v.s = p->u32; break;
+        case HAL_S32: v.s = p->s32; break;
+        case HAL_U64: v.u = p->u64; break;
+        case HAL_S64: v.s = p->s64; break;
+        case HAL_FLOAT: v.f = p->f; break;
+        default:
+            PyErr_Format(pyhal_error_type, "Invalid item type %d", item->type);
+            return -1;
+    }
+    memcpy(&old, slot, sizeof(old));
+    memcpy(slot, &v, sizeof(v));
+    if(item->type == HAL_FLOAT)
+        return !(v.f == old.f || (v.f != v.f && old.f != old.f));
+    return v.u != old.u;
+}
+
 static halitem *find_item(halobject *self, char *name) {
     if(!name) return NULL;
 
@@ -749,6 +788,64 @@ PyObject *pin_has_writer(PyObject *self, PyObject *args) {
 }
 
 
+// read the values of a sequence of items into a snapshot buffer of
+// 8 byte slots, and return the indices of the items whose value differs
+// from the one previously stored in the snapshot
+PyObject *diff_items(PyObject *self, PyObject *args) {
+    PyObject *items, *snapshot;
+    void *buf;
+    Py_ssize_t len;
+    if(!PyArg_ParseTuple(args, "OO", &items, &snapshot)) return NULL;
+
+    PyObject *seq = PySequence_Fast(items, "items must be a sequence");
+    if(!seq) return NULL;
+    Py_ssize_t n = PySequence_Fast_GET_SIZE(seq);
+
+    if(PyObject_AsWriteBuffer(snapshot, &buf, &len) < 0) {
+        Py_DECREF(seq);
+        return NULL;
+    }
+    if(len != n * 8) {
+        PyErr_Format(PyExc_ValueError,
+                "snapshot must hold %zd 8 byte slots", n);
+        Py_DECREF(seq);
+        return NULL;
+    }
+    char *slots = (char *)buf;
+
+    PyObject *changed = PyList_New(0);
+    if(!changed) {
+        Py_DECREF(seq);
+        return NULL;
+    }
+    for(Py_ssize_t i = 0; i < n; i++) {
+        PyObject *o = PySequence_Fast_GET_ITEM(seq, i);
+        if(!PyObject_TypeCheck(o, &halpin_type)) {
+            PyErr_Format(PyExc_TypeError,
+                    "item %zd is not a hal.item", i);
+            goto fail;
+        }
+        int diff = pyhal_diff_value(&((pyhalitem *)o)->pin, slots + 8 * i);
+        if(diff < 0)
+            goto fail;
+        if(diff) {
+            PyObject *index = PyInt_FromSsize_t(i);
+            if(!index || PyList_Append(changed, index) < 0) {
+                Py_XDECREF(index);
+                goto fail;
+            }
+            Py_DECREF(index);
+        }
+    }
+    Py_DECREF(seq);
+    return changed;
+
+fail:
+    Py_DECREF(changed);
+    Py_DECREF(seq);
+    return NULL;
+}
+
 PyObject *component_exists(PyObject *self, PyObject *args) {
     char *name;
     if(!PyArg_ParseTuple(args, "s", &name)) return NULL;
@@ -1104,6 +1201,8 @@ PyMethodDef module_methods[] = {
 	"connect pin to signal"},
     {"set_p", set_p, METH_VARARGS,
 	"set pin value"},
+    {"diff_items", diff_items, METH_VARARGS,
+	"read items into a snapshot of 8 byte slots, e.g. array('d'), return indices of changed items"},
     {NULL},
 };
 
@@ -49,52 +49,69 @@ class HalWrapper:
 	raise KeyError, k
 	self._drive[k] = v
 
+EV_SYN = linux_event.EV['EV_SYN']
+EV_KEY = linux_event.EV['EV_KEY']
+EV_REL = linux_event.EV['EV_REL']
+EV_ABS = linux_event.EV['EV_ABS']
+EV_LED = linux_event.EV['EV_LED']
+
 class HalInputDevice:
     def __init__(self, comp, idx, name, parts='KRAL'):
-	self.device = linux_event.InputDevice(name)
-
-	self.idx = idx
-	self.codes = set()
-	self.last = {}
-	self.rel_items = []
-	self.abs_items = []
-	self.comp = comp
+        self.device = linux_event.InputDevice(name)
+
+        self.idx = idx
+        self.last = {}
+        self.rel_items = []
+        self.abs_items = []
+        self.comp = comp
         self.parts = parts
+        self.pins = {}
+        # (type, code) -> handler tuple, see update()
+        self.dispatch = {}
+        self.reported = set()
+        self.touched = set()
 
         if 'K' in parts:
+            self.reported.add(EV_KEY)
             for key in self.device.get_bits('EV_KEY'):
+                code = linux_event.encode('EV_KEY', key)
                 key = tohalname(key)
-                self.codes.add(key)
-                comp.newpin("%s.%s" % (idx, key), HAL_BIT, HAL_OUT)
-                comp.newpin("%s.%s-not" % (idx, key), HAL_BIT, HAL_OUT)
-                self.set(key + "-not", 1)
+                pin = self.newpin(key, HAL_BIT, HAL_OUT)
+                pin_not = self.newpin(key + "-not", HAL_BIT, HAL_OUT)
+                pin_not.set(1)
+                self.dispatch[EV_KEY, code] = (EV_KEY, pin.set, pin_not.set)
 
         if 'R' in parts:
+            self.reported.add(EV_REL)
             for axis in self.device.get_bits('EV_REL'):
+                code = linux_event.encode('EV_REL', axis)
                 name = tohalname(axis)
-                self.codes.add(name)
-                comp.newpin("%s.%s-position" % (idx, name), HAL_FLOAT, HAL_OUT)
-                comp.newpin("%s.%s-counts" % (idx, name), HAL_S32, HAL_OUT)
-                comp.newpin("%s.%s-reset" % (idx, name), HAL_BIT, HAL_IN)
-                comp.newpin("%s.%s-scale" % (idx, name), HAL_FLOAT, HAL_IN)
+                item = (name,
+                    self.newpin(name + "-position", HAL_FLOAT, HAL_OUT),
+                    self.newpin(name + "-counts", HAL_S32, HAL_OUT),
+                    self.newpin(name + "-reset", HAL_BIT, HAL_IN),
+                    self.newpin(name + "-scale", HAL_FLOAT, HAL_IN))
                 self.set(name + '-scale', 1.)
-                self.rel_items.append(name)
+                self.rel_items.append(item)
+                self.dispatch[EV_REL, code] = (EV_REL, name, item[2])
 
         if 'A' in parts:
+            self.reported.add(EV_ABS)
             for axis in self.device.get_bits('EV_ABS'):
+                code = linux_event.encode('EV_ABS', axis)
                 name = tohalname(axis)
-                self.codes.add(name)
                 absinfo = self.device.get_absinfo(axis)
-                comp.newpin("%s.%s-position" % (idx, name), HAL_FLOAT, HAL_OUT)
-                comp.newpin("%s.%s-counts" % (idx, name), HAL_S32, HAL_OUT)
-                comp.newpin("%s.%s-is-pos" % (idx, name), HAL_BIT, HAL_OUT)
-                comp.newpin("%s.%s-is-neg" % (idx, name), HAL_BIT, HAL_OUT)
-                comp.newpin("%s.%s-scale" % (idx, name), HAL_FLOAT, HAL_IN)
-                comp.newpin("%s.%s-offset" % (idx, name), HAL_FLOAT, HAL_IN)
-                comp.newpin("%s.%s-fuzz" % (idx, name), HAL_S32, HAL_IN)
-                comp.newpin("%s.%s-flat" % (idx, name), HAL_S32, HAL_IN)
-                comp.newparam("%s.%s-min" % (idx, name), HAL_S32, HAL_RO)
-                comp.newparam("%s.%s-max" % (idx, name), HAL_S32, HAL_RO)
+                item = (name,
+                    self.newpin(name + "-position", HAL_FLOAT, HAL_OUT),
+                    self.newpin(name + "-counts", HAL_S32, HAL_OUT),
+                    self.newpin(name + "-is-pos", HAL_BIT, HAL_OUT),
+                    self.newpin(name + "-is-neg", HAL_BIT, HAL_OUT),
+                    self.newpin(name + "-scale", HAL_FLOAT, HAL_IN),
+                    self.newpin(name + "-offset", HAL_FLOAT, HAL_IN))
+                fuzz = self.newpin(name + "-fuzz", HAL_S32, HAL_IN)
+                flat = self.newpin(name + "-flat", HAL_S32, HAL_IN)
+                self.newparam(name + "-min", HAL_S32, HAL_RO)
+                self.newparam(name + "-max", HAL_S32, HAL_RO)
                 center = (absinfo.minimum + absinfo.maximum)/2.
                 halfrange = (absinfo.maximum - absinfo.minimum)/2. or 1
                 self.set(name + "-counts", absinfo.value)
@@ -106,83 +123,111 @@ class HalInputDevice:
                 self.set(name + "-flat", absinfo.flat)
                 self.set(name + "-min", absinfo.minimum)
                 self.set(name + "-max", absinfo.maximum)
-                self.abs_items.append(name)
+                self.abs_items.append(item)
+                self.dispatch[EV_ABS, code] = (EV_ABS, name, item[2],
+                    flat.get, fuzz.get, item[6].get)
+
+        # last (counts, scale, offset) each position was computed from,
+        # axes are only recomputed when one of them changes
+        self.computed = {}
 
-	self.ledmap = {}
+        self.ledmap = {}
         if 'L' in parts:
             for led in self.device.get_bits('EV_LED'):
                 name = tohalname(led)
-                self.ledmap[name] = led
-                comp.newpin("%s.%s" % (idx, name), HAL_BIT, HAL_IN)
-                comp.newpin("%s.%s-invert" % (idx, name), HAL_BIT, HAL_IN)
+                self.ledmap[name] = (linux_event.encode('EV_LED', led),
+                    self.newpin(name, HAL_BIT, HAL_IN).get,
+                    self.newpin(name + "-invert", HAL_BIT, HAL_IN).get)
                 self.last[name] = 0
                 self.device.write_event('EV_LED', led, 0)
-	
+
+    def newpin(self, name, type, dir):
+        pin = self.pins[name] = self.comp.newpin(
+            "%s.%s" % (self.idx, name), type, dir)
+        return pin
+
+    def newparam(self, name, type, dir):
+        param = self.pins[name] = self.comp.newparam(
+            "%s.%s" % (self.idx, name), type, dir)
+        return param
+
     def get(self, name):
-	name = "%s.%s" % (self.idx, name)
-	return self.comp[name]
+        return self.pins[name].get()
 
     def set(self, name, value):
-	name = "%s.%s" % (self.idx, name)
-	self.comp[name] = value
+        self.pins[name].set(value)
+
+    def resync(self):
+        # the device was reconnected, send all LED states again
+        for k in self.last: self.last[k] = None
+
+    def read(self, events):
+        dispatch = self.dispatch
+        touched = self.touched
+        for sec, usec, type, code, value in events:
+            if type == EV_SYN: continue
+            handler = dispatch.get((type, code))
+            if handler is None:
+                if type in self.reported:
+                    print >>sys.stderr, "Unexpected event", \
+                        linux_event.EV_invert.get(type, type), code
+                continue
+            if type == EV_KEY:
+                if value:
+                    handler[1](1)
+                    handler[2](0)
+                else:
+                    handler[1](0)
+                    handler[2](1)
+            elif type == EV_REL:
+                counts = handler[2]
+                counts.set(counts.get() + value)
+                touched.add(handler[1])
+            else:
+                flat = handler[3]()
+                fuzz = handler[4]()
+                center = int(handler[5]())
+                if value >= center-flat and value <= center+flat:
+                    value = center
+                counts = handler[2]
+                if abs(value - counts.get()) > fuzz:
+                    counts.set(value)
+                    touched.add(handler[1])
 
     def update(self):
-	while self.device.readable():
-	    ev = self.device.read_event()
-	    if ev.type == 'EV_SYN': continue
-	    elif ev.type == 'EV_SND': continue
-	    elif ev.type == 'EV_MSC': continue
-            elif ev.type == 'EV_LED': continue
-            elif ev.type == 'EV_KEY' and 'K' not in self.parts: continue
-            elif ev.type == 'EV_REL' and 'R' not in self.parts: continue
-            elif ev.type == 'EV_ABS' and 'A' not in self.parts: continue
-	    code = tohalname(ev.code)
-	    if code not in self.codes:
-		print >>sys.stderr, "Unexpected event", ev.type, ev.code
-		continue
-	    if ev.type == 'EV_KEY':
-		if ev.value:
-		    self.set(code, 1)
-		    self.set(code + "-not", 0)
-		else:
-		    self.set(code, 0)
-		    self.set(code + "-not", 1)
-	    elif ev.type == 'EV_REL':
-		self.set(code + "-counts", self.get(code + "-counts") + ev.value)
-	    elif ev.type == 'EV_ABS':
-		flat = self.get(code + "-flat")
-		fuzz = self.get(code + "-fuzz")
-		center = int(self.get(code + "-offset"))
-		if ev.value < center-flat or ev.value > center+flat:
-		    value = ev.value
-		else: value = center
-		if abs(value - self.get(code + "-counts")) > fuzz:
-		    self.set(code + "-counts", value)
-
-                
-	for a in self.abs_items:
-	    value = self.get(a + "-counts")
-	    scale = self.get(a + "-scale") or 1
-	    offset = self.get(a + "-offset")
-	    position = (value - offset) / scale
-	    self.set(a + "-position", position)
-	    # Use .01 because my Joystick isn't exactly zero at rest. maybe should be a parameter?
-	    self.set(a + "-is-neg", (position < -.01) )
-	    self.set(a + "-is-pos", (position >  .01) )
-
-	for r in self.rel_items:
-	    reset = self.get(r + "-reset")
-	    scale = self.get(r + "-scale") or 1
-	    if reset: self.set(r + "-counts", 0)
-	    self.set(r + "-position", self.get(r + "-counts") / scale)
-
-	for k, v in self.last.items():
-	    # Note: this is OK because the hal module always returns True or False for HAL_BIT values
-	    u = self.comp["%s.%s" % (self.idx, k)] != self.comp["%s.%s-invert" % (self.idx, k)]
-	    if u != self.last[k]:
-		led = self.ledmap[k]
-		self.device.write_event('EV_LED', led, u)
-		self.last[k] = u
+        touched = self.touched
+        computed = self.computed
+        for name, position, counts, is_pos, is_neg, scale, offset \
+                in self.abs_items:
+            inputs = (counts.get(), scale.get() or 1, offset.get())
+            if name not in touched and computed.get(name) == inputs:
+                continue
+            computed[name] = inputs
+            value, s, o = inputs
+            p = (value - o) / s
+            position.set(p)
+            # Use .01 because my Joystick isn't exactly zero at rest. maybe should be a parameter?
+            is_neg.set(p < -.01)
+            is_pos.set(p > .01)
+
+        for name, position, counts, reset, scale in self.rel_items:
+            if reset.get():
+                counts.set(0)
+                touched.add(name)
+            inputs = (counts.get(), scale.get() or 1)
+            if name not in touched and computed.get(name) == inputs:
+                continue
+            computed[name] = inputs
+            position.set(inputs[0] / inputs[1])
+        touched.clear()
+
+        if not self.device.connected(): return
+        for k, (led, get, get_invert) in self.ledmap.items():
+            # Note: this is OK because the hal module always returns True or False for HAL_BIT values
+            u = get() != get_invert()
+            if u != self.last[k]:
+                self.device.write_event('EV_LED', led, u)
+                self.last[k] = u
 
 h = component("hal_input")
 w = HalWrapper(h)
@@ -203,11 +248,16 @@ for f in sys.argv[1:]:
 w.drive()
 h.ready()
 
-fds = [dev.device.fileno() for dev in d]
+owner = dict((dev.device, dev) for dev in d)
+devices = linux_event.InputDeviceSet([dev.device for dev in d],
+    reconnected=lambda device: owner[device].resync())
+
+# the timeout only bounds how quickly the LED, reset and scale inputs are seen
 try:
     while 1:
-	select.select(fds, [], [], .01)
-	for i in d: i.update()
-	w.drive()
+        for device, events in devices.poll(.01, decode=False):
+            owner[device].read(events)
+        for i in d: i.update()
+        w.drive()
 except KeyboardInterrupt:
     pass
@@ -9,6 +9,8 @@ Created by Alexander Rössler on 2015-01-03.
 import time
 import sys
 import os
+import stat
+import tempfile
 import argparse
 
 import ConfigParser
@@ -16,30 +18,109 @@ import ConfigParser
 import hal
 
 
+# optional section mapping "<section>.<name>" to a pin type, pins default
+# to float
+TYPES_SECTION = 'types'
+PIN_TYPES = {
+    'bit': (hal.HAL_BIT, lambda s: s.strip().lower() in ('1', 'true', 'yes', 'on')),
+    's32': (hal.HAL_S32, lambda s: int(float(s))),
+    'u32': (hal.HAL_U32, lambda s: int(float(s))),
+    'float': (hal.HAL_FLOAT, float),
+}
+
+
 class Pin:
     def __init__(self):
         self.halPin = 0
         self.halName = ''
         self.section = ''
         self.name = ''
+        self.type = 'float'
         self.lastValue = 0.0
-        
-        
-def savePins(cfg, filename, pins):
-    for pin in pins:
-        cfg.set(pin.section, pin.name, str(pin.halPin.value))
-    with open(filename, 'w') as f:
-        cfg.write(f)
-        f.close()
-        
-        
-def readPins(cfg, filename, pins):
-    cfg.read(filename)
-    for pin in pins:
-        pin.lastValue = float(cfg.get(pin.section, pin.name))
-        pin.halPin.value = pin.lastValue
-        
-        
+
+    def parse(self, text):
+        return PIN_TYPES[self.type][1](text)
+
+    def format(self, value):
+        if self.type == 'bit':
+            return str(int(value))
+        return str(value)
+
+
+class Storage:
+    """Writes the pin values back to the file.
+
+    Changed pins are collected and written together with a single atomic
+    file replacement, once no pin changed for debounce seconds and at most
+    every minInterval seconds. Values which keep changing are still written
+    maxDelay seconds after the first unsaved change.
+    """
+
+    def __init__(self, cfg, filename, pins, debounce=0.0, minInterval=0.0,
+                 maxDelay=10.0):
+        self.cfg = cfg
+        self.filename = filename
+        self.pins = pins
+        self.debounce = debounce
+        self.minInterval = minInterval
+        self.maxDelay = maxDelay
+        self.dirty = set()
+        self.firstChange = 0.0
+        self.lastChange = 0.0
+        self.lastWrite = 0.0
+
+    def read(self):
+        self.cfg.read(self.filename)
+        for pin in self.pins:
+            pin.lastValue = pin.parse(self.cfg.get(pin.section, pin.name))
+            pin.halPin.value = pin.lastValue
+        self.dirty.clear()
+
+    def write(self):
+        for pin in self.pins:
+            pin.lastValue = pin.halPin.value
+            self.cfg.set(pin.section, pin.name, pin.format(pin.lastValue))
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                self.cfg.write(f)
+                f.flush()
+                os.fsync(f.fileno())
+            if os.path.exists(self.filename):
+                os.chmod(tmp, stat.S_IMODE(os.stat(self.filename).st_mode))
+            os.rename(tmp, self.filename)
+        except:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        self.dirty.clear()
+        self.lastWrite = time.time()
+
+    def poll(self, now):
+        for pin in self.pins:
+            if pin.halPin.value != pin.lastValue:
+                pin.lastValue = pin.halPin.value
+                if not self.dirty:
+                    self.firstChange = now
+                self.dirty.add(pin)
+                self.lastChange = now
+
+    def due(self):
+        """Time at which the pending changes are written, None if clean"""
+        if not self.dirty:
+            return None
+        settled = min(self.lastChange + self.debounce,
+                      self.firstChange + self.maxDelay)
+        return max(settled, self.lastWrite + self.minInterval)
+
+    def update(self, now):
+        self.poll(now)
+        due = self.due()
+        if due is not None and now >= due:
+            self.write()
+
+
 parser = argparse.ArgumentParser(description='HAL component to store and load values')
 parser.add_argument('-n', '--name', help='HAL component name', required=True)
 parser.add_argument('-f', '--file', help='Filename to store values', required=True)
@@ -47,6 +128,9 @@ parser.add_argument('-x', '--on_exit', help='Save on exit', action='store_true')
 parser.add_argument('-a', '--autosave', help='Automatically save on value change', action='store_true')
 parser.add_argument('-l', '--autoload', help='Automatically load the file values', action='store_true')
 parser.add_argument('-i', '--interval', help='Update interval', default=1.00)
+parser.add_argument('-d', '--debounce', help='Autosave only after values did not change for this time', default=0.5)
+parser.add_argument('-m', '--min_interval', help='Minimum time between two autosaves', default=2.0)
+parser.add_argument('-M', '--max_delay', help='Autosave values which keep changing after this time', default=10.0)
 
 args = parser.parse_args()
 
@@ -66,21 +150,33 @@ if not os.path.isfile(filename):
 
 cfg = ConfigParser.ConfigParser()
 cfg.read(filename)
+types = {}
+if cfg.has_section(TYPES_SECTION):
+    types = dict(cfg.items(TYPES_SECTION))
 h = hal.component(args.name)
 for section in cfg.sections():
+    if section == TYPES_SECTION:
+        continue
     for item in cfg.items(section):
         pin = Pin()
         pin.section = section
         pin.name = item[0]
         pin.halName = section.lower() + '.' + item[0].lower()
-        pin.halPin = h.newpin(pin.halName, hal.HAL_FLOAT, hal.HAL_IO)
+        pin.type = types.get(pin.halName, 'float').lower()
+        if pin.type not in PIN_TYPES:
+            sys.stderr.write('Error: Unknown type %s of pin %s.\n' % (pin.type, pin.halName))
+            sys.exit(1)
+        pin.halPin = h.newpin(pin.halName, PIN_TYPES[pin.type][0], hal.HAL_IO)
         pins.append(pin)
 halReadTriggerPin = h.newpin("read-trigger", hal.HAL_BIT, hal.HAL_IN)
 halWriteTriggerPin = h.newpin("write-trigger", hal.HAL_BIT, hal.HAL_IN)
 h.ready()
 
+storage = Storage(cfg, filename, pins, float(args.debounce), float(args.min_interval),
+                  float(args.max_delay))
+
 if autoload:
-    readPins(cfg, filename, pins)
+    storage.read()
     loaded = True
 
 lastReadTrigger = 0
@@ -90,22 +186,27 @@ try:
     while (True):
         if lastReadTrigger ^ halReadTriggerPin.value:
             lastReadTrigger = halReadTriggerPin.value
-            readPins(cfg, filename, pins)
+            storage.read()
             loaded = True
-            
+
         if lastWriteTrigger ^ halWriteTriggerPin.value:
             lastWriteTrigger = halWriteTriggerPin.value
-            savePins(cfg, filename, pins)
-            
+            storage.write()
+
+        timeout = updateInterval
         if autosave and loaded:
-            for pin in pins:
-                if pin.halPin.value != pin.lastValue:
-                    pin.lastValue = pin.halPin.value
-                    savePins(cfg, filename, pins)
-                    
-        time.sleep(updateInterval)
+            now = time.time()
+            storage.update(now)
+            due = storage.due()
+            if due is not None:
+                timeout = max(0.0, min(timeout, due - now))
+
+        time.sleep(timeout)
 except KeyboardInterrupt:
-    if saveOnExit:
-        savePins(cfg, filename, pins)
+    # pick up changes since the last update
+    if autosave and loaded:
+        storage.poll(time.time())
+    if saveOnExit or (autosave and storage.dirty):
+        storage.write()
     print(("exiting HAL component " + args.name))
     h.exit()
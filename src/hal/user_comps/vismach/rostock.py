@@ -41,6 +41,9 @@ class DeltaTranslate(Collection):
         self.parts = parts
         self.x = self.y = self.z = 0
 
+    def state(self):
+        return [self.comp[n] for n in ('R', 'L', 'joint0', 'joint1', 'joint2')]
+
     def apply(self):
         glPushMatrix()
         lineardeltakins.set_geometry(self.comp['R'], self.comp['L'])        
@@ -64,6 +67,9 @@ class TriangularPrismZ:
         self.z1 = z1
         self.h = h
 
+    def state(self):
+        return None
+
     def draw(self):
         x0 = 0
         x1 = -self.h*sin(pi/3)
@@ -129,6 +135,10 @@ class Strut:
         self.joint = joint
         self.q = gluNewQuadric()
 
+    def state(self):
+        return (self.component['R'], self.component['L'],
+            self.component[self.joint])
+
     def draw(self):
         c = cos(self.angle)
         s = sin(self.angle)
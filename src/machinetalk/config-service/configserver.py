@@ -1,11 +1,12 @@
 #!/usr/bin/python2
 import os
 import sys
-from stat import S_ISREG, S_ISDIR
+from stat import S_ISREG
 import zmq
 import threading
 import signal
 import time
+import hashlib
 import argparse
 
 import ConfigParser
@@ -18,6 +19,49 @@ from machinetalk.protobuf.config_pb2 import CLEARTEXT, QT5_QML, GLADEVCP, JAVASC
 import machinetalk.protobuf.types_pb2 as pb
 
 
+class AppCache(object):
+    """Content addressed cache of the files of an application.
+
+    Files are only read again when their mtime or size changed, their
+    content is stored once per SHA-1 hash.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.files = []  # sorted (name, mtime, size, hash)
+        self.blobs = {}  # hash -> content
+
+    def update(self):
+        old = dict((f[0], f) for f in self.files)
+        files = []
+        for root, dirs, names in os.walk(self.path, followlinks=True):
+            dirs.sort()
+            for f in sorted(names):
+                pathname = os.path.join(root, f)
+                try:
+                    st = os.stat(pathname)
+                except OSError:
+                    continue
+                if not S_ISREG(st.st_mode):
+                    continue
+                # same naming as the files were always sent with
+                name = os.path.join(os.path.relpath(root, self.path), f)
+                entry = old.get(name)
+                if entry is None or entry[1:3] != (st.st_mtime, st.st_size) \
+                   or entry[3] not in self.blobs:
+                    data = open(pathname, 'rb').read()
+                    digest = hashlib.sha1(data).digest()
+                    self.blobs[digest] = data
+                    entry = (name, st.st_mtime, len(data), digest)
+                files.append(entry)
+        self.files = files
+
+        used = set(f[3] for f in files)
+        for digest in list(self.blobs.keys()):
+            if digest not in used:
+                del self.blobs[digest]
+
+
 class ConfigServer(object):
     def __init__(self, context, appDirs=None, topdir=".",
                  host='', svcUuid=None, debug=False, name=None,
@@ -53,6 +97,7 @@ class ConfigServer(object):
                         print(("type: " + cfg.get('Default', 'type')))
                         print(("files: " + root))
 
+        self.appCaches = {}
         self.rx = Container()
         self.tx = Container()
         self.topdir = topdir
@@ -136,34 +181,74 @@ class ConfigServer(object):
             app.type = self.typeToPb(self.cfg.get(name, 'type'))
         self.send_msg(origin, pb.MT_DESCRIBE_APPLICATION)
 
-    def add_files(self, basePath, path, app):
-        if self.debug:
-            print(("add files " + path))
-        for f in os.listdir(path):
-            pathname = os.path.join(path, f)
-            mode = os.stat(pathname).st_mode
-            if S_ISREG(mode):
-                filename = os.path.join(os.path.relpath(path, basePath), f)
-                if self.debug:
-                    print(("add " + pathname))
-                    print(("name " + filename))
-                fileBuffer = open(pathname, 'rb').read()
-                appFile = app.file.add()
-                appFile.name = filename
-                appFile.encoding = CLEARTEXT
-                appFile.blob = fileBuffer
-            elif S_ISDIR(mode):
-                self.add_files(basePath, pathname, app)
-
-    def retrieve_app(self, origin, name):
+    def app_cache(self, name):
+        cache = self.appCaches.get(name)
+        if cache is None:
+            cache = AppCache(self.cfg.get(name, 'files'))
+            self.appCaches[name] = cache
+        cache.update()
+        return cache
+
+    def add_file(self, app, name, size, digest, blob=None, offset=None):
+        appFile = app.file.add()
+        appFile.name = name
+        appFile.encoding = CLEARTEXT
+        appFile.hash = digest
+        appFile.size = size
+        if blob is not None:
+            appFile.blob = blob
+        if offset is not None:
+            appFile.offset = offset
+
+    def send_parts(self, origin, name, cache, files, chunkSize):
+        app = self.tx.app.add()
+        app.name = name
+        used = 0
+        for fileName, _, size, digest in files:
+            data = cache.blobs[digest]
+            offset = 0
+            while True:
+                if used >= chunkSize:
+                    self.send_msg(origin, pb.MT_APPLICATION_DETAIL_PART)
+                    app = self.tx.app.add()
+                    app.name = name
+                    used = 0
+                blob = data[offset:offset + chunkSize - used]
+                self.add_file(app, fileName, size, digest, blob, offset)
+                used += len(blob)
+                offset += len(blob)
+                if offset >= size:
+                    break
+        if used > 0:
+            self.send_msg(origin, pb.MT_APPLICATION_DETAIL_PART)
+        else:
+            self.tx.Clear()
+
+    def retrieve_app(self, origin, request):
+        name = request.name
         if self.debug:
             print(("retrieve app " + name))
+        cache = self.app_cache(name)
+        # files the client already has
+        known = dict((f.name, f.hash) for f in request.file if f.HasField('hash'))
+        changed = [f for f in cache.files if known.get(f[0]) != f[3]]
+        chunkSize = request.chunk_size
+        if chunkSize > 0 and changed:
+            self.send_parts(origin, name, cache, changed, chunkSize)
+            changed = []
+        changed = set(f[0] for f in changed)
+
         app = self.tx.app.add()
         app.name = name
         app.description = self.cfg.get(name, 'description')
         app.type = self.typeToPb(self.cfg.get(name, 'type'))
-        self.add_files(self.cfg.get(name, 'files'),
-                       self.cfg.get(name, 'files'), app)
+        for fileName, _, size, digest in cache.files:
+            if fileName in changed:
+                if self.debug:
+                    print(("add " + fileName))
+                self.add_file(app, fileName, size, digest, cache.blobs[digest])
+            else:
+                self.add_file(app, fileName, size, digest)
 
         self.send_msg(origin, pb.MT_APPLICATION_DETAIL)
 
@@ -188,7 +273,7 @@ class ConfigServer(object):
 
         elif self.rx.type == pb.MT_RETRIEVE_APPLICATION:
             a = self.rx.app[0]
-            self.retrieve_app(identity, a.name)
+            self.retrieve_app(identity, a)
 
         elif self.rx.type == pb.MT_PING:
             self.send_msg(identity, pb.MT_PING_ACKNOWLEDGE)
@@ -7,7 +7,8 @@ import zmq
 import threading
 import time
 import signal
-import math
+import errno
+import select
 import subprocess
 import fcntl
 import shlex
@@ -15,6 +16,12 @@ import dbus
 import logging
 
 from operator import attrgetter
+from collections import deque
+
+if sys.version_info >= (3, 0):
+    import queue
+else:
+    import Queue as queue
 
 from machinekit import service
 from machinekit import config
@@ -80,11 +87,172 @@ class LauncherImportance(object):
         return str(self._importances)
 
 
+class OutputBuffer(object):
+    ''' keeps the last max_lines stdout lines of a process with their sequence numbers '''
+
+    def __init__(self, max_lines=1000):
+        self._lines = deque(maxlen=max_lines)
+        self.next_sequence = 0
+
+    def append(self, line, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        entry = (self.next_sequence, timestamp, line)
+        self._lines.append(entry)
+        self.next_sequence += 1
+        return entry
+
+    def clear(self):
+        self._lines.clear()
+        self.next_sequence = 0
+
+    @property
+    def first_sequence(self):
+        if self._lines:
+            return self._lines[0][0]
+        return self.next_sequence
+
+    def since(self, sequence=0):
+        ''' returns the buffered (sequence, timestamp, line) tuples starting with sequence '''
+        skip = max(0, sequence - self.first_sequence)
+        return list(self._lines)[skip:]
+
+    def __len__(self):
+        return len(self._lines)
+
+
+class OutputReader(object):
+    ''' reads the stdout pipes of all processes in a single thread
+
+    Output is split into lines which are put into the queue as
+    (index, timestamp, line) tuples.  A line without a terminating newline
+    is passed on once it is older than partial_timeout or the pipe is closed.
+    Such partial lines are only cut between UTF-8 characters.
+    When a pipe is added (index, None, None) is queued first, marking the
+    start of a new process.  wakeup is set whenever something was queued.
+    '''
+
+    def __init__(self, shutdown, wakeup=None, partial_timeout=0.2, chunk_size=4096):
+        self.shutdown = shutdown
+        self.wakeup = wakeup
+        self.partial_timeout = partial_timeout
+        self.chunk_size = chunk_size
+        self.queue = queue.Queue()
+        self._epoll = select.epoll()
+        self._lock = threading.Lock()
+        self._pipes = {}  # fd -> [index, partial line, time of partial line]
+
+    def add(self, index, pipe):
+        fd = pipe.fileno()
+        self.queue.put((index, None, None))
+        with self._lock:
+            self._pipes[fd] = [index, b'', 0.0]
+        self._epoll.register(fd, select.EPOLLIN | select.EPOLLHUP)
+
+    def _remove(self, fd):
+        with self._lock:
+            del self._pipes[fd]
+        try:
+            self._epoll.unregister(fd)
+        except (IOError, OSError, ValueError):
+            pass
+
+    def _read(self, fd, now):
+        with self._lock:
+            pipe = self._pipes.get(fd)
+        if pipe is None:
+            return False
+        try:
+            data = os.read(fd, self.chunk_size)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return False
+            data = b''
+
+        index, partial = pipe[0], pipe[1]
+        if not data:  # end of file
+            if partial:
+                self.queue.put((index, now, self._decode(partial)))
+            self._remove(fd)
+            return bool(partial)
+
+        lines = (partial + data).split(b'\n')
+        if not partial:
+            pipe[2] = now
+        pipe[1] = lines.pop()
+        for line in lines:
+            self.queue.put((index, now, self._decode(line + b'\n')))
+        queued = len(lines) > 0
+        if len(pipe[1]) >= self.chunk_size:  # do not wait forever for a newline
+            queued |= self._queue_partial(pipe, now)
+        return queued
+
+    @staticmethod
+    def _decode(line):
+        # also on Python 2, the protobuf string field only takes valid UTF-8
+        return line.decode('utf-8', 'replace')
+
+    @staticmethod
+    def _utf8_end(data):
+        # length of data without a trailing incomplete UTF-8 character
+        tail = bytearray(data[-3:])
+        for i in range(1, len(tail) + 1):
+            c = tail[-i]
+            if c & 0xc0 != 0x80:  # not a continuation byte
+                if c >= 0xf0:
+                    size = 4
+                elif c >= 0xe0:
+                    size = 3
+                elif c >= 0xc0:
+                    size = 2
+                else:
+                    size = 1
+                if i < size:
+                    return len(data) - i
+                break
+        return len(data)
+
+    def _queue_partial(self, pipe, now):
+        # the rest of an incomplete character stays for the next read
+        end = self._utf8_end(pipe[1])
+        if end == 0:
+            return False
+        self.queue.put((pipe[0], now, self._decode(pipe[1][:end])))
+        pipe[1] = pipe[1][end:]
+        pipe[2] = now
+        return True
+
+    def _flush_partial(self, now):
+        flushed = False
+        with self._lock:
+            for pipe in self._pipes.values():
+                if pipe[1] and (now - pipe[2]) >= self.partial_timeout:
+                    flushed |= self._queue_partial(pipe, now)
+        return flushed
+
+    def run(self):
+        while not self.shutdown.is_set():
+            try:
+                events = self._epoll.poll(self.partial_timeout)
+            except IOError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            now = time.time()
+            queued = False
+            for fd, _ in events:
+                queued |= self._read(fd, now)
+            queued |= self._flush_partial(now)
+            if queued and self.wakeup is not None:
+                self.wakeup.set()
+
+
 class Mklauncher(object):
     def __init__(self, context, launcher_dirs=None, host='',
                  svc_uuid='', debug=False, name=None, host_in_name=True,
                  poll_interval=0.5, ping_interval=2.0, loopback=False,
-                 config_dir='~/.config/machinekit/mklauncher'):
+                 config_dir='~/.config/machinekit/mklauncher',
+                 output_lines=1000):
         if launcher_dirs is None:
             launcher_dirs = []
 
@@ -94,6 +262,7 @@ class Mklauncher(object):
         self.name = name
         self.debug = debug
         self.shutdown = threading.Event()
+        self.wakeup = threading.Event()  # set when process output is available
         self.running = False
         self.poll_interval = poll_interval
         self.ping_interval = ping_interval
@@ -109,6 +278,10 @@ class Mklauncher(object):
 
         self.processes = {}  # for processes mapped to launcher
         self.terminating = set()  # set of terminating processes
+        # stdout lines are not stored in the container, full updates only
+        # carry the launcher state and clients fetch older lines on demand
+        self.outputs = {}
+        self.output_reader = OutputReader(self.shutdown, self.wakeup)
 
         launchers, ids = self._search_launchers(self.launcher_dirs)
         self._launcher_ids = {}
@@ -117,19 +290,13 @@ class Mklauncher(object):
             launcher.index = index
             self.container.launcher.extend([launcher])
             self.tx_container.launcher.add().CopyFrom(launcher)
+            self.outputs[index] = OutputBuffer(output_lines)
         logger.debug('parsed launchers:\n%s' % str(self.container))
 
         config_file = os.path.expanduser(os.path.join(config_dir, 'importances.ini'))
         self._importances = LauncherImportance(config_file)
         self._importances.load()
 
-        # prepare pings
-        if self.ping_interval > 0:
-            self.ping_ratio = math.floor(self.ping_interval / self.poll_interval)
-        else:
-            self.ping_ratio = -1
-        self.pingCount = 0
-
         self._create_sockets(context)
         self._create_services(host_in_name, svc_uuid)
 
@@ -215,6 +382,7 @@ class Mklauncher(object):
     def _start_threads(self):
         threading.Thread(target=self._process_sockets).start()
         threading.Thread(target=self._poll).start()
+        threading.Thread(target=self.output_reader.run).start()
         self.running = True
 
     def _create_sockets(self, context):
@@ -290,9 +458,29 @@ class Mklauncher(object):
         parameters.keepalive_timer = int(self.ping_interval * 1000.0)
         self.tx_container.pparams.MergeFrom(parameters)
 
+    def _read_output(self):
+        ''' moves the lines queued by the output reader to the output buffers,
+        returns the new (sequence, timestamp, line) tuples by launcher index '''
+        new_lines = {}
+        while True:
+            try:
+                index, timestamp, line = self.output_reader.queue.get_nowait()
+            except queue.Empty:
+                break
+            output = self.outputs[index]
+            if line is None:  # a new process was started
+                if output.next_sequence > 0:
+                    output.clear()  # clear output for new processes
+                    self.launcher_full_update = True  # request a full update
+                new_lines[index] = []
+                continue
+            new_lines.setdefault(index, []).append(output.append(line, timestamp))
+        return new_lines
+
     def _update_launcher_status(self):
         tx_launcher = Launcher()  # new pb message for tx
         has_update = False
+        new_lines = self._read_output()
 
         for launcher in self.container.launcher:
             modified = False
@@ -303,6 +491,8 @@ class Mklauncher(object):
                 tx_launcher.importance = importance
                 modified = True
 
+            lines = new_lines.get(index, [])
+            modified = modified or len(lines) > 0
             terminating = False
             if index in self.terminating:
                 terminating = True
@@ -314,25 +504,9 @@ class Mklauncher(object):
                 returncode = process.returncode
                 if returncode is None:
                     if not launcher.running:  # update running value
-                        if len(launcher.output) > 0:
-                            launcher.ClearField('output')  # clear output for new processes
-                            self.launcher_full_update = True  # request a full update
                         tx_launcher.running = True
                         tx_launcher.returncode = 0
                         modified = True
-                    # read stdout
-                    stdout_index = len(launcher.output)
-                    while True:
-                        try:
-                            line = process.stdout.read()
-                            stdoutLine = StdoutLine()
-                            stdoutLine.index = stdout_index
-                            stdoutLine.line = line
-                            tx_launcher.output.add().MergeFrom(stdoutLine)
-                            stdout_index += 1
-                            modified = True
-                        except IOError:  # process has no new line
-                            break
                     # send termination status
                     if terminating:
                         tx_launcher.terminating = True
@@ -345,6 +519,7 @@ class Mklauncher(object):
             if modified:
                 launcher.MergeFrom(tx_launcher)
                 tx_launcher.index = index
+                self._add_output_lines(tx_launcher, lines)
                 self.tx_container.launcher.add().MergeFrom(tx_launcher)
                 tx_launcher.Clear()
                 has_update = True
@@ -352,11 +527,21 @@ class Mklauncher(object):
         if self.launcher_full_update:
             self._add_pparams_to_message()
             self.tx_container.CopyFrom(self.container)
+            for launcher in self.tx_container.launcher:
+                self._add_output_lines(launcher, new_lines.get(launcher.index, []))
             self._send_launcher_message(pb.MT_LAUNCHER_FULL_UPDATE)
             self.launcher_full_update = False
         elif has_update:
             self._send_launcher_message(pb.MT_LAUNCHER_INCREMENTAL_UPDATE)
 
+    def _add_output_lines(self, launcher, lines):
+        for sequence, timestamp, line in lines:
+            stdoutLine = StdoutLine()
+            stdoutLine.index = sequence
+            stdoutLine.timestamp = timestamp
+            stdoutLine.line = line
+            launcher.output.add().MergeFrom(stdoutLine)
+
     def _send_launcher_message(self, msgType):
         logger.debug('sending launcher message')
         self.tx_container.type = msgType
@@ -371,17 +556,22 @@ class Mklauncher(object):
         self.tx.Clear()
 
     def _poll(self):
+        next_ping = time.time() + self.ping_interval
         while not self.shutdown.is_set():
+            # process output wakes us up immediately
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
+
             if self.launcher_subscribed:
                 self._update_launcher_status()
-                if (self.pingCount == self.ping_ratio):
-                    self._send_launcher_message(pb.MT_PING)
-
-            if (self.pingCount == self.ping_ratio):
-                self.pingCount = 0
             else:
-                self.pingCount += 1
-            time.sleep(self.poll_interval)
+                self._read_output()
+
+            now = time.time()
+            if self.ping_interval > 0 and now >= next_ping:
+                if self.launcher_subscribed:
+                    self._send_launcher_message(pb.MT_PING)
+                next_ping = now + self.ping_interval
 
         self.running = False
         return
@@ -422,6 +612,7 @@ class Mklauncher(object):
         # set the O_NONBLOCK flag of stdout file descriptor:
         flags = fcntl.fcntl(process.stdout, fcntl.F_GETFL)  # get current stdout flags
         fcntl.fcntl(process.stdout, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        self.output_reader.add(index, process.stdout)
         self.processes[index] = process
         return True, ''
 
@@ -535,6 +726,21 @@ class Mklauncher(object):
                 self.tx.note.append("cannot shutdown system: DBus error")
                 self._send_command_message(identity, pb.MT_ERROR)
 
+        elif self.rx.type == pb.MT_LAUNCHER_GET_OUTPUT:
+            if self.rx.HasField('index'):
+                index = self.rx.index
+                if index >= len(self.container.launcher):
+                    self._send_command_wrong_index(identity)
+                else:
+                    # sequence is the first line requested, oldest available by default
+                    output = self.outputs[index]
+                    tx_launcher = self.tx.launcher.add()
+                    tx_launcher.index = index
+                    self._add_output_lines(tx_launcher, output.since(self.rx.sequence))
+                    self._send_command_message(identity, pb.MT_LAUNCHER_OUTPUT)
+            else:
+                self._send_command_wrong_params(identity)
+
         elif self.rx.type == pb.MT_LAUNCHER_SET:
             for launcher in self.rx.launcher:
                 if not launcher.HasField('index') \
@@ -579,6 +785,7 @@ def main():
     parser.add_argument('-n', '--name', help='Name of the machine', default="Machinekit Launcher")
     parser.add_argument('-s', '--suppress_ip', help='Do not show ip of machine in service name', action='store_false')
     parser.add_argument('-d', '--debug', help='Enable debug mode', action='store_true')
+    parser.add_argument('-o', '--output_lines', help='Number of stdout lines kept per launcher', type=int, default=1000)
     parser.add_argument('dirs', nargs='*', help="List of directories to scan for launcher configurations")
 
     args = parser.parse_args()
@@ -622,7 +829,8 @@ def main():
                             name=args.name,
                             host_in_name=bool(args.suppress_ip),
                             loopback=(not remote),
-                            debug=debug)
+                            debug=debug,
+                            output_lines=args.output_lines)
     mklauncher.start()
 
     while mklauncher.running and not check_exit():
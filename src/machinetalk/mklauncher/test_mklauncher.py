@@ -5,7 +5,7 @@ import os
 import_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), '../../../lib/python/')
 sys.path.insert(0, os.path.abspath(import_path))
 
-from mklauncher import Mklauncher, LauncherImportance
+from mklauncher import Mklauncher, LauncherImportance, OutputBuffer, OutputReader
 
 
 @pytest.fixture
@@ -139,3 +139,93 @@ def test_updating_launcher_importance_works(context, single_launcher_file, confi
     launchers = launcher.container.launcher
     assert len(launchers) == 1
     assert launchers[0].importance == 5
+
+
+def test_output_buffer_keeps_last_lines_with_sequence():
+    output = OutputBuffer(max_lines=3)
+
+    for i in range(5):
+        output.append('line %i' % i, timestamp=i)
+
+    assert len(output) == 3
+    assert output.first_sequence == 2
+    assert output.since() == [(2, 2, 'line 2'), (3, 3, 'line 3'), (4, 4, 'line 4')]
+    assert output.since(4) == [(4, 4, 'line 4')]
+    assert output.since(5) == []
+
+
+def test_output_buffer_clear_restarts_sequence():
+    output = OutputBuffer(max_lines=3)
+    output.append('foo')
+
+    output.clear()
+
+    assert output.since() == []
+    assert output.append('bar', timestamp=1.0) == (0, 1.0, 'bar')
+
+
+def test_output_reader_splits_lines():
+    import threading
+    shutdown = threading.Event()
+    reader = OutputReader(shutdown, partial_timeout=0.0)
+    r, w = os.pipe()
+    pipe = os.fdopen(r, 'rb')
+    reader.add(3, pipe)
+
+    os.write(w, b'foo\nbar\nba')
+    os.write(w, b'z\npartial')
+    os.close(w)
+    while reader._pipes:
+        reader._read(r, 1.0)
+
+    lines = []
+    while not reader.queue.empty():
+        lines.append(reader.queue.get())
+    assert lines == [(3, None, None), (3, 1.0, 'foo\n'), (3, 1.0, 'bar\n'),
+                     (3, 1.0, 'baz\n'), (3, 1.0, 'partial')]
+
+
+def test_output_reader_splits_long_lines():
+    import threading
+    shutdown = threading.Event()
+    reader = OutputReader(shutdown, partial_timeout=0.0, chunk_size=8)
+    r, w = os.pipe()
+    pipe = os.fdopen(r, 'rb')
+    reader.add(3, pipe)
+
+    os.write(w, b'0123456789abcdef\nxy')
+    os.close(w)
+    while reader._pipes:
+        reader._read(r, 1.0)
+
+    lines = []
+    while not reader.queue.empty():
+        lines.append(reader.queue.get()[2])
+    assert lines == [None, '01234567', '89abcdef', '\n', 'xy']
+    assert ''.join(lines[1:]) == '0123456789abcdef\nxy'
+
+
+def test_output_reader_cuts_long_lines_between_characters():
+    import threading
+    shutdown = threading.Event()
+    reader = OutputReader(shutdown, partial_timeout=0.0, chunk_size=8)
+    r, w = os.pipe()
+    pipe = os.fdopen(r, 'rb')
+    reader.add(3, pipe)
+
+    text = u'0123456\u00e4\u20acx\n\u00e4'
+    data = text.encode('utf-8')
+    os.write(w, data[:8])  # ends in the middle of the first character
+    reader._read(r, 1.0)
+    reader._flush_partial(2.0)
+    os.write(w, data[8:-1])
+    os.close(w)
+    while reader._pipes:
+        reader._read(r, 3.0)
+
+    lines = []
+    while not reader.queue.empty():
+        lines.append(reader.queue.get()[2])
+    assert lines[0] is None
+    assert u''.join(lines[1:]) == text[:-1] + u'\ufffd'
+    assert u'\ufffd' not in u''.join(lines[1:-1])
@@ -7,7 +7,6 @@ import zmq
 import threading
 import multiprocessing
 import time
-import math
 import socket
 import signal
 import argparse
@@ -17,6 +16,9 @@ import tempfile
 import subprocess
 import re
 import codecs
+import functools
+import collections
+import Queue
 import ConfigParser
 import linuxcnc
 from machinekit import service
@@ -186,86 +188,80 @@ class PreviewCanon():
 
 
 # Preview class works concurrently using multiprocessing
-# Queues are used for communication
+# A persistent worker process serves preview requests received through a
+# request queue and reports back through a response queue, both are
+# blocking, so no polling is involved. Every request gets an increasing id.
+# Requests are served in order, so queued jobs of different files all get
+# their preview. A newer request for the same file supersedes the older
+# ones: queued ones are skipped and the one in flight is aborted at its
+# next check_abort. abort() cancels every request issued so far.
+# The preview module binds its publishing sockets once per process, so all
+# requests are served by the same worker to keep a single preview stream.
 class Preview():
-    def __init__(self, stat, randomToolchanger=False, parameterFile="", initcode="", debug=False):
+    def __init__(self, stat, randomToolchanger=False, parameterFile="", initcode="",
+                 batchSize=100, flushInterval=0.0, debug=False):
         self.debug = debug
         self.filename = ""
+        self.totalLines = 0
+        self.batchSize = batchSize  # preview messages per published container
+        self.flushInterval = flushInterval  # seconds, publish partial batches
         self.unitcode = ""
         self.initcode = initcode
         self.stat = stat
         self.parameterFile = parameterFile
         self.randomToolchanger = randomToolchanger
-        self.canon = None
         self.preview = None
         self.errorCallback = None
+        self.isBound = False
+        self.tempdirs = {}  # request id -> temp dir
+        self.tempdirLock = threading.Lock()
 
         # multiprocessing tools
-        self.bindEvent = multiprocessing.Event()
-        self.bindCompletedEvent = multiprocessing.Event()
-        self.previewEvent = multiprocessing.Event()
-        self.previewCompleteEvent = multiprocessing.Event()
-        self.shutdownEvent = multiprocessing.Event()
-        self.errorEvent = multiprocessing.Event()
-        self.isStarted = multiprocessing.Value('b', False, lock=False)
-        self.isBound = multiprocessing.Value('b', False, lock=False)
-        self.isRunning = multiprocessing.Value('b', False, lock=False)
-        self.aborted = multiprocessing.Value('b', False, lock=False)
-        self.inqueue = multiprocessing.Queue()  # used to send data to the process
-        self.outqueue = multiprocessing.Queue()  # used to get data from the process
+        self.requestId = multiprocessing.Value('i', 0)  # newest request
+        self.abortedId = multiprocessing.Value('i', 0)  # newest aborted request
+        self.requests = multiprocessing.Queue()  # requests to the worker
+        self.pending = collections.deque()  # requests taken in by the worker
+        self.responses = multiprocessing.Queue()  # responses from the worker
         self.process = multiprocessing.Process(target=self.run)
         self.process.start()
+        self.responseThread = None
 
     def register_error_callback(self, callback):
         self.errorCallback = callback
 
     def bind(self, previewUri, statusUri):
-        self.inqueue.put((previewUri, statusUri))
-        self.bindEvent.set()
-        self.bindCompletedEvent.wait()
-        return self.outqueue.get()
+        self.requests.put(('bind', previewUri, statusUri))
+        (response, previewUri, statusUri) = self.responses.get()
+        self.isBound = True
+        self.responseThread = threading.Thread(target=self.response_thread)
+        self.responseThread.daemon = True
+        self.responseThread.start()
+        return (previewUri, statusUri)
 
     def abort(self):
-        self.aborted.value = True
+        # by id, so an abort also hits a request that is still queued
+        self.abortedId.value = self.requestId.value
 
-    def program_open(self, filename):
+    def program_open(self, filename, totalLines=0):
         if os.path.isfile(filename):
             self.filename = filename
+            self.totalLines = totalLines
         else:
             raise Exception("file does not exist " + filename)
 
     def start(self):
-        if self.isRunning.value is True:
-            raise Exception("Preview already running")
-
-        # start the monitoring daemon
-        thread = threading.Thread(target=self.monitoring_thread)
-        thread.daemon = True
-        thread.start()
-
-    def stop(self):
-        self.shutdownEvent.set()
-        self.previewCompleteEvent.set()  # in case we are monitoring
-        self.process.join()  # make sure to have one process at exit
-
-    def monitoring_thread(self):
-        if not self.isBound.value:
+        if not self.isBound:
             raise Exception('Preview is not bound')
 
-        self.isRunning.value = True
-
-        # create temp dir
+        # snapshot the parameter file, the interpreter modifies it
         tempdir = tempfile.mkdtemp()
-
-        # prepare Canon data
-        canon = PreviewCanonData()
-        tools = []
-        for entry in self.stat.tool_table:
-            tools.append(tuple(entry))
-        canon.tools = tools
         temp_parameter = os.path.join(tempdir, os.path.basename(self.parameterFile))
         if os.path.exists(self.parameterFile):
             shutil.copy(self.parameterFile, temp_parameter)
+
+        # prepare Canon data
+        canon = PreviewCanonData()
+        canon.tools = [tuple(entry) for entry in self.stat.tool_table]
         canon.parameterFile = temp_parameter
         canon.randomToolchanger = self.randomToolchanger
         canon.axisMask = self.stat.axis_mask
@@ -274,71 +270,98 @@ class Preview():
         canon.linearUnits = self.stat.linear_units
 
         self.unitcode = "G%d" % (20 + (self.stat.linear_units == 1))
-        # put everything on the process queue
-        while not self.inqueue.empty():
-            self.inqueue.get_nowait()
-        self.inqueue.put((self.filename, self.unitcode, self.initcode, canon))
-        # release the dragon
-        self.previewCompleteEvent.clear()
-        self.previewEvent.set()
-        self.previewCompleteEvent.wait()
-        # handle error events
-        if self.errorEvent.wait(0.1):
-            (error, line) = self.outqueue.get()
-            if self.errorCallback is not None:
-                self.errorCallback(error, line)
-            self.errorEvent.clear()
+        with self.tempdirLock:
+            self.requestId.value += 1
+            requestId = self.requestId.value
+            self.tempdirs[requestId] = tempdir
+        # supersedes queued and running requests of the same file
+        self.requests.put(('preview', requestId, self.filename, self.unitcode,
+                           self.initcode, canon, self.totalLines))
+        return requestId
 
-        # cleanup temp dir
-        shutil.rmtree(tempdir)
-
-        self.isRunning.value = False
+    def stop(self):
+        self.abort()
+        self.requests.put(('shutdown',))
+        self.process.join()  # make sure to have one process at exit
+        if self.process.exitcode != 0:  # died without saying goodbye
+            self.responses.put(('exit',))
+        if self.responseThread is not None:
+            self.responseThread.join()
+
+    def response_thread(self):
+        while True:
+            response = self.responses.get()
+            if response[0] == 'exit':
+                break
+            (response, requestId, error, line) = response
+            if error is not None and self.errorCallback is not None:
+                self.errorCallback(error, line)
+            with self.tempdirLock:
+                tempdir = self.tempdirs.pop(requestId, None)
+            if tempdir is not None:
+                shutil.rmtree(tempdir)
 
     def run(self):
         import preview  # must be imported in new process to work properly
         self.preview = preview
 
-        self.isStarted.value = True
-
-        # waiting for a bind event
-        while not self.bindEvent.wait(timeout=0.1):
-            if self.shutdownEvent.is_set():  # in case someone shuts down when we are not bound
-                self.isStarted.value = False
-
-        # bind the socket here
-        (previewUri, statusUri) = self.inqueue.get()
-        (previewUri, statusUri) = self.preview.bind(previewUri, statusUri)
-        self.outqueue.put((previewUri, statusUri))
-        self.isBound.value = True
-        self.bindCompletedEvent.set()
+        while True:
+            if not self.pending:
+                self.pending.append(self.requests.get())
+            self.fetch_requests()
+            request = self.pending.popleft()
+            if request[0] == 'shutdown':
+                break
+            elif request[0] == 'bind':
+                (previewUri, statusUri) = self.preview.bind(request[1], request[2])
+                self.responses.put(('bound', previewUri, statusUri))
+                if self.debug:
+                    print('Preview socket bound')
+            elif request[0] == 'preview':
+                requestId = request[1]
+                if not self.is_cancelled(requestId, request[2]):
+                    (error, line) = self.do_preview(*request[1:])
+                else:  # superseded or aborted while queued
+                    (error, line) = (None, None)
+                self.responses.put(('done', requestId, error, line))
+
+        self.responses.put(('exit',))
         if self.debug:
-            print('Preview socket bound')
+            print('Preview process exited')
 
-        # wait for preview request or shutdown
-        # event handshaking is used to synchronize the monitoring thread
-        # and the process
-        while not self.shutdownEvent.is_set():
-            if self.previewEvent.wait(timeout=0.1):
-                self.do_preview()
-                self.previewCompleteEvent.set()
-                self.previewEvent.clear()
+    def fetch_requests(self):
+        # take in the queued requests without waiting
+        try:
+            while True:
+                self.pending.append(self.requests.get_nowait())
+        except Queue.Empty:
+            pass
 
-        if self.debug:
-            print('Preview process exited')
-        self.isStarted.value = False
+    def is_cancelled(self, requestId, filename):
+        if self.abortedId.value >= requestId:
+            return True
+        return any(request[0] == 'preview' and request[2] == filename
+                   for request in self.pending)
 
-    def do_preview(self):
-        # get all stuff that is modified at runtime
-        (filename, unitcode, initcode, canonData) = self.inqueue.get()
-        # make abort possible
+    def do_preview(self, requestId, filename, unitcode, initcode, canonData, totalLines):
+        # make abort possible, also by a newer request of the same file
         canon = PreviewCanon(canonData, self.debug)
-        self.aborted.value = False
-        canon.check_abort = lambda : self.aborted.value
+
+        def check_abort():
+            self.fetch_requests()
+            return self.is_cancelled(requestId, filename)
+        canon.check_abort = check_abort
+        # publish partial batches and progress while interpreting
+        self.preview.stream_config(self.batchSize,
+                                   int(self.flushInterval * 1000),
+                                   totalLines)
         if self.debug:
             print("Preview starting")
             print("Filename: " + filename)
             print("Unitcode: " + unitcode)
             print("Initcode: " + initcode)
+        error = None
+        line = None
         try:
             # here we do all the actual work...
             (result, last_sequence_number) = self.preview.parse(
@@ -350,23 +373,23 @@ class Preview():
             # check if we encountered a error during execution
             if result > self.preview.MIN_ERROR:
                 error = " gcode error: %s " % (self.preview.strerror(result))
-                line = last_sequence_number - 1
+                line = str(last_sequence_number - 1)
                 if self.debug:
                     printError("preview: " + filename)
-                    printError(error + " on line " + str(line))
-                # pass error through queue
-                self.outqueue.put((error, str(line)))
-                self.errorEvent.set()
+                    printError(error + " on line " + line)
 
+        except KeyboardInterrupt:
+            if self.debug:
+                print("Preview aborted")
         except Exception as e:
             error = "preview error: " + str(e)
+            line = "0"
             if self.debug:
                 printError(error)
-            self.outqueue.put((error, "0"))
-            self.errorEvent.set()
 
         if self.debug:
             print("Preview exiting")
+        return (error, line)
 
 
 class StatusValues():
@@ -386,6 +409,87 @@ class StatusValues():
         self.interp.Clear()
 
 
+class StatusDelta():
+    """Change detection for a fixed group of status fields.
+
+    The fields are flattened into one list of numbers, positions taking
+    nine slots.  Every poll takes a snapshot of the source object and
+    compares it against the last published values in a single pass, with
+    a per slot threshold (0 for exact values).  Only the changed slots are
+    written to the status and the incremental update message."""
+
+    POSITION_AXES = ['x', 'y', 'z', 'a', 'b', 'c', 'u', 'v', 'w']
+    THRESHOLD = 0.0001
+
+    def __init__(self, values=(), floats=(), positions=()):
+        # each field is either the proto name or (proto name, source name)
+        self.fields = []
+        self.slots = []
+        self.thresholds = []
+        for names, threshold, isPosition in [(values, 0, False),
+                                             (floats, self.THRESHOLD, False),
+                                             (positions, self.THRESHOLD, True)]:
+            for name in names:
+                if isinstance(name, tuple):
+                    name, source = name
+                else:
+                    source = name
+                self.fields.append((source, isPosition))
+                if isPosition:
+                    for axis in self.POSITION_AXES:
+                        self.slots.append((name, axis))
+                        self.thresholds.append(threshold)
+                else:
+                    self.slots.append((name, None))
+                    self.thresholds.append(threshold)
+        self.values = None
+
+    def load(self, obj):
+        values = []
+        for name, axis in self.slots:
+            value = getattr(obj, name)
+            if axis is not None:
+                value = getattr(value, axis)
+            values.append(value)
+        self.values = values
+
+    def snapshot(self, get):
+        values = []
+        append = values.append
+        extend = values.extend
+        for source, isPosition in self.fields:
+            if isPosition:
+                extend(get(source)[:9])
+            else:
+                append(get(source))
+        return values
+
+    def update(self, obj, txObj, get):
+        """Take a snapshot with get(source name) and apply the changes"""
+        new = self.snapshot(get)
+        old = self.values
+        if new == old:
+            return False
+
+        changed = [i for i, (a, b, threshold) in enumerate(zip(old, new, self.thresholds))
+                   if a != b and abs(a - b) > threshold]
+        if not changed:
+            return False
+
+        slots = self.slots
+        for i in changed:
+            value = new[i]
+            old[i] = value
+            name, axis = slots[i]
+            if axis is None:
+                setattr(obj, name, value)
+                setattr(txObj, name, value)
+            else:
+                setattr(getattr(obj, name), axis, value)
+                setattr(getattr(txObj, name), axis, value)
+        return True
+
+
 class LinuxCNCWrapper():
 
     def __init__(self, context, host='', loopback=False,
@@ -410,9 +514,12 @@ class LinuxCNCWrapper():
         self.motionSubscribed = False
         self.motionFullUpdate = False
         self.motionFirstrun = True
+        self.motionDelta = None
+        self.motionAxisDelta = []
         self.ioSubscribed = False
         self.ioFullUpdate = False
         self.ioFirstrun = True
+        self.ioDelta = None
         self.ioToolTableCount = 0
         self.ioToolTableLoaded = False
         self.taskSubscribed = False
@@ -421,6 +528,8 @@ class LinuxCNCWrapper():
         self.configSubscribed = False
         self.configFullUpdate = False
         self.configFirstrun = True
+        self.configDelta = None
+        self.configAxisDelta = []
         self.interpSubscribed = False
         self.interpFullUpdate = False
         self.interpFirstrun = True
@@ -446,6 +555,16 @@ class LinuxCNCWrapper():
             self.directory = self.ini.find('DISPLAY', 'PROGRAM_PREFIX') or os.getcwd()
             self.directory = os.path.abspath(os.path.expanduser(self.directory))
             self.pollInterval = float(pollInterval or self.ini.find('DISPLAY', 'CYCLE_TIME') or 0.1)
+            # minimum time between two updates of a status topic, changes
+            # in between are coalesced into a single incremental update
+            self.topicIntervals = {}
+            self.topicNextUpdate = {}
+            for topic, default in [('motion', 0.0), ('task', 0.0), ('io', 0.0),
+                                   ('interp', 0.0), ('config', 1.0)]:
+                interval = self.ini.find('DISPLAY', topic.upper() + '_UPDATE_INTERVAL')
+                interval = float(interval or default)
+                self.topicIntervals[topic] = max(interval, self.pollInterval)
+                self.topicNextUpdate[topic] = 0.0
             self.interpParameterFile = self.ini.find('RS274NGC', 'PARAMETER_FILE') or "linuxcnc.var"
             self.interpParameterFile = os.path.abspath(os.path.expanduser(self.interpParameterFile))
             self.interpInitcode = self.ini.find("EMC", "RS274NGC_STARTUP_CODE") or ""
@@ -453,6 +572,9 @@ class LinuxCNCWrapper():
                 self.interpInitcode = self.ini.find("RS274NGC", "RS274NGC_STARTUP_CODE") or ""
             self.interpInitcode = self.ini.find("RS274NGC", "RS274NGC_STARTUP_CODE") or ""
             self.randomToolChanger = self.ini.find("EMCIO", "RANDOM_TOOL_CHANGER") or 0
+            self.previewBatchSize = int(self.ini.find('DISPLAY', 'PREVIEW_BATCH_SIZE')
+                                        or os.environ.get('BATCH', 100))
+            self.previewFlushInterval = float(self.ini.find('DISPLAY', 'PREVIEW_FLUSH_INTERVAL') or 0.0)
 
             # setup program extensions
             extensions = self.ini.findall("FILTER", "PROGRAM_EXTENSION")
@@ -491,12 +613,6 @@ class LinuxCNCWrapper():
             printError(str(detail))
             sys.exit(1)
 
-        if self.pingInterval > 0:
-            self.pingRatio = math.floor(self.pingInterval / self.pollInterval)
-        else:
-            self.pingRatio = -1
-        self.pingCount = 0
-
         self.rx = Container()          # Used by the command socket
         self.txStatus = Container()    # Status socket - PUB-SUB
         self.txCommand = Container()   # Command socket - ROUTER-DEALER
@@ -525,6 +641,8 @@ class LinuxCNCWrapper():
                                randomToolchanger=self.randomToolChanger,
                                parameterFile=self.interpParameterFile,
                                initcode=self.interpInitcode,
+                               batchSize=self.previewBatchSize,
+                               flushInterval=self.previewFlushInterval,
                                debug=self.debug)
         (self.previewDsname, self.previewstatusDsname) = \
             self.preview.bind(self.baseUri + ':*', self.baseUri + ':*')
@@ -582,43 +700,47 @@ class LinuxCNCWrapper():
         poll.register(self.commandSocket, zmq.POLLIN)
     
         next_poll = time.time() + self.pollInterval
+        next_ping = time.time() + self.pingInterval
         polldelay = (self.pollInterval) * 1000 # convert to ms
         while not self.shutdown.is_set():
             s = dict(poll.poll(polldelay))
             if self.statusSocket in s and s[self.statusSocket] == zmq.POLLIN:
                 self.process_status(self.statusSocket)
+                next_poll = time.time()  # send full updates right away
             if self.errorSocket in s and s[self.errorSocket] == zmq.POLLIN:
                 self.process_error(self.errorSocket)
             if self.commandSocket in s and s[self.commandSocket] == zmq.POLLIN:
                 self.process_command(self.commandSocket)
-            
-            polldelay = (next_poll - time.time()) * 1000 # convert to ms
+                next_poll = time.time()  # publish the reaction to the command
+
+            now = time.time()
+            polldelay = (next_poll - now) * 1000 # convert to ms
             if (polldelay > 0):
                 continue
 
-            next_poll = time.time() + self.pollInterval
+            next_poll = now + self.pollInterval
             polldelay = (self.pollInterval) * 1000 # convert to ms
 
+            ping = (self.pingInterval > 0) and (now >= next_ping)
+            if ping:
+                next_ping = now + self.pingInterval
+
             try:
                 if (self.statusServiceSubscribed):
-                    self.stat.poll()
-                    self.update_status(self.stat)
-                    if (self.pingCount == self.pingRatio):
+                    if self.status_topics_due(now):
+                        self.stat.poll()
+                        self.update_status(self.stat, now)
+                    if ping:
                         self.ping_status()
                 if (self.errorServiceSubscribed):
                     error = self.error.poll()
                     self.update_error(error)
-                    if (self.pingCount == self.pingRatio):
+                    if ping:
                         self.ping_error()
             except linuxcnc.error as detail:
                 printError(str(detail))
                 self.stop()
 
-            if (self.pingCount == self.pingRatio):
-                self.pingCount = 0
-            else:
-                self.pingCount += 1
-
         self.unpublish()
         self.running = False
         return
@@ -745,33 +867,10 @@ class LinuxCNCWrapper():
         modified = False
         txPosition = Position()
 
-        if self.notEqual(oldPosition.x, newPosition[0]):
-            txPosition.x = newPosition[0]
-            modified = True
-        if self.notEqual(oldPosition.y, newPosition[1]):
-            txPosition.y = newPosition[1]
-            modified = True
-        if self.notEqual(oldPosition.z, newPosition[2]):
-            txPosition.z = newPosition[2]
-            modified = True
-        if self.notEqual(oldPosition.a, newPosition[3]):
-            txPosition.a = newPosition[3]
-            modified = True
-        if self.notEqual(oldPosition.b, newPosition[4]):
-            txPosition.b = newPosition[4]
-            modified = True
-        if self.notEqual(oldPosition.c, newPosition[5]):
-            txPosition.c = newPosition[5]
-            modified = True
-        if self.notEqual(oldPosition.u, newPosition[6]):
-            txPosition.u = newPosition[6]
-            modified = True
-        if self.notEqual(oldPosition.v, newPosition[7]):
-            txPosition.v = newPosition[7]
-            modified = True
-        if self.notEqual(oldPosition.w, newPosition[8]):
-            txPosition.w = newPosition[8]
-            modified = True
+        for i, axis in enumerate(StatusDelta.POSITION_AXES):
+            if self.notEqual(getattr(oldPosition, axis), newPosition[i]):
+                setattr(txPosition, axis, newPosition[i])
+                modified = True
 
         if modified:
             return True, txPosition
@@ -826,24 +925,12 @@ class LinuxCNCWrapper():
     def update_config_value(self, prop, value):
         return self.update_proto_value(self.status.config, self.statusTx.config, prop, value)
 
-    def update_config_float(self, prop, value):
-        return self.update_proto_float(self.status.config, self.statusTx.config, prop, value)
-
-    def update_io_value(self, prop, value):
-        return self.update_proto_value(self.status.io, self.statusTx.io, prop, value)
-
     def update_task_value(self, prop, value):
         return self.update_proto_value(self.status.task, self.statusTx.task, prop, value)
 
     def update_interp_value(self, prop, value):
         return self.update_proto_value(self.status.interp, self.statusTx.interp, prop, value)
 
-    def update_motion_value(self, prop, value):
-        return self.update_proto_value(self.status.motion, self.statusTx.motion, prop, value)
-
-    def update_motion_float(self, prop, value):
-        return self.update_proto_float(self.status.motion, self.statusTx.motion, prop, value)
-
     def update_config(self, stat):
         modified = False
 
@@ -882,6 +969,12 @@ class LinuxCNCWrapper():
             self.status.config.remote_path = ""
             self.status.config.time_units = TIME_UNITS_MINUTE
             self.status.config.name = ""
+            self.configDelta = StatusDelta(
+                values=['axis_mask', 'debug', 'kinematics_type', 'axes'],
+                floats=['cycle_time',
+                        ('default_acceleration', 'acceleration'),
+                        ('default_velocity', 'velocity')])
+            self.configDelta.load(self.status.config)
             self.configFirstrun = False
 
             extensions = self.ini.findall("FILTER", "PROGRAM_EXTENSION")
@@ -1010,14 +1103,8 @@ class LinuxCNCWrapper():
             name = str(self.ini.find('EMC', 'MACHINE') or '')
             modified |= self.update_config_value('name', name)
 
-        for name in ['axis_mask', 'debug', 'kinematics_type', 'axes']:
-            modified |= self.update_config_value(name, getattr(stat, name))
-
-        for name in ['cycle_time']:
-            modified |= self.update_config_float(name, getattr(stat, name))
-
-        modified |= self.update_config_float('default_acceleration', stat.acceleration)
-        modified |= self.update_config_float('default_velocity', stat.velocity)
+        modified |= self.configDelta.update(self.status.config, self.statusTx.config,
+                                            functools.partial(getattr, stat))
 
         txAxis = EmcStatusConfigAxis()
         for index, statAxis in enumerate(stat.axis):
@@ -1042,6 +1129,13 @@ class LinuxCNCWrapper():
                 self.status.config.axis[index].increments = ""
 
                 axis = self.status.config.axis[index]
+                delta = StatusDelta(values=[('axis_type', 'axisType')],
+                                    floats=['backlash', 'max_ferror',
+                                            'max_position_limit', 'min_ferror',
+                                            'min_position_limit'])
+                delta.load(axis)
+                self.configAxisDelta.append(delta)
+
                 axisName = 'AXIS_%i' % index
                 value = int(self.ini.find(axisName, 'HOME_SEQUENCE') or -1)
                 axisModified |= self.update_proto_value(axis, txAxis,
@@ -1060,11 +1154,8 @@ class LinuxCNCWrapper():
                                                         'increments', value)
 
             axis = self.status.config.axis[index]
-            axisModified |= self.update_proto_value(axis, txAxis, 'axis_type', statAxis['axisType'])
-
-            for name in ['backlash', 'max_ferror', 'max_position_limit',
-                         'min_ferror', 'min_position_limit']:
-                axisModified |= self.update_proto_float(axis, txAxis, name, statAxis[name])
+            axisModified |= self.configAxisDelta[index].update(axis, txAxis,
+                                                               statAxis.__getitem__)
 
             if axisModified:
                 txAxis.index = index
@@ -1092,14 +1183,15 @@ class LinuxCNCWrapper():
             self.status.io.pocket_prepped = 0
             self.status.io.tool_in_spindle = 0
             self.status.io.tool_offset.MergeFrom(self.zero_position())
+            self.ioDelta = StatusDelta(
+                values=['estop', 'flood', 'lube', 'lube_level', 'mist',
+                        'pocket_prepped', 'tool_in_spindle'],
+                positions=['tool_offset'])
+            self.ioDelta.load(self.status.io)
             self.ioFirstrun = False
 
-        for name in ['estop', 'flood', 'lube', 'lube_level', 'mist',
-                     'pocket_prepped', 'tool_in_spindle']:
-            modified |= self.update_io_value(name, getattr(stat, name))
-
-        modified |= self.update_proto_position(self.status.io, self.statusTx.io,
-                                               'tool_offset', stat.tool_offset)
+        modified |= self.ioDelta.update(self.status.io, self.statusTx.io,
+                                        functools.partial(getattr, stat))
 
         txToolResult = EmcToolData()
         toolTableChanged = False
@@ -1303,29 +1395,26 @@ class LinuxCNCWrapper():
             self.status.motion.state = UNINITIALIZED_STATUS
             self.status.motion.max_velocity = 0.0
             self.status.motion.max_acceleration = 0.0
+            self.motionDelta = StatusDelta(
+                values=['active_queue', 'adaptive_feed_enabled', 'block_delete',
+                        'current_line', 'enabled', 'feed_hold_enabled',
+                        'feed_override_enabled', 'g5x_index', 'id', 'inpos',
+                        'motion_line', 'motion_type', 'motion_mode', 'paused',
+                        'probe_tripped', 'probe_val', 'probing', 'queue',
+                        'queue_full', 'spindle_brake', 'spindle_direction',
+                        'spindle_enabled', 'spindle_increasing',
+                        'spindle_override_enabled', 'state'],
+                floats=['current_vel', 'delay_left', 'distance_to_go',
+                        'feedrate', 'rapidrate', 'rotation_xy', 'spindle_speed',
+                        'spindlerate', 'max_acceleration', 'max_velocity'],
+                positions=['actual_position', 'dtg', 'g5x_offset', 'g92_offset',
+                           'joint_actual_position', 'joint_position', 'position',
+                           'probed_position'])
+            self.motionDelta.load(self.status.motion)
             self.motionFirstrun = False
 
-        for name in ['active_queue', 'adaptive_feed_enabled', 'block_delete',
-                     'current_line', 'enabled', 'feed_hold_enabled',
-                     'feed_override_enabled', 'g5x_index', 'id', 'inpos',
-                     'motion_line', 'motion_type', 'motion_mode', 'paused',
-                     'probe_tripped', 'probe_val', 'probing', 'queue',
-                     'queue_full', 'spindle_brake', 'spindle_direction',
-                     'spindle_enabled', 'spindle_increasing',
-                     'spindle_override_enabled', 'state']:
-            modified |= self.update_motion_value(name, getattr(stat, name))
-
-        for name in ['current_vel', 'delay_left', 'distance_to_go',
-                     'feedrate',  'rapidrate', 'rotation_xy', 'spindle_speed',
-                     'spindlerate', 'max_acceleration', 'max_velocity']:
-            modified |= self.update_motion_float(name, getattr(stat, name))
-
-        for name in ['actual_position', 'dtg', 'g5x_offset', 'g92_offset',
-                     'joint_actual_position', 'joint_position', 'position',
-                     'probed_position']:
-            modified |= self.update_proto_position(self.status.motion,
-                                                   self.statusTx.motion,
-                                                   name, getattr(stat, name))
+        modified |= self.motionDelta.update(self.status.motion, self.statusTx.motion,
+                                            functools.partial(getattr, stat))
 
         txObjItem = EmcStatusAnalogIO()
         obj = self.status.motion.ain
@@ -1388,19 +1477,18 @@ class LinuxCNCWrapper():
                 self.status.motion.axis[index].output = 0.0
                 self.status.motion.axis[index].override_limits = False
                 self.status.motion.axis[index].velocity = 0.0
+                delta = StatusDelta(values=['enabled', 'fault', 'homed', 'homing',
+                                            'inpos', 'max_hard_limit', 'max_soft_limit',
+                                            'min_hard_limit', 'min_soft_limit',
+                                            'override_limits'],
+                                    floats=['ferror_current', 'ferror_highmark', 'input',
+                                            'output', 'velocity'])
+                delta.load(self.status.motion.axis[index])
+                self.motionAxisDelta.append(delta)
 
             axis = self.status.motion.axis[index]
-            for name in ['enabled', 'fault', 'homed', 'homing',
-                         'inpos', 'max_hard_limit', 'max_soft_limit',
-                         'min_hard_limit', 'min_soft_limit',
-                         'override_limits']:
-                axisModified |= self.update_proto_value(axis, txAxis,
-                                                        name, statAxis[name])
-
-            for name in ['ferror_current', 'ferror_highmark', 'input',
-                         'output', 'velocity']:
-                axisModified |= self.update_proto_float(axis, txAxis,
-                                                        name, statAxis[name])
+            axisModified |= self.motionAxisDelta[index].update(axis, txAxis,
+                                                               statAxis.__getitem__)
 
             if axisModified:
                 txAxis.index = index
@@ -1415,17 +1503,39 @@ class LinuxCNCWrapper():
         elif modified:
             self.send_motion(self.statusTx.motion, MT_EMCSTAT_INCREMENTAL_UPDATE)
 
-    def update_status(self, stat):
+    def topic_due(self, topic, fullUpdate, now):
+        return fullUpdate or (now >= self.topicNextUpdate[topic])
+
+    def status_topics_due(self, now):
+        return (self.ioSubscribed and self.topic_due('io', self.ioFullUpdate, now)) \
+            or (self.taskSubscribed and self.topic_due('task', self.taskFullUpdate, now)) \
+            or (self.interpSubscribed and self.topic_due('interp', self.interpFullUpdate, now)) \
+            or (self.motionSubscribed and self.topic_due('motion', self.motionFullUpdate, now)) \
+            or (self.configSubscribed and self.topic_due('config', self.configFullUpdate, now))
+
+    def schedule_topic(self, topic, now):
+        # allow half a poll cycle of jitter, otherwise a topic updating
+        # at the poll rate would skip every other cycle
+        self.topicNextUpdate[topic] = now + self.topicIntervals[topic] - 0.5 * self.pollInterval
+
+    def update_status(self, stat, now=None):
+        if now is None:
+            now = time.time()
         self.statusTx.clear()
-        if (self.ioSubscribed):
+        if (self.ioSubscribed and self.topic_due('io', self.ioFullUpdate, now)):
+            self.schedule_topic('io', now)
             self.update_io(stat)
-        if (self.taskSubscribed):
+        if (self.taskSubscribed and self.topic_due('task', self.taskFullUpdate, now)):
+            self.schedule_topic('task', now)
             self.update_task(stat)
-        if (self.interpSubscribed):
+        if (self.interpSubscribed and self.topic_due('interp', self.interpFullUpdate, now)):
+            self.schedule_topic('interp', now)
             self.update_interp(stat)
-        if (self.motionSubscribed):
+        if (self.motionSubscribed and self.topic_due('motion', self.motionFullUpdate, now)):
+            self.schedule_topic('motion', now)
             self.update_motion(stat)
-        if (self.configSubscribed):
+        if (self.configSubscribed and self.topic_due('config', self.configFullUpdate, now)):
+            self.schedule_topic('config', now)
             self.update_config(stat)
 
     def update_error(self, error):
@@ -1892,7 +2002,7 @@ class LinuxCNCWrapper():
                         elif self.rx.interp_name == 'preview':
                             if self.rx.HasField('ticket'):
                                 self.send_command_executed(identity, self.rx.ticket)
-                            self.preview.program_open(fileName)
+                            self.preview.program_open(fileName, self.totalLines)
                             if self.rx.HasField('ticket'):
                                 self.send_command_completed(identity, self.rx.ticket)
                 else:
@@ -0,0 +1,46 @@
+#!/bin/sh
+realtime start
+python2 <<'EOF2'
+import hal
+from hal_glib import GPin
+h = hal.component("x")
+try:
+    pf = GPin(h.newpin("f", hal.HAL_FLOAT, hal.HAL_OUT))
+    ps = GPin(h.newpin("s", hal.HAL_S32, hal.HAL_OUT))
+    pu = GPin(h.newpin("u", hal.HAL_U32, hal.HAL_OUT))
+    pb = GPin(h.newpin("b", hal.HAL_BIT, hal.HAL_OUT))
+    h.ready()
+    GPin.update_stop()
+
+    def changed(p):
+        print "changed", p.get_name(), p.get()
+    for p in pf, ps, pu, pb:
+        p.connect('value-changed', changed)
+
+    def tick(label):
+        print "tick", label
+        GPin.WATCHES['normal'].update()
+
+    tick("initial")
+    tick("idle")
+    pf.set(1.5)
+    pb.set(True)
+    tick("f b")
+    ps.set(-0x80000000)
+    pu.set(0xffffffffl)
+    tick("s u")
+    pu.set(0xfffffffel)
+    tick("u")
+    pf.set(float('nan'))
+    tick("f nan")
+    tick("idle")
+    pf.set(0.0)
+    tick("f")
+except:
+    import traceback
+    print "Exception:", traceback.format_exc()
+    raise
+finally:
+    h.exit()
+EOF2
+realtime stop
@@ -0,0 +1,31 @@
+#!/bin/sh
+python2 <<'EOF2'
+import imp, os
+import numpy
+i2g = imp.load_source("image_to_gcode",
+    os.path.join(os.environ["EMC2_HOME"], "bin", "image-to-gcode"))
+
+def reference(image, kernel):
+    kh, kw = kernel.shape
+    return numpy.array([[(image[y:y+kh, x:x+kw] - kernel).max()
+            for x in range(image.shape[1] - kw + 1)]
+        for y in range(image.shape[0] - kh + 1)], numpy.float32)
+
+rng = numpy.random.RandomState(0)
+image = (rng.rand(61, 47) * -0.25).astype(numpy.float32)
+for name, tool in (("ball", i2g.ball_tool), ("endmill", i2g.endmill),
+        ("vee45", i2g.vee_common(45))):
+    kernel = i2g.make_tool_shape(tool, 1/16., .006)
+    field = i2g.dilate(image, kernel)
+    print name, field.shape, numpy.array_equal(field, reference(image, kernel))
+
+kernel = i2g.make_tool_shape(i2g.ball_tool, 1/16., .006)
+bands = set()
+field = i2g.dilate(image, kernel, processes=2, min_work=0,
+    progress=lambda i, n: bands.add(n))
+print "pool", field.shape, numpy.array_equal(field, reference(image, kernel)), \
+    bands.pop() > 1
+
+print "small", i2g.dilate(image[:5], kernel).shape, \
+    i2g.dilate(image[:, :5], kernel).shape
+EOF2